@@ -17,8 +17,8 @@ if config.config_file_name is not None:
 # add your model's MetaData object here
 # for 'autogenerate' support
 from app.models.stock_model import (
+    Company,
     Competitor,
-    MarketCap,
     PerformanceData,
     Stock,
     StockValues,
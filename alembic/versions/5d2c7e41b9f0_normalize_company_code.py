@@ -0,0 +1,42 @@
+"""normalize company code
+
+Stock codes are stored upper case so lookups can be equality matches served by the
+unique index on company_code, instead of ilike filters scanning the whole table.
+
+Revision ID: 5d2c7e41b9f0
+Revises: a00f0a8eb262
+Create Date: 2026-10-17 10:12:31.402117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5d2c7e41b9f0"
+down_revision: Union[str, None] = "a00f0a8eb262"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # fails on the unique constraint if the same code was stored with different cases,
+    # those rows need to be merged by hand before upgrading
+    op.execute(
+        "UPDATE stock_table SET company_code = upper(trim(company_code)) "
+        "WHERE company_code <> upper(trim(company_code))"
+    )
+    op.create_check_constraint(
+        "ck_stock_table_company_code_upper",
+        "stock_table",
+        sa.text("company_code = upper(company_code)"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint(
+        "ck_stock_table_company_code_upper", "stock_table", type_="check"
+    )
@@ -0,0 +1,37 @@
+"""add stock fetched_at
+
+Tracks when the polygon and marketwatch data of a stock was last retrieved, so the
+refresh scheduler can find stale stocks with an index scan.
+
+Revision ID: 8b3f1d6a2c47
+Revises: 5d2c7e41b9f0
+Create Date: 2026-10-17 14:03:52.118604
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8b3f1d6a2c47"
+down_revision: Union[str, None] = "5d2c7e41b9f0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # existing stocks are left null, they are the first ones refreshed
+    op.add_column(
+        "stock_table", sa.Column("fetched_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.create_index(
+        op.f("ix_stock_table_fetched_at"), "stock_table", ["fetched_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_stock_table_fetched_at"), table_name="stock_table")
+    op.drop_column("stock_table", "fetched_at")
@@ -0,0 +1,62 @@
+"""keep competitor market caps
+
+The market cap of a competitor moves from the shared company row back to the link of each
+stock listing it, so writing a stock no longer changes the data of the others (whose version,
+ETag and cached responses would not follow). Existing links take their company market cap.
+
+Revision ID: b6e2f9c4d815
+Revises: f3b8d5e1a970
+Create Date: 2026-10-17 23:05:48.913624
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b6e2f9c4d815"
+down_revision: Union[str, None] = "f3b8d5e1a970"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "competitor_table",
+        sa.Column("market_cap_currency", sa.String(length=15), nullable=True),
+    )
+    op.add_column(
+        "competitor_table", sa.Column("market_cap_value", sa.Float(), nullable=True)
+    )
+    op.execute(
+        "UPDATE competitor_table SET "
+        "market_cap_currency = (SELECT company_table.market_cap_currency FROM company_table "
+        "WHERE company_table.id = competitor_table.company_id), "
+        "market_cap_value = (SELECT company_table.market_cap_value FROM company_table "
+        "WHERE company_table.id = competitor_table.company_id)"
+    )
+    op.drop_column("company_table", "market_cap_value")
+    op.drop_column("company_table", "market_cap_currency")
+
+
+def downgrade() -> None:
+    op.add_column(
+        "company_table",
+        sa.Column("market_cap_currency", sa.String(length=15), nullable=True),
+    )
+    op.add_column("company_table", sa.Column("market_cap_value", sa.Float(), nullable=True))
+    # each company keeps the market cap of its latest link
+    op.execute(
+        "UPDATE company_table SET "
+        "market_cap_currency = (SELECT competitor_table.market_cap_currency "
+        "FROM competitor_table WHERE competitor_table.id = ("
+        "SELECT max(id) FROM competitor_table WHERE company_id = company_table.id)), "
+        "market_cap_value = (SELECT competitor_table.market_cap_value "
+        "FROM competitor_table WHERE competitor_table.id = ("
+        "SELECT max(id) FROM competitor_table WHERE company_id = company_table.id))"
+    )
+    op.drop_column("competitor_table", "market_cap_value")
+    op.drop_column("competitor_table", "market_cap_currency")
@@ -0,0 +1,48 @@
+"""add stock history
+
+Daily OHLC bars of every stock, keyed by (stock_id, date) so the primary key index
+serves the range queries of the history route.
+
+Revision ID: c41e9a7d5f28
+Revises: 8b3f1d6a2c47
+Create Date: 2026-10-17 16:27:09.553810
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c41e9a7d5f28"
+down_revision: Union[str, None] = "8b3f1d6a2c47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stock_history_table",
+        sa.Column("stock_id", sa.Integer(), nullable=False),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("open", sa.Float(precision=24), nullable=True),
+        sa.Column("high", sa.Float(precision=24), nullable=True),
+        sa.Column("low", sa.Float(precision=24), nullable=True),
+        sa.Column("close", sa.Float(precision=24), nullable=True),
+        sa.Column("volume", sa.BigInteger(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["stock_id"],
+            ["stock_table.id"],
+        ),
+        sa.PrimaryKeyConstraint("stock_id", "date"),
+    )
+    op.add_column("stock_table", sa.Column("history_from", sa.Date(), nullable=True))
+    op.add_column("stock_table", sa.Column("history_to", sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("stock_table", "history_to")
+    op.drop_column("stock_table", "history_from")
+    op.drop_table("stock_history_table")
@@ -0,0 +1,38 @@
+"""add stock version
+
+Counts the writes changing the "Get" route data of a stock, the ETag of its response, so
+conditional requests are answered reading this column only.
+
+Revision ID: e7a4c2b9d13f
+Revises: c41e9a7d5f28
+Create Date: 2026-10-17 18:42:16.307251
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e7a4c2b9d13f"
+down_revision: Union[str, None] = "c41e9a7d5f28"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "stock_table",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+    # existing stocks are left null, they have no Last-Modified until they are written again
+    op.add_column(
+        "stock_table", sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("stock_table", "updated_at")
+    op.drop_column("stock_table", "version")
@@ -0,0 +1,132 @@
+"""share competitor companies
+
+Competitors become links from a stock to a company stored once by name, instead of a
+competitor and a market cap row per stock listing it. Existing rows are deduplicated: each
+company keeps the market cap of its latest competitor row, and a company listed twice for
+the same stock keeps its first position.
+
+Revision ID: f3b8d5e1a970
+Revises: e7a4c2b9d13f
+Create Date: 2026-10-17 20:11:37.582044
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f3b8d5e1a970"
+down_revision: Union[str, None] = "e7a4c2b9d13f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "company_table",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("name", sa.String(length=150), nullable=False),
+        sa.Column("market_cap_currency", sa.String(length=15), nullable=True),
+        sa.Column("market_cap_value", sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+    op.execute(
+        "INSERT INTO company_table (name, market_cap_currency, market_cap_value) "
+        "SELECT competitor_table.name, market_cap_table.currency, market_cap_table.value "
+        "FROM competitor_table JOIN market_cap_table "
+        "ON market_cap_table.id = competitor_table.market_cap_id "
+        "WHERE competitor_table.id IN ("
+        "SELECT max(id) FROM competitor_table WHERE name IS NOT NULL GROUP BY name)"
+    )
+
+    op.add_column("competitor_table", sa.Column("company_id", sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE competitor_table SET company_id = ("
+        "SELECT company_table.id FROM company_table "
+        "WHERE company_table.name = competitor_table.name)"
+    )
+    # unnamed competitors have no company and are dropped
+    op.execute(
+        "DELETE FROM competitor_table WHERE company_id IS NULL OR id NOT IN ("
+        "SELECT min(id) FROM competitor_table GROUP BY stock_id, company_id)"
+    )
+    op.alter_column("competitor_table", "company_id", nullable=False)
+    op.create_foreign_key(
+        None, "competitor_table", "company_table", ["company_id"], ["id"]
+    )
+    op.create_index(
+        op.f("ix_competitor_table_company_id"),
+        "competitor_table",
+        ["company_id"],
+        unique=False,
+    )
+    # the unique constraint index leads with stock_id and replaces its own index
+    op.create_unique_constraint(
+        "uq_competitor_table_stock_company", "competitor_table", ["stock_id", "company_id"]
+    )
+    op.drop_index(op.f("ix_competitor_table_stock_id"), table_name="competitor_table")
+
+    op.drop_index(op.f("ix_competitor_table_market_cap_id"), table_name="competitor_table")
+    op.drop_column("competitor_table", "market_cap_id")
+    op.drop_column("competitor_table", "name")
+    op.drop_table("market_cap_table")
+
+
+def downgrade() -> None:
+    # competitor_id temporarily matches each new market cap with its competitor row
+    op.create_table(
+        "market_cap_table",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("currency", sa.String(length=15), nullable=True),
+        sa.Column("value", sa.Float(), nullable=True),
+        sa.Column("competitor_id", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute(
+        "INSERT INTO market_cap_table (currency, value, competitor_id) "
+        "SELECT company_table.market_cap_currency, company_table.market_cap_value, "
+        "competitor_table.id "
+        "FROM competitor_table JOIN company_table "
+        "ON company_table.id = competitor_table.company_id"
+    )
+    op.add_column(
+        "competitor_table", sa.Column("name", sa.String(length=150), nullable=True)
+    )
+    op.add_column(
+        "competitor_table", sa.Column("market_cap_id", sa.Integer(), nullable=True)
+    )
+    op.execute(
+        "UPDATE competitor_table SET "
+        "name = (SELECT company_table.name FROM company_table "
+        "WHERE company_table.id = competitor_table.company_id), "
+        "market_cap_id = (SELECT market_cap_table.id FROM market_cap_table "
+        "WHERE market_cap_table.competitor_id = competitor_table.id)"
+    )
+    op.drop_column("market_cap_table", "competitor_id")
+    op.alter_column("competitor_table", "market_cap_id", nullable=False)
+    op.create_foreign_key(
+        None, "competitor_table", "market_cap_table", ["market_cap_id"], ["id"]
+    )
+    op.create_index(
+        op.f("ix_competitor_table_market_cap_id"),
+        "competitor_table",
+        ["market_cap_id"],
+        unique=False,
+    )
+
+    op.create_index(
+        op.f("ix_competitor_table_stock_id"),
+        "competitor_table",
+        ["stock_id"],
+        unique=False,
+    )
+    op.drop_constraint(
+        "uq_competitor_table_stock_company", "competitor_table", type_="unique"
+    )
+    op.drop_index(op.f("ix_competitor_table_company_id"), table_name="competitor_table")
+    op.drop_column("competitor_table", "company_id")
+    op.drop_table("company_table")
@@ -0,0 +1,375 @@
+import asyncio
+import time
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from app.controllers.market_watch_controller import MarketWatchController
+from app.controllers.stock_controller import (
+    ADVISORY_LOCK_POLL_INTERVAL,
+    StockController,
+    add_stock_amounts,
+    claim_revalidation,
+    default_freshness,
+    new_stock_flight,
+    normalize_company_code,
+    not_found_cache,
+    polygon_open_close_days,
+    release_revalidation,
+    remember_non_trading_days,
+    scrap_cache,
+    stock_hits,
+    stock_response_cache,
+)
+from app.schemas.stock_schema import (
+    MarketWatchData,
+    PolygonStockData,
+    StockModelResponseSchema,
+    StockVersionSchema,
+)
+from shared.exceptions import NotFound, ScrapeUnavailable
+from shared.browser_pool import browser_pool
+from shared.database import async_lock_engine
+from shared.freshness import FreshnessPolicy
+from shared.metrics import observe_stage
+from shared.polygon_client import PolygonError, open_close_ttl, polygon_client
+from shared import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# background re-fetches of stale stocks, referenced until they finish so they aren't garbage collected
+revalidation_tasks = set()
+
+
+class AsyncStockController(StockController):
+    def __init__(self, company_code: str, db: AsyncSession):
+        """initializes the AsyncStockController class, asyncio version of StockController
+
+        Args:
+            company_code (str): company stock code. E.g.: "aapl" or "AAPL"
+            db (AsyncSession): sqlalchemy orm AsyncSession
+        """
+        self.company_code = company_code
+        self.normalized_code = normalize_company_code(company_code)
+        self.db = db
+        # how the last stock returned by get_stock_by_company_code was served: HIT, STALE or MISS
+        self.cache_status = "MISS"
+
+    async def get_stock_by_company_code(
+        self, freshness: FreshnessPolicy | None = None
+    ) -> StockModelResponseSchema | None:
+        """Tries to get stock info from the response cache or the data base, if it doesn't exist yet,
+        retrieves data from polygon api and marketwatch website. Stored data is served following
+        the freshness policy: stale data is re-fetched in background, too old data before answering
+
+        Args:
+            freshness (FreshnessPolicy | None, optional): freshness policy. Defaults to default_freshness.
+
+        Returns:
+            StockModelResponseSchema: "Get" route stock model populated
+        """
+        stock_hits.hit(self.normalized_code)
+        stock_response = stock_response_cache.get(self.normalized_code)
+        if stock_response is None:
+            with observe_stage("db_lookup"):
+                stock = (
+                    (await self.db.scalars(self.select_stock_aggregate()))
+                    .unique()
+                    .one_or_none()
+                )
+            if stock is not None:
+                stock_response = self.format_db_stock_response(stock)
+            await self.end_read_transaction()
+
+            if stock is None:
+                stock_response = await new_stock_flight.do_async(
+                    self.normalized_code, self.get_and_insert_new_stock
+                )
+                stock_response_cache.set(self.normalized_code, stock_response)
+                self.cache_status = "MISS"
+                return stock_response
+            stock_response_cache.set(self.normalized_code, stock_response)
+
+        self.cache_status = (freshness or default_freshness).cache_status(
+            stock_response.fetched_at
+        )
+        if self.cache_status == "STALE":
+            self.revalidate_in_background()
+        elif self.cache_status == "MISS":
+            try:
+                stock_response = await new_stock_flight.do_async(
+                    self.normalized_code, self.refresh_stock
+                )
+            except Exception as error:
+                # stale data is better than no data
+                logger.error(f"could not refresh {self.normalized_code}, serving stale data: {error}")
+                self.cache_status = "STALE"
+            else:
+                stock_response_cache.set(self.normalized_code, stock_response)
+        return stock_response
+
+    async def get_unmodified_version(
+        self, if_none_match: str, freshness: FreshnessPolicy | None = None
+    ) -> StockVersionSchema | None:
+        """Checks a conditional "Get" request against the version of the stock, read from the
+        response cache or from the version columns alone, without loading the stock aggregate
+
+        Args:
+            if_none_match (str): request If-None-Match header. E.g.: '"3"'
+            freshness (FreshnessPolicy | None, optional): freshness policy. Defaults to default_freshness.
+
+        Returns:
+            StockVersionSchema | None: version of the stock if the client copy is current and can
+                be served, None if the whole stock has to be returned
+        """
+        stock_version = self.get_cached_version()
+        if stock_version is None:
+            with observe_stage("db_version_lookup"):
+                stock = (await self.db.execute(self.select_stock_version())).one_or_none()
+            await self.end_read_transaction()
+            if stock is None:
+                return None
+            stock_version = StockVersionSchema(**stock._mapping)
+        return self.check_unmodified_version(if_none_match, stock_version, freshness)
+
+    async def end_read_transaction(self) -> None:
+        """Ends the transaction of the reads done so far, so its connection goes back to the pool
+        instead of being held while polygon and marketwatch are requested. Loaded rows are expired
+        """
+        await self.db.rollback()
+
+    def revalidate_in_background(self) -> None:
+        """Schedules a refresh of the stock on the running event loop, unless one is already running"""
+        if claim_revalidation(self.normalized_code):
+            task = asyncio.create_task(self.revalidate(self.db.bind))
+            revalidation_tasks.add(task)
+            task.add_done_callback(revalidation_tasks.discard)
+
+    async def revalidate(self, bind: AsyncEngine) -> None:
+        """Refreshes the stock with its own session, errors are only logged
+
+        Args:
+            bind (AsyncEngine): sqlalchemy async engine of the data base
+        """
+        try:
+            async with AsyncSession(bind=bind, expire_on_commit=False) as db:
+                await AsyncStockController(self.company_code, db).refresh_stock()
+        except Exception as error:
+            logger.error(f"could not revalidate {self.normalized_code}: {error}")
+        finally:
+            release_revalidation(self.normalized_code)
+
+    async def refresh_stock(self) -> StockModelResponseSchema:
+        """Re-fetches the stock from polygon api and marketwatch website and overwrites its data base data
+
+        Raises:
+            NotFound: If polygon or marketwatch fails
+
+        Returns:
+            StockModelResponseSchema: "Get" route stock model populated
+        """
+        stock_response = await self.get_new_stock()
+        try:
+            with observe_stage("write_refreshed_stock"):
+                refreshed_response = await self.db.run_sync(
+                    self.write_refreshed_stock, stock_response
+                )
+                await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        finally:
+            stock_response_cache.invalidate(self.normalized_code)
+        return refreshed_response or stock_response
+
+    async def get_and_insert_new_stock(self) -> StockModelResponseSchema:
+        """Retrieves a stock missing from the data base and inserts it. Runs once per company code
+        at a time (see new_stock_flight), and with SINGLE_FLIGHT_ADVISORY_LOCK once across workers
+        sharing a Postgres data base: the worker holding the advisory lock of the company code
+        fetches the stock, the others poll the lock and read the stock once inserted. No pooled
+        connection is held while the stock is retrieved, the lock has its own (see async_lock_engine)
+
+        Returns:
+            StockModelResponseSchema: "Get" route stock model populated
+        """
+        if not self.use_advisory_lock():
+            return await self.find_or_insert_new_stock()
+
+        deadline = time.monotonic() + settings.SINGLE_FLIGHT_LOCK_TIMEOUT
+        while True:
+            async with async_lock_engine.connect() as lock_connection:
+                if await lock_connection.scalar(self.select_try_advisory_lock()):
+                    try:
+                        return await self.find_or_insert_new_stock()
+                    finally:
+                        await lock_connection.scalar(self.select_advisory_unlock())
+            await asyncio.sleep(ADVISORY_LOCK_POLL_INTERVAL)
+            stock_response = await self.get_stored_stock()
+            if stock_response is not None:
+                return stock_response
+            if time.monotonic() > deadline:
+                logger.warning(f"{self.normalized_code} lock wait timed out, fetching it too")
+                return await self.find_or_insert_new_stock()
+
+    async def get_stored_stock(self) -> StockModelResponseSchema | None:
+        """Reads the stock from the data base, ending the read transaction
+
+        Returns:
+            StockModelResponseSchema | None: "Get" route stock model populated, None if missing
+        """
+        stock = (
+            (await self.db.scalars(self.select_stock_aggregate())).unique().one_or_none()
+        )
+        stock_response = None if stock is None else self.format_db_stock_response(stock)
+        await self.end_read_transaction()
+        return stock_response
+
+    async def find_or_insert_new_stock(self) -> StockModelResponseSchema:
+        """Retrieves and inserts a stock, unless it was inserted since it was looked for. A stock
+        inserted meanwhile by another worker is kept (see the unique company_code)
+
+        Returns:
+            StockModelResponseSchema: "Get" route stock model populated
+        """
+        stock_response = await self.get_stored_stock()
+        if stock_response is not None:
+            return stock_response
+
+        stock_response = await self.get_new_stock()
+        try:
+            stock_response = await self.insert_new_stock(stock_response)
+        except IntegrityError:
+            logger.warning(
+                f"{self.normalized_code} was inserted by another worker, keeping its data"
+            )
+        return stock_response
+
+    async def update_stock_amount_by_company_code(self, amount: int) -> None:
+        """Updates the stock purchased amount for a given stock present on DB
+
+        Args:
+            amount (int): amount to add (it can be negative, if willing to decrease the purchased amount)
+
+        Raises:
+            PreconditionFailedName: the stock need to exist on the DB, if not, it
+                raises a precondition error and returns 412 status
+            PreconditionFailedAmount: the new stock purchased amount can't be lower
+                than 0, if it is, raises a precondition error and returns returns 412 status
+        """
+        try:
+            await self.db.run_sync(add_stock_amounts, {self.company_code: amount})
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        stock_response_cache.invalidate(self.normalized_code)
+
+    async def get_new_stock(self) -> StockModelResponseSchema:
+        """Retrieves stock info from polygon api and marketwatch website. Both run concurrently,
+        the scrap is cancelled if polygon fails
+
+        Raises:
+            NotFound: If the company code recently wasn't found, without requesting polygon or scraping
+
+        Returns:
+            StockModelResponseSchema: "Get" route stock model populated
+        """
+        if not_found_cache.get(self.normalized_code) is not None:
+            logger.debug(f"{self.normalized_code} was recently not found, skipping lookup")
+            raise NotFound(self.company_code)
+
+        web_data_task = asyncio.create_task(self.get_market_watch())
+        try:
+            polygon_data = await self.get_stock_from_polygon()
+        except BaseException:
+            if not web_data_task.cancel() and not web_data_task.cancelled():
+                # already finished, retrieve its exception so it isn't logged as unhandled
+                web_data_task.exception()
+            raise
+        web_data = await web_data_task
+        return self.format_scrap_stock_response(polygon_data, web_data)
+
+    async def insert_new_stock(
+        self, stock_response: StockModelResponseSchema
+    ) -> StockModelResponseSchema:
+        """Insert new stock into database in a single transaction
+
+        Args:
+            stock_response (StockModelResponseSchema): "Get" route stock model populated
+
+        Returns:
+            StockModelResponseSchema: stock_response with its stored version
+        """
+        try:
+            with observe_stage("insert_new_stock"):
+                await self.db.run_sync(self.write_new_stock, stock_response)
+                await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        finally:
+            stock_response_cache.invalidate(self.normalized_code)
+        return self.format_inserted_stock_response(stock_response)
+
+    async def get_stock_from_polygon(self) -> PolygonStockData:
+        """Gets stock data from polygon api /open-close on day polygon_open_close_date(), or on the
+        trading days before it when polygon has no data for the day (see polygon_open_close_days).
+        Past days are cached until evicted, see polygon_client
+
+        Raises:
+            NotFound: If company can't be found on polygon api, raises NotFound error and return status 404
+            PolygonUnavailable: If polygon keeps failing or rate limiting, returns status 503
+
+        Returns:
+            PolygonStockData: Pydantic schema with polygon api data
+        """
+        days = polygon_open_close_days()
+        for index, day in enumerate(days):
+            try:
+                with observe_stage("polygon"):
+                    data = await polygon_client.get_async(
+                        f"/v1/open-close/{self.normalized_code}/{day}", ttl=open_close_ttl(day)
+                    )
+            except PolygonError as error:
+                if error.status_code == 404 and index < len(days) - 1:
+                    continue
+                self.handle_polygon_error(error)
+            remember_non_trading_days(days[:index], self.normalized_code)
+            return PolygonStockData(**data)
+
+    async def get_market_watch(self) -> MarketWatchData:
+        """Scraps MarketWatch website and gets data on given stock (results are kept on scrap_cache).
+        With MARKET_WATCH_SCRAP_MODE "http" the page is read with a plain http request first,
+        the shared browser pool is only used when that fails
+
+        Raises:
+            NotFound: If the scrap fails, raises NotFound error and return status 404
+            ScrapeUnavailable: If the browser pool is saturated, returns status 503
+
+        Returns:
+            MarketWatchData: pydantic schema with marketwatch website data
+        """
+        web_data = scrap_cache.get(self.normalized_code)
+        if web_data is not None:
+            return web_data
+
+        logger.debug(f"starting crawler for stock {self.company_code}")
+        try:
+            with observe_stage("market_watch"):
+                if settings.MARKET_WATCH_SCRAP_MODE == "browser":
+                    web_data = await browser_pool.run_async(self.scrap_market_watch)
+                else:
+                    web_data = await MarketWatchController(self.company_code).fetch_async(
+                        lambda: browser_pool.run_async(self.scrap_market_watch)
+                    )
+        except NotFound:
+            logger.error(f"{self.company_code} was not found on marketwatch")
+            not_found_cache.set(self.normalized_code, True)
+            raise
+        except ScrapeUnavailable:
+            logger.warning(f"{self.company_code} scrap rejected, the browser pool is saturated")
+            raise
+        except Exception as error:
+            logger.error(error)
+            raise NotFound(self.company_code)
+        scrap_cache.set(self.normalized_code, web_data)
+        return web_data
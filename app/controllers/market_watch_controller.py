@@ -0,0 +1,261 @@
+import asyncio
+import random
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Awaitable, Callable, List
+import lxml.html
+import requests
+from requests.adapters import HTTPAdapter
+from app.schemas.stock_schema import (
+    CompetitorSchema,
+    MarketCapSchema,
+    MarketWatchData,
+    PerformanceDataSchema,
+)
+from shared.browser_pool import USER_AGENTS
+from shared.exceptions import NotFound
+from shared.metrics import observe_stage, scrapes_in_flight
+from shared import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# marketwatch selectors, the same ones the browser scrap reads
+COMPANY_NAME_SELECTOR = ".company__name"
+PERFORMANCE_SELECTOR = ".content__item.value.ignore-color"
+# lxml doesn't add the tbody browsers insert when a table has none
+COMPETITORS_SELECTOR = ".Competitors > table > tbody > tr, .Competitors > table > tr"
+
+# answered by the bot protection instead of the stock page
+BOT_CHALLENGE_STATUS = {401, 403, 429}
+BOT_CHALLENGE_MARKERS = ("captcha-delivery.com", "px-captcha", "cf-challenge")
+
+# keeps the connections to marketwatch open between scraps
+market_watch_session = requests.Session()
+market_watch_session.mount(
+    "https://", HTTPAdapter(pool_maxsize=settings.MARKET_WATCH_HTTP_WORKERS)
+)
+market_watch_session.mount(
+    "http://", HTTPAdapter(pool_maxsize=settings.MARKET_WATCH_HTTP_WORKERS)
+)
+
+# runs the http scraps, requests being blocking
+market_watch_executor = ThreadPoolExecutor(
+    max_workers=settings.MARKET_WATCH_HTTP_WORKERS, thread_name_prefix="market-watch"
+)
+
+
+class MarketWatchUnavailable(Exception):
+    """The page couldn't be read without a browser, the browser scrap should be used instead"""
+
+
+class BotChallenge(MarketWatchUnavailable):
+    """Marketwatch answered with a bot protection challenge"""
+
+
+def market_watch_url(company_code: str) -> str:
+    """Builds the marketwatch page url of a stock
+
+    Args:
+        company_code (str): company stock code. E.g.: "aapl" or "AAPL"
+
+    Returns:
+        str: page url
+    """
+    return f"{settings.MARKET_WATCH_BASE_URL}/investing/stock/{company_code}"
+
+
+def format_market_watch(
+    company_name: str, performance_data: List[str], competitors_rows: List[List[str]]
+) -> MarketWatchData:
+    """Builds the marketwatch data from the texts of the scraped elements
+
+    Args:
+        company_name (str): text of the company name
+        performance_data (List[str]): texts of the performance values, E.g.: ["1.5%", ...]
+        competitors_rows (List[List[str]]): cell texts of each competitors row (name, change, market cap)
+
+    Returns:
+        MarketWatchData: pydantic schema with marketwatch website data
+    """
+    competitors = []
+    for competitorData in competitors_rows:
+        competitors.append(
+            CompetitorSchema(
+                name=competitorData[0],
+                market_cap=MarketCapSchema(
+                    currency=competitorData[2],
+                    value=float(competitorData[1].strip("%")),
+                ),
+            )
+        )
+    return MarketWatchData(
+        company_name=company_name,
+        performance_data=PerformanceDataSchema(
+            five_days=float(performance_data[0].strip("%")),
+            one_month=float(performance_data[1].strip("%")),
+            three_months=float(performance_data[2].strip("%")),
+            year_to_date=float(performance_data[3].strip("%")),
+            one_year=float(performance_data[4].strip("%")),
+        ),
+        competitors=competitors,
+    )
+
+
+def is_bot_challenge(status_code: int, html: str) -> bool:
+    """Tells if marketwatch answered with a bot protection page
+
+    Args:
+        status_code (int): http status code
+        html (str): response body
+
+    Returns:
+        bool: True if it is a challenge
+    """
+    return status_code in BOT_CHALLENGE_STATUS or any(
+        marker in html for marker in BOT_CHALLENGE_MARKERS
+    )
+
+
+def parse_market_watch(html: str) -> MarketWatchData:
+    """Reads the stock data from the html of a marketwatch page
+
+    Args:
+        html (str): marketwatch stock page
+
+    Raises:
+        MarketWatchUnavailable: If an element is missing or can't be read
+
+    Returns:
+        MarketWatchData: pydantic schema with marketwatch website data
+    """
+
+    def text(element: lxml.html.HtmlElement) -> str:
+        # whitespace collapsed like the rendered text the browser scrap reads
+        return " ".join(element.text_content().split())
+
+    document = lxml.html.document_fromstring(html)
+    company_name = document.cssselect(COMPANY_NAME_SELECTOR)
+    if not company_name:
+        raise MarketWatchUnavailable(f"no {COMPANY_NAME_SELECTOR} on the page")
+    performance_data = [text(element) for element in document.cssselect(PERFORMANCE_SELECTOR)]
+    competitors_rows = [
+        [text(cell) for cell in row.xpath("./td|./th")]
+        for row in document.cssselect(COMPETITORS_SELECTOR)
+    ]
+    try:
+        return format_market_watch(text(company_name[0]), performance_data, competitors_rows)
+    except (IndexError, ValueError) as error:
+        raise MarketWatchUnavailable(f"unexpected page content: {error}")
+
+
+class MarketWatchController:
+    def __init__(self, company_code: str):
+        """Reads the marketwatch page of a stock with a plain http request, without a browser
+
+        Args:
+            company_code (str): company stock code. E.g.: "aapl" or "AAPL"
+        """
+        self.company_code = company_code
+
+    def fetch(self) -> MarketWatchData:
+        """Requests the marketwatch page of the stock and parses it
+
+        Raises:
+            NotFound: If marketwatch answers 404 for the company code
+            BotChallenge: If marketwatch answers with a bot protection challenge
+            MarketWatchUnavailable: If the request fails or the page can't be read
+
+        Returns:
+            MarketWatchData: pydantic schema with marketwatch website data
+        """
+        with scrapes_in_flight.labels("http").track_inprogress():
+            try:
+                with observe_stage("market_watch_request"):
+                    response = market_watch_session.get(
+                        market_watch_url(self.company_code),
+                        headers={
+                            "User-Agent": random.choice(USER_AGENTS),
+                            "Accept": "text/html,application/xhtml+xml",
+                            "Accept-Language": "en-US,en;q=0.9",
+                            "Referer": "https://www.google.com.br/",
+                        },
+                        timeout=settings.MARKET_WATCH_HTTP_TIMEOUT,
+                    )
+            except requests.RequestException as error:
+                raise MarketWatchUnavailable(f"request failed: {error}")
+            if is_bot_challenge(response.status_code, response.text):
+                raise BotChallenge(f"bot challenge (status {response.status_code})")
+            if response.status_code == 404:
+                raise NotFound(self.company_code)
+            if response.status_code != 200:
+                raise MarketWatchUnavailable(f"status {response.status_code}")
+            with observe_stage("market_watch_parse"):
+                return parse_market_watch(response.text)
+
+    def submit(self, fallback: Callable[[], Future]) -> Future:
+        """Schedules fetch on market_watch_executor, fallback schedules the browser scrap
+        used instead when the page can't be read without a browser
+
+        Args:
+            fallback (Callable[[], Future]): schedules the browser scrap, E.g.: browser_pool.submit
+
+        Returns:
+            Future: concurrent future with the MarketWatchData, cancelling it cancels the scrap
+        """
+        web_data_future = Future()
+        source_future = market_watch_executor.submit(self.fetch)
+
+        def forward(future: Future) -> None:
+            if future.cancelled():
+                return
+            try:
+                if future.exception() is None:
+                    web_data_future.set_result(future.result())
+                else:
+                    web_data_future.set_exception(future.exception())
+            except InvalidStateError:
+                # web_data_future was cancelled meanwhile
+                pass
+
+        def fetched(future: Future) -> None:
+            nonlocal source_future
+            if future.cancelled() or web_data_future.done():
+                return
+            if not isinstance(future.exception(), MarketWatchUnavailable):
+                forward(future)
+                return
+            logger.info(
+                f"{self.company_code} needs the browser scrap: {future.exception()}"
+            )
+            source_future = fallback()
+            source_future.add_done_callback(forward)
+            if web_data_future.cancelled():
+                source_future.cancel()
+
+        def cancelled(future: Future) -> None:
+            if future.cancelled():
+                source_future.cancel()
+
+        source_future.add_done_callback(fetched)
+        web_data_future.add_done_callback(cancelled)
+        return web_data_future
+
+    async def fetch_async(
+        self, fallback: Callable[[], Awaitable[MarketWatchData]]
+    ) -> MarketWatchData:
+        """Runs fetch on market_watch_executor, awaiting fallback (the browser scrap) instead
+        when the page can't be read without a browser
+
+        Args:
+            fallback (Callable[[], Awaitable[MarketWatchData]]): runs the browser scrap
+
+        Returns:
+            MarketWatchData: pydantic schema with marketwatch website data
+        """
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                market_watch_executor, self.fetch
+            )
+        except MarketWatchUnavailable as error:
+            logger.info(f"{self.company_code} needs the browser scrap: {error}")
+            return await fallback()
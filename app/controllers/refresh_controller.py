@@ -0,0 +1,222 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+from app.controllers.stock_controller import (
+    StockController,
+    claim_revalidation,
+    release_revalidation,
+    scrap_cache,
+    stock_hits,
+)
+from app.models.stock_model import Stock
+from shared.database import SessionLocal
+from shared.polygon_client import polygon_client
+from shared.rate_limit import TokenBucket
+from shared import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshScheduler:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_age: float,
+        poll_interval: float,
+        batch_size: int,
+        workers: int,
+        polygon_rate_limit: TokenBucket | None,
+        market_watch_rate_limit: TokenBucket | None,
+    ):
+        """Background refresh of the stocks whose polygon and marketwatch data is older than
+        max_age. Every poll_interval seconds, up to batch_size stale stocks are re-fetched by
+        a pool of workers, the most requested ones (see stock_hits) first
+
+        Args:
+            session_factory (Callable[[], Session]): builds the sessions used by the workers
+            max_age (float): seconds after which the data of a stock is stale
+            poll_interval (float): seconds between two refresh rounds
+            batch_size (int): maximum number of stocks refreshed per round
+            workers (int): number of stocks refreshed at the same time
+            polygon_rate_limit (TokenBucket | None): bounds the requests sent to polygon, one token
+                per request (a lookup may step back several days). None for no limit
+            market_watch_rate_limit (TokenBucket | None): bounds the scraps of marketwatch.
+                None for no limit
+        """
+        self.session_factory = session_factory
+        self.max_age = max_age
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.workers = workers
+        self.polygon_rate_limit = polygon_rate_limit
+        self.market_watch_rate_limit = market_watch_rate_limit
+        # monotonic time after which a stock that failed to refresh is retried, by company code
+        self._retry_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Starts the refresh thread, does nothing if already started"""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="stock-refresh", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the refresh thread, waiting for the stocks being refreshed"""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def refresh_stale_stocks(self) -> int:
+        """Runs a refresh round
+
+        Returns:
+            int: number of stocks refreshed
+        """
+        company_codes = self.select_stale_company_codes()
+        if company_codes:
+            logger.debug(f"refreshing stale stocks {company_codes}")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            refreshed = sum(executor.map(self.refresh_stock, company_codes))
+        # hits are halved every round, so the ranking follows recent requests
+        stock_hits.decay()
+        return refreshed
+
+    def select_stale_company_codes(self) -> List[str]:
+        """Selects up to batch_size stale stocks, the most requested ones first, then the
+        ones not refreshed for the longest time
+
+        Returns:
+            List[str]: normalized company codes
+        """
+        stale = or_(
+            Stock.fetched_at.is_(None),
+            Stock.fetched_at < datetime.now(timezone.utc) - timedelta(seconds=self.max_age),
+        )
+        failed_codes = self.failed_company_codes()
+        hot_codes = [
+            code
+            for code in stock_hits.most_common(settings.STOCK_REFRESH_HOT_SYMBOLS)
+            if code not in failed_codes
+        ]
+        with self.session_factory() as db:
+            company_codes = []
+            if hot_codes:
+                stale_hot_codes = set(
+                    db.scalars(
+                        select(Stock.company_code).where(
+                            Stock.company_code.in_(hot_codes), stale
+                        )
+                    )
+                )
+                company_codes = [code for code in hot_codes if code in stale_hot_codes][
+                    : self.batch_size
+                ]
+            if len(company_codes) < self.batch_size:
+                company_codes += db.scalars(
+                    select(Stock.company_code)
+                    .where(stale, Stock.company_code.not_in(company_codes + failed_codes))
+                    .order_by(Stock.fetched_at.asc().nulls_first())
+                    .limit(self.batch_size - len(company_codes))
+                ).all()
+        return company_codes
+
+    def refresh_stock(self, company_code: str) -> bool:
+        """Re-fetches a stock from polygon and marketwatch and overwrites its data base data.
+        Waits for the marketwatch rate limit first, each polygon request waits for its own token
+
+        Args:
+            company_code (str): normalized company stock code
+
+        Returns:
+            bool: True if the stock was refreshed
+        """
+        if scrap_cache.get(company_code) is None and not self.wait_rate_limit(
+            self.market_watch_rate_limit
+        ):
+            return False
+
+        # skipped if a "Get" request is already re-fetching it
+        if not claim_revalidation(company_code):
+            return False
+        try:
+            with self.session_factory() as db, polygon_client.limited_by(
+                self.polygon_rate_limit
+            ):
+                StockController(company_code, db).refresh_stock()
+        except Exception as error:
+            logger.error(f"could not refresh {company_code}: {error}")
+            with self._lock:
+                self._retry_at[company_code] = time.monotonic() + self.max_age
+            return False
+        finally:
+            release_revalidation(company_code)
+        return True
+
+    def failed_company_codes(self) -> List[str]:
+        """Returns the stocks that failed to refresh, they are retried after max_age seconds
+
+        Returns:
+            List[str]: normalized company codes
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._retry_at = {
+                code: retry_at for code, retry_at in self._retry_at.items() if retry_at > now
+            }
+            return list(self._retry_at)
+
+    def wait_rate_limit(self, rate_limit: TokenBucket | None) -> bool:
+        """Waits for a token of rate_limit, giving up if the scheduler is stopped
+
+        Args:
+            rate_limit (TokenBucket | None): source rate limit, None for no limit
+
+        Returns:
+            bool: True if a token was taken
+        """
+        if rate_limit is None:
+            return True
+        while not self._stopped.is_set():
+            if rate_limit.acquire(timeout=1):
+                return True
+        return False
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.refresh_stale_stocks()
+            except Exception as error:
+                logger.error(f"stock refresh round failed: {error}")
+            self._stopped.wait(self.poll_interval)
+
+
+stock_refresh_scheduler = RefreshScheduler(
+    SessionLocal,
+    max_age=settings.STOCK_REFRESH_MAX_AGE,
+    poll_interval=settings.STOCK_REFRESH_POLL_INTERVAL,
+    batch_size=settings.STOCK_REFRESH_BATCH_SIZE,
+    workers=settings.STOCK_REFRESH_WORKERS,
+    polygon_rate_limit=(
+        TokenBucket(rate=settings.POLYGON_REFRESH_RATE_PER_MINUTE / 60, capacity=1)
+        if settings.POLYGON_REFRESH_RATE_PER_MINUTE > 0
+        else None
+    ),
+    market_watch_rate_limit=(
+        TokenBucket(rate=settings.MARKET_WATCH_REFRESH_RATE_PER_MINUTE / 60, capacity=1)
+        if settings.MARKET_WATCH_REFRESH_RATE_PER_MINUTE > 0
+        else None
+    ),
+)
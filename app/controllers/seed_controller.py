@@ -0,0 +1,278 @@
+import asyncio
+import os
+import time
+from typing import Callable, Iterable, List, Set
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.controllers.async_stock_controller import AsyncStockController
+from app.controllers.stock_controller import StockController, normalize_company_code
+from app.models.stock_model import Stock
+from app.schemas.stock_schema import StockModelResponseSchema
+from shared.exceptions import NotFound
+from shared.rate_limit import TokenBucket
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SeedProgress:
+    def __init__(self):
+        """Counters of a seeding run"""
+        self.started_at = time.monotonic()
+        self.read = 0
+        self.seeded = 0
+        self.skipped = 0
+        self.not_found = 0
+        self.failed = 0
+
+    def format(self) -> str:
+        """Formats the counters and the throughput of the symbols fetched so far
+
+        Returns:
+            str: progress line
+        """
+        elapsed = time.monotonic() - self.started_at
+        fetched = self.seeded + self.not_found + self.failed
+        return (
+            f"read {self.read}, seeded {self.seeded}, skipped {self.skipped}, "
+            f"not found {self.not_found}, failed {self.failed} | "
+            f"{fetched / elapsed if elapsed else 0:.2f} symbols/s, {elapsed:.0f}s elapsed"
+        )
+
+
+class StockSeeder:
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        concurrency: int,
+        batch_size: int,
+        checkpoint_path: str | None = None,
+        rate_limit: TokenBucket | None = None,
+        report: Callable[[SeedProgress], None] | None = None,
+        report_interval: float = 5,
+    ):
+        """Inserts many stocks without the web server. Symbols are streamed from the input,
+        the ones already on the data base or on the checkpoint are skipped, the others are
+        fetched from polygon and marketwatch concurrently and written batch_size at a time,
+        each batch in a single transaction
+
+        Args:
+            session_factory (Callable[[], AsyncSession]): builds the sessions used to read and write stocks
+            concurrency (int): number of stocks fetched at the same time
+            batch_size (int): number of stocks written per transaction
+            checkpoint_path (str | None, optional): file where the symbols done are appended, a new run
+                skips them. Defaults to None (no checkpoint).
+            rate_limit (TokenBucket | None, optional): bounds the stocks fetched. Defaults to None.
+            report (Callable[[SeedProgress], None] | None, optional): called every report_interval
+                seconds and at the end. Defaults to None.
+            report_interval (float, optional): seconds between two reports. Defaults to 5.
+        """
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.rate_limit = rate_limit
+        self.report = report
+        self.report_interval = report_interval
+        self.progress = SeedProgress()
+
+    async def seed(self, company_codes: Iterable[str]) -> SeedProgress:
+        """Seeds the data base with the given symbols. Symbols not found are written on the
+        checkpoint, other failures are retried by the next run
+
+        Args:
+            company_codes (Iterable[str]): company stock codes, read lazily. E.g.: a file object
+
+        Returns:
+            SeedProgress: counters of the run
+        """
+        self.progress = SeedProgress()
+        codes = asyncio.Queue(maxsize=self.concurrency * 2)
+        results = asyncio.Queue(maxsize=self.batch_size)
+        tasks = [
+            asyncio.create_task(self.read_codes(company_codes, codes)),
+            asyncio.create_task(self.write_stocks(results)),
+        ]
+        tasks += [
+            asyncio.create_task(self.fetch_stocks(codes, results))
+            for _ in range(self.concurrency)
+        ]
+        reporter = asyncio.create_task(self.report_progress())
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # stops the other tasks when one fails
+            for task in tasks + [reporter]:
+                task.cancel()
+        if self.report is not None:
+            self.report(self.progress)
+        return self.progress
+
+    async def read_codes(self, company_codes: Iterable[str], codes: asyncio.Queue) -> None:
+        """Queues the symbols to fetch, batch_size at a time so the ones already on the data
+        base are found with a single query per batch
+
+        Args:
+            company_codes (Iterable[str]): company stock codes, blank and "#" lines are ignored
+            codes (asyncio.Queue): normalized company codes to fetch, then one None per fetch task
+        """
+        done = self.read_checkpoint()
+        seen = set()
+        chunk = []
+        for line in company_codes:
+            for company_code in line.split("#", 1)[0].replace(",", " ").split():
+                company_code = normalize_company_code(company_code)
+                if company_code in seen:
+                    continue
+                seen.add(company_code)
+                self.progress.read += 1
+                if company_code in done:
+                    self.progress.skipped += 1
+                    continue
+                chunk.append(company_code)
+                if len(chunk) >= self.batch_size:
+                    await self.queue_missing_codes(chunk, codes)
+                    chunk = []
+        await self.queue_missing_codes(chunk, codes)
+        for _ in range(self.concurrency):
+            await codes.put(None)
+
+    async def queue_missing_codes(self, chunk: List[str], codes: asyncio.Queue) -> None:
+        """Queues the symbols of chunk that aren't on the data base yet
+
+        Args:
+            chunk (List[str]): normalized company codes
+            codes (asyncio.Queue): normalized company codes to fetch
+        """
+        if not chunk:
+            return
+        async with self.session_factory() as db:
+            known_codes = set(
+                await db.scalars(select(Stock.company_code).where(Stock.company_code.in_(chunk)))
+            )
+        self.progress.skipped += len(known_codes)
+        for company_code in chunk:
+            if company_code not in known_codes:
+                await codes.put(company_code)
+
+    async def fetch_stocks(self, codes: asyncio.Queue, results: asyncio.Queue) -> None:
+        """Fetches the queued symbols from polygon and marketwatch until it gets None
+
+        Args:
+            codes (asyncio.Queue): normalized company codes to fetch
+            results (asyncio.Queue): code, stock (or None) and error (or None) of each fetch,
+                then None once done
+        """
+        while (company_code := await codes.get()) is not None:
+            if self.rate_limit is not None:
+                while wait := self.rate_limit.try_acquire():
+                    await asyncio.sleep(wait)
+            try:
+                stock_response = await AsyncStockController(company_code, None).get_new_stock()
+            except Exception as error:
+                await results.put((company_code, None, error))
+            else:
+                await results.put((company_code, stock_response, None))
+        await results.put(None)
+
+    async def write_stocks(self, results: asyncio.Queue) -> None:
+        """Writes the fetched stocks batch_size at a time until every fetch task is done
+
+        Args:
+            results (asyncio.Queue): results of fetch_stocks
+        """
+        batch: List[StockModelResponseSchema] = []
+        not_found: List[str] = []
+        running = self.concurrency
+        while running:
+            result = await results.get()
+            if result is None:
+                running -= 1
+                continue
+            company_code, stock_response, error = result
+            if isinstance(error, NotFound):
+                self.progress.not_found += 1
+                not_found.append(company_code)
+            elif error is not None:
+                logger.error(f"could not fetch {company_code}: {error}")
+                self.progress.failed += 1
+            else:
+                batch.append(stock_response)
+            if len(batch) >= self.batch_size:
+                await self.write_batch(batch, not_found)
+                batch, not_found = [], []
+        await self.write_batch(batch, not_found)
+
+    async def write_batch(
+        self, batch: List[StockModelResponseSchema], not_found: List[str]
+    ) -> None:
+        """Inserts a batch of stocks in a single transaction, then adds them to the checkpoint.
+        If a stock was inserted meanwhile (e.g. by the api) the stocks are inserted one by one
+
+        Args:
+            batch (List[StockModelResponseSchema]): stocks to insert
+            not_found (List[str]): normalized company codes not found, only added to the checkpoint
+        """
+        if batch:
+            async with self.session_factory() as db:
+                try:
+                    await db.run_sync(self.write_new_stocks, batch)
+                    await db.commit()
+                    self.progress.seeded += len(batch)
+                except IntegrityError:
+                    await db.rollback()
+                    for stock_response in batch:
+                        try:
+                            await db.run_sync(self.write_new_stocks, [stock_response])
+                            await db.commit()
+                            self.progress.seeded += 1
+                        except IntegrityError:
+                            await db.rollback()
+                            self.progress.skipped += 1
+        self.write_checkpoint(
+            [normalize_company_code(stock.company_code) for stock in batch] + not_found
+        )
+
+    def write_new_stocks(self, db: Session, batch: List[StockModelResponseSchema]) -> None:
+        """Writes the stocks of a batch without committing
+
+        Args:
+            db (Session): sqlalchemy orm Session holding the transaction
+            batch (List[StockModelResponseSchema]): stocks to insert
+        """
+        for stock_response in batch:
+            StockController(stock_response.company_code, db).write_new_stock(db, stock_response)
+
+    def read_checkpoint(self) -> Set[str]:
+        """Reads the symbols done by previous runs
+
+        Returns:
+            Set[str]: normalized company codes
+        """
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return set()
+        with open(self.checkpoint_path) as checkpoint:
+            return {line.strip() for line in checkpoint if line.strip()}
+
+    def write_checkpoint(self, company_codes: List[str]) -> None:
+        """Appends symbols done to the checkpoint, synced to disk so a crash doesn't lose them
+
+        Args:
+            company_codes (List[str]): normalized company codes
+        """
+        if self.checkpoint_path is None or not company_codes:
+            return
+        with open(self.checkpoint_path, "a") as checkpoint:
+            checkpoint.writelines(f"{company_code}\n" for company_code in company_codes)
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+
+    async def report_progress(self) -> None:
+        """Reports the progress every report_interval seconds"""
+        if self.report is None:
+            return
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.report(self.progress)
@@ -0,0 +1,396 @@
+import asyncio
+import math
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Sequence, Tuple
+import numpy as np
+from sqlalchemy import Row, Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.controllers.stock_batch_controller import format_stock_error
+from app.controllers.stock_controller import (
+    normalize_company_code,
+    polygon_open_close_date,
+)
+from app.controllers.stock_history_controller import (
+    AsyncStockHistoryController,
+    StockHistoryController,
+)
+from app.models.stock_model import StockHistory
+from app.schemas.stock_schema import (
+    PerformanceAnalyticsSchema,
+    StockAnalyticsBatchSchema,
+    StockAnalyticsSchema,
+)
+from shared.exceptions import InvalidWindows, TooManySymbols
+from shared import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS_PER_YEAR = 252
+
+# calendar days between the last close and the close the performance figures are compared to
+PERFORMANCE_CALENDAR_DAYS = {"one_month": 30, "three_months": 91, "one_year": 365}
+# trading days of the five days performance
+PERFORMANCE_TRADING_DAYS = 5
+
+# segments are sorted by (segment, day) using segment * DAY_KEY_SPAN + day as a single key
+DAY_KEY_SPAN = 1_000_000
+
+
+def compute_analytics(
+    segments: np.ndarray,
+    days: np.ndarray,
+    closes: np.ndarray,
+    segment_count: int,
+    windows: Sequence[int],
+) -> Dict[str, np.ndarray]:
+    """Computes the indicators of several stocks at once over their daily closes. The closes of every
+    stock are contiguous (sorted by segment then day), so each indicator is a few array operations
+    whatever the number of stocks. Missing values (not enough history) are NaN
+
+    Args:
+        segments (np.ndarray): int64 stock index of each close, sorted
+        days (np.ndarray): int64 day of each close (days since 1970-01-01), sorted within a stock
+        closes (np.ndarray): float64 closes
+        segment_count (int): number of stocks
+        windows (Sequence[int]): trading days windows of the returns, moving averages and volatility
+
+    Returns:
+        Dict[str, np.ndarray]: arrays of segment_count values by indicator name: "date", "close",
+            the PerformanceData fields, and "returns_{window}", "moving_average_{window}", "volatility_{window}"
+    """
+    segment_ids = np.arange(segment_count)
+    starts = np.searchsorted(segments, segment_ids, side="left")
+    ends = np.searchsorted(segments, segment_ids, side="right")
+    has_data = ends > starts
+    last = np.where(has_data, ends - 1, 0)
+    last_close = np.where(has_data, closes[last] if len(closes) else np.nan, np.nan)
+    last_day = np.where(has_data, days[last] if len(days) else 0, 0)
+
+    def close_at(index: np.ndarray) -> np.ndarray:
+        valid = has_data & (index >= starts)
+        return np.where(valid, closes[np.clip(index, 0, None)] if len(closes) else np.nan, np.nan)
+
+    def close_on_or_before(target_days: np.ndarray) -> np.ndarray:
+        keys = segments * DAY_KEY_SPAN + days
+        index = np.searchsorted(keys, segment_ids * DAY_KEY_SPAN + target_days, side="right") - 1
+        return close_at(index)
+
+    def percent_change(reference: np.ndarray) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (last_close / reference - 1) * 100
+
+    first_days_of_year = (
+        last_day.astype("datetime64[D]")
+        .astype("datetime64[Y]")
+        .astype("datetime64[D]")
+        .astype(np.int64)
+    )
+    analytics = {
+        "date": np.where(has_data, last_day, -1),
+        "close": last_close,
+        "five_days": percent_change(close_at(last - PERFORMANCE_TRADING_DAYS)),
+        "year_to_date": percent_change(close_on_or_before(first_days_of_year - 1)),
+    }
+    for name, calendar_days in PERFORMANCE_CALENDAR_DAYS.items():
+        analytics[name] = percent_change(close_on_or_before(last_day - calendar_days))
+
+    closes_sum = np.concatenate([[0.0], np.cumsum(closes)])
+    # log returns, the first close of each stock has none
+    log_returns = np.zeros(len(closes))
+    if len(closes) > 1:
+        log_returns[1:] = np.diff(np.log(closes))
+    log_returns[starts[has_data]] = 0.0
+    returns_sum = np.concatenate([[0.0], np.cumsum(log_returns)])
+    returns_squares_sum = np.concatenate([[0.0], np.cumsum(log_returns**2)])
+    for window in windows:
+        analytics[f"returns_{window}"] = percent_change(close_at(last - window))
+
+        window_start = ends - window
+        has_window = has_data & (window_start >= starts)
+        window_start = np.clip(window_start, 0, None)
+        analytics[f"moving_average_{window}"] = np.where(
+            has_window, (closes_sum[ends] - closes_sum[window_start]) / window, np.nan
+        )
+
+        # window log returns need the close before the window
+        has_returns = has_data & (window > 1) & (window_start > starts)
+        total = returns_sum[ends] - returns_sum[window_start]
+        squares = returns_squares_sum[ends] - returns_squares_sum[window_start]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variance = np.maximum((squares - total**2 / window) / (window - 1), 0)
+        analytics[f"volatility_{window}"] = np.where(
+            has_returns, np.sqrt(variance * TRADING_DAYS_PER_YEAR) * 100, np.nan
+        )
+    return analytics
+
+
+class StockAnalyticsController:
+    def __init__(
+        self,
+        company_codes: List[str],
+        windows: List[int],
+        session_factory: Callable[[], Session],
+    ):
+        """initializes the StockAnalyticsController class
+
+        Args:
+            company_codes (List[str]): company stock codes. E.g.: ["aapl", "MSFT"]
+            windows (List[int]): trading days windows of the returns, moving averages and volatility. E.g.: [5, 20]
+            session_factory (Callable[[], Session]): builds the sessions used to ingest and read history
+
+        Raises:
+            TooManySymbols: If more than BATCH_MAX_SYMBOLS codes are requested, returns status 422
+            InvalidWindows: If more than ANALYTICS_MAX_WINDOWS windows or a window larger than
+                ANALYTICS_MAX_WINDOW are requested, returns status 422
+        """
+        self.normalized_codes = list(
+            dict.fromkeys(
+                normalize_company_code(company_code)
+                for company_code in company_codes
+                if company_code.strip()
+            )
+        )
+        if len(self.normalized_codes) > settings.BATCH_MAX_SYMBOLS:
+            raise TooManySymbols(settings.BATCH_MAX_SYMBOLS)
+        # first requested spelling of each code, used on error messages
+        self.requested_codes = {}
+        for company_code in company_codes:
+            self.requested_codes.setdefault(normalize_company_code(company_code), company_code)
+        if (
+            len(windows) > settings.ANALYTICS_MAX_WINDOWS
+            or max(windows, default=0) > settings.ANALYTICS_MAX_WINDOW
+        ):
+            raise InvalidWindows(settings.ANALYTICS_MAX_WINDOW, settings.ANALYTICS_MAX_WINDOWS)
+        self.windows = sorted({window for window in windows if window > 0})
+        self.session_factory = session_factory
+
+    def get_analytics(
+        self,
+    ) -> Tuple[Dict[str, StockAnalyticsSchema], Dict[str, Exception]]:
+        """Computes the indicators of every requested stock, ingesting the missing history first
+
+        Returns:
+            Tuple[Dict[str, StockAnalyticsSchema], Dict[str, Exception]]: indicators and errors by code
+        """
+        date_from, date_to = self.get_range()
+        stock_ids, errors = {}, {}
+        for company_code in self.normalized_codes:
+            stock_history_controller = StockHistoryController(
+                self.requested_codes[company_code], self.session_factory
+            )
+            try:
+                stock_history_controller.ingest_missing_history(date_from, date_to)
+            except Exception as error:
+                errors[company_code] = error
+                continue
+            stock_ids[company_code] = stock_history_controller.stock_id
+
+        with self.session_factory() as db:
+            rows = db.execute(self.select_history(stock_ids, date_from, date_to)).all()
+        return self.format_analytics(stock_ids, rows), errors
+
+    def get_analytics_batch(self) -> StockAnalyticsBatchSchema:
+        """Computes the indicators of every requested stock, a stock that can't be retrieved
+        is listed on errors instead of failing the whole batch
+
+        Returns:
+            StockAnalyticsBatchSchema: indicators and errors by normalized company code
+        """
+        return self.format_batch_response(*self.get_analytics())
+
+    def get_range(self) -> Tuple[date, date]:
+        """Returns the days read to compute the indicators: one year and a week (one_year needs
+        the close of a year ago) or the largest window, whichever is longer
+
+        Returns:
+            Tuple[date, date]: first and last day
+        """
+        date_to = date.fromisoformat(polygon_open_close_date())
+        window_days = math.ceil(max(self.windows, default=0) * 7 / 5) + 14
+        return date_to - timedelta(days=max(372, window_days)), date_to
+
+    def select_history(
+        self, stock_ids: Dict[str, int], date_from: date, date_to: date
+    ) -> Select:
+        """Builds the query reading the closes of every stock, sorted by stock and day
+
+        Args:
+            stock_ids (Dict[str, int]): stock id by normalized company code
+            date_from (date): first day
+            date_to (date): last day
+
+        Returns:
+            Select: sqlalchemy select statement for StockHistory
+        """
+        return (
+            select(StockHistory.stock_id, StockHistory.date, StockHistory.close)
+            .where(
+                StockHistory.stock_id.in_(list(stock_ids.values())),
+                StockHistory.date >= date_from,
+                StockHistory.date <= date_to,
+            )
+            .order_by(StockHistory.stock_id, StockHistory.date)
+        )
+
+    def format_analytics(
+        self, stock_ids: Dict[str, int], rows: List[Row]
+    ) -> Dict[str, StockAnalyticsSchema]:
+        """Builds contiguous arrays from the history rows and formats the computed indicators
+
+        Args:
+            stock_ids (Dict[str, int]): stock id by normalized company code
+            rows (List[Row]): stock_id, date and close, sorted by stock and day
+
+        Returns:
+            Dict[str, StockAnalyticsSchema]: indicators by normalized company code
+        """
+        company_codes = list(stock_ids)
+        segment_by_stock_id = {
+            stock_id: segment for segment, stock_id in enumerate(stock_ids.values())
+        }
+        stock_column, date_column, close_column = zip(*rows) if rows else ((), (), ())
+        # rows are sorted by stock id, reordered by segment keeping the days order of each stock
+        segments = np.fromiter(
+            (segment_by_stock_id[stock_id] for stock_id in stock_column),
+            dtype=np.int64,
+            count=len(rows),
+        )
+        order = np.argsort(segments, kind="stable")
+        analytics = compute_analytics(
+            segments[order],
+            np.array(date_column, dtype="datetime64[D]").astype(np.int64)[order],
+            np.array(close_column, dtype=np.float64)[order],
+            len(company_codes),
+            self.windows,
+        )
+
+        def value(name: str, segment: int) -> float | None:
+            curr_value = float(analytics[name][segment])
+            return None if math.isnan(curr_value) else round(curr_value, 4)
+
+        return {
+            company_code: StockAnalyticsSchema(
+                company_code=company_code,
+                date=(
+                    None
+                    if analytics["date"][segment] < 0
+                    else np.datetime64(int(analytics["date"][segment]), "D").item()
+                ),
+                close=value("close", segment),
+                performance_data=PerformanceAnalyticsSchema(
+                    **{
+                        name: value(name, segment)
+                        for name in PerformanceAnalyticsSchema.model_fields
+                    }
+                ),
+                returns={
+                    str(window): value(f"returns_{window}", segment)
+                    for window in self.windows
+                },
+                moving_averages={
+                    str(window): value(f"moving_average_{window}", segment)
+                    for window in self.windows
+                },
+                volatility={
+                    str(window): value(f"volatility_{window}", segment)
+                    for window in self.windows
+                },
+            )
+            for segment, company_code in enumerate(company_codes)
+        }
+
+    def format_batch_response(
+        self,
+        analytics: Dict[str, StockAnalyticsSchema],
+        errors: Dict[str, Exception],
+    ) -> StockAnalyticsBatchSchema:
+        """Formats the batch response, keeping the requested order
+
+        Args:
+            analytics (Dict[str, StockAnalyticsSchema]): indicators by normalized company code
+            errors (Dict[str, Exception]): errors by normalized company code
+
+        Returns:
+            StockAnalyticsBatchSchema: indicators and errors by normalized company code
+        """
+        return StockAnalyticsBatchSchema(
+            stocks={
+                company_code: analytics[company_code]
+                for company_code in self.normalized_codes
+                if company_code in analytics
+            },
+            errors={
+                company_code: format_stock_error(company_code, error)
+                for company_code, error in errors.items()
+            },
+        )
+
+
+class AsyncStockAnalyticsController(StockAnalyticsController):
+    def __init__(
+        self,
+        company_codes: List[str],
+        windows: List[int],
+        session_factory: Callable[[], AsyncSession],
+    ):
+        """initializes the AsyncStockAnalyticsController class, asyncio version of StockAnalyticsController
+
+        Args:
+            company_codes (List[str]): company stock codes. E.g.: ["aapl", "MSFT"]
+            windows (List[int]): trading days windows of the returns, moving averages and volatility. E.g.: [5, 20]
+            session_factory (Callable[[], AsyncSession]): builds the sessions used to ingest and read history
+
+        Raises:
+            TooManySymbols: If more than BATCH_MAX_SYMBOLS codes are requested, returns status 422
+            InvalidWindows: If more than ANALYTICS_MAX_WINDOWS windows or a window larger than
+                ANALYTICS_MAX_WINDOW are requested, returns status 422
+        """
+        super().__init__(company_codes, windows, session_factory)
+
+    async def get_analytics(
+        self,
+    ) -> Tuple[Dict[str, StockAnalyticsSchema], Dict[str, Exception]]:
+        """Computes the indicators of every requested stock, ingesting the missing history first
+        (at most BATCH_FETCH_CONCURRENCY stocks at a time)
+
+        Returns:
+            Tuple[Dict[str, StockAnalyticsSchema], Dict[str, Exception]]: indicators and errors by code
+        """
+        date_from, date_to = self.get_range()
+        semaphore = asyncio.Semaphore(settings.BATCH_FETCH_CONCURRENCY)
+
+        async def ingest(company_code: str) -> AsyncStockHistoryController:
+            stock_history_controller = AsyncStockHistoryController(
+                self.requested_codes[company_code], self.session_factory
+            )
+            async with semaphore:
+                await stock_history_controller.ingest_missing_history(date_from, date_to)
+            return stock_history_controller
+
+        results = await asyncio.gather(
+            *[ingest(company_code) for company_code in self.normalized_codes],
+            return_exceptions=True,
+        )
+        stock_ids, errors = {}, {}
+        for company_code, result in zip(self.normalized_codes, results):
+            if isinstance(result, Exception):
+                errors[company_code] = result
+            else:
+                stock_ids[company_code] = result.stock_id
+
+        async with self.session_factory() as db:
+            rows = (
+                await db.execute(self.select_history(stock_ids, date_from, date_to))
+            ).all()
+        return self.format_analytics(stock_ids, rows), errors
+
+    async def get_analytics_batch(self) -> StockAnalyticsBatchSchema:
+        """Computes the indicators of every requested stock, a stock that can't be retrieved
+        is listed on errors instead of failing the whole batch
+
+        Returns:
+            StockAnalyticsBatchSchema: indicators and errors by normalized company code
+        """
+        return self.format_batch_response(*(await self.get_analytics()))
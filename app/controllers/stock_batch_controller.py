@@ -0,0 +1,316 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.controllers.async_stock_controller import AsyncStockController
+from app.controllers.stock_controller import (
+    StockController,
+    add_stock_amounts,
+    normalize_company_code,
+    select_stocks_aggregate,
+    stock_hits,
+    stock_response_cache,
+)
+from app.models.stock_model import Stock
+from app.schemas.stock_schema import StockBatchResponseSchema, StockModelResponseSchema
+from shared.exceptions import NotFound, TooManySymbols
+from shared import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def format_stock_error(company_code: str, error: Exception) -> str:
+    """Formats the error message of a stock that couldn't be retrieved by a batch route
+
+    Args:
+        company_code (str): normalized company stock code
+        error (Exception): error raised while retrieving it
+
+    Returns:
+        str: error message, same as the single stock routes
+    """
+    if isinstance(error, NotFound):
+        return f"{error.name} not found."
+    logger.error(f"could not retrieve {company_code}: {error}")
+    return f"{company_code} could not be retrieved."
+
+
+class StockBatchController:
+    def __init__(
+        self,
+        company_codes: List[str],
+        db: Session,
+        session_factory: Optional[Callable[[], Session]] = None,
+    ):
+        """initializes the StockBatchController class
+
+        Args:
+            company_codes (List[str]): company stock codes. E.g.: ["aapl", "MSFT"]
+            db (Session): sqlalchemy orm Session used to look up the known stocks
+            session_factory (Callable[[], Session], optional): builds the sessions used to fetch
+                the unknown stocks concurrently. Defaults to None (only needed to get stocks).
+
+        Raises:
+            TooManySymbols: If more than BATCH_MAX_SYMBOLS codes are requested, returns status 422
+        """
+        self.normalized_codes = list(
+            dict.fromkeys(
+                normalize_company_code(company_code)
+                for company_code in company_codes
+                if company_code.strip()
+            )
+        )
+        if len(self.normalized_codes) > settings.BATCH_MAX_SYMBOLS:
+            raise TooManySymbols(settings.BATCH_MAX_SYMBOLS)
+        self.db = db
+        self.session_factory = session_factory
+
+    def get_stocks_by_company_codes(self) -> StockBatchResponseSchema:
+        """Gets every requested stock. Known stocks are read with a single query, unknown ones
+        are retrieved concurrently (at most BATCH_FETCH_CONCURRENCY at a time)
+
+        Returns:
+            StockBatchResponseSchema: stocks and errors by normalized company code
+        """
+        stocks, missing_codes = self.get_known_stocks()
+        # each missing stock is retrieved with its own session, this one isn't needed meanwhile
+        self.db.rollback()
+        with ThreadPoolExecutor(
+            max_workers=settings.BATCH_FETCH_CONCURRENCY
+        ) as executor:
+            results = list(executor.map(self.get_new_stock, missing_codes))
+        return self.format_batch_response(stocks, results)
+
+    def update_stock_amounts_by_company_codes(
+        self, amounts: Dict[str, int]
+    ) -> Dict[str, int]:
+        """Updates the purchased amount of several stocks present on DB in a single transaction,
+        if any of them fails nothing is updated
+
+        Args:
+            amounts (Dict[str, int]): amount to add by company stock code. E.g.: {"AAPL": 5, "msft": -1}
+
+        Raises:
+            PreconditionFailedName: every stock need to exist on the DB, returns 412 status
+            PreconditionFailedAmount: no stock purchased amount can become lower than 0, returns 412 status
+
+        Returns:
+            Dict[str, int]: new purchased amount by normalized company code
+        """
+        try:
+            purchased_amounts = add_stock_amounts(self.db, amounts)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        for company_code in self.normalized_codes:
+            stock_response_cache.invalidate(company_code)
+        return purchased_amounts
+
+    def get_known_stocks(
+        self,
+    ) -> Tuple[Dict[str, StockModelResponseSchema], List[str]]:
+        """Gets the requested stocks from the response cache and the data base
+
+        Returns:
+            Tuple[Dict[str, StockModelResponseSchema], List[str]]: stocks found by code, and codes not found
+        """
+        stocks, codes = self.get_cached_stocks()
+        if codes:
+            query = select_stocks_aggregate(Stock.company_code.in_(codes))
+            for stock in self.db.scalars(query).unique():
+                stocks[stock.company_code] = self.cache_db_stock(stock)
+        return stocks, [code for code in codes if code not in stocks]
+
+    def get_cached_stocks(
+        self,
+    ) -> Tuple[Dict[str, StockModelResponseSchema], List[str]]:
+        """Gets the requested stocks from the response cache
+
+        Returns:
+            Tuple[Dict[str, StockModelResponseSchema], List[str]]: stocks found by code, and codes not found
+        """
+        stocks = {}
+        for company_code in self.normalized_codes:
+            stock_hits.hit(company_code)
+            stock_response = stock_response_cache.get(company_code)
+            if stock_response is not None:
+                stocks[company_code] = stock_response
+        return stocks, [code for code in self.normalized_codes if code not in stocks]
+
+    def cache_db_stock(self, stock: Stock) -> StockModelResponseSchema:
+        """Formats a stock read from the data base and keeps it on the response cache
+
+        Args:
+            stock (Stock): sqlalchemy table object for Stock, loaded by select_stocks_aggregate
+
+        Returns:
+            StockModelResponseSchema: "Get" route stock model populated
+        """
+        stock_response = StockController(stock.company_code, self.db).format_db_stock_response(
+            stock
+        )
+        stock_response_cache.set(stock.company_code, stock_response)
+        return stock_response
+
+    def get_new_stock(
+        self, company_code: str
+    ) -> Tuple[str, StockModelResponseSchema | None, str | None]:
+        """Retrieves a stock missing from the data base with its own session
+
+        Args:
+            company_code (str): normalized company stock code
+
+        Returns:
+            Tuple[str, StockModelResponseSchema | None, str | None]: code, stock and error message
+        """
+        with self.session_factory() as db:
+            try:
+                stock_response = StockController(
+                    company_code, db
+                ).get_stock_by_company_code()
+            except Exception as error:
+                return company_code, None, self.format_error(company_code, error)
+        return company_code, stock_response, None
+
+    def format_error(self, company_code: str, error: Exception) -> str:
+        """Formats the error message of a stock that couldn't be retrieved
+
+        Args:
+            company_code (str): normalized company stock code
+            error (Exception): error raised while retrieving it
+
+        Returns:
+            str: error message, same as the single stock route
+        """
+        return format_stock_error(company_code, error)
+
+    def format_batch_response(
+        self,
+        stocks: Dict[str, StockModelResponseSchema],
+        results: List[Tuple[str, StockModelResponseSchema | None, str | None]],
+    ) -> StockBatchResponseSchema:
+        """Formats the batch response, keeping the requested order
+
+        Args:
+            stocks (Dict[str, StockModelResponseSchema]): stocks found on cache or data base
+            results (List[Tuple[str, StockModelResponseSchema | None, str | None]]): new stocks retrieval results
+
+        Returns:
+            StockBatchResponseSchema: stocks and errors by normalized company code
+        """
+        errors = {}
+        for company_code, stock_response, error in results:
+            if error is None:
+                stocks[company_code] = stock_response
+            else:
+                errors[company_code] = error
+        return StockBatchResponseSchema(
+            stocks={
+                company_code: stocks[company_code]
+                for company_code in self.normalized_codes
+                if company_code in stocks
+            },
+            errors=errors,
+        )
+
+
+class AsyncStockBatchController(StockBatchController):
+    def __init__(
+        self,
+        company_codes: List[str],
+        db: AsyncSession,
+        session_factory: Optional[Callable[[], AsyncSession]] = None,
+    ):
+        """initializes the AsyncStockBatchController class, asyncio version of StockBatchController
+
+        Args:
+            company_codes (List[str]): company stock codes. E.g.: ["aapl", "MSFT"]
+            db (AsyncSession): sqlalchemy orm AsyncSession used to look up the known stocks
+            session_factory (Callable[[], AsyncSession], optional): builds the sessions used to fetch
+                the unknown stocks concurrently. Defaults to None (only needed to get stocks).
+
+        Raises:
+            TooManySymbols: If more than BATCH_MAX_SYMBOLS codes are requested, returns status 422
+        """
+        super().__init__(company_codes, db, session_factory)
+
+    async def get_stocks_by_company_codes(self) -> StockBatchResponseSchema:
+        """Gets every requested stock. Known stocks are read with a single query, unknown ones
+        are retrieved concurrently (at most BATCH_FETCH_CONCURRENCY at a time)
+
+        Returns:
+            StockBatchResponseSchema: stocks and errors by normalized company code
+        """
+        stocks, missing_codes = await self.get_known_stocks()
+        # each missing stock is retrieved with its own session, this one isn't needed meanwhile
+        await self.db.rollback()
+        semaphore = asyncio.Semaphore(settings.BATCH_FETCH_CONCURRENCY)
+        results = await asyncio.gather(
+            *[self.get_new_stock(code, semaphore) for code in missing_codes]
+        )
+        return self.format_batch_response(stocks, results)
+
+    async def update_stock_amounts_by_company_codes(
+        self, amounts: Dict[str, int]
+    ) -> Dict[str, int]:
+        """Updates the purchased amount of several stocks present on DB in a single transaction,
+        if any of them fails nothing is updated
+
+        Args:
+            amounts (Dict[str, int]): amount to add by company stock code. E.g.: {"AAPL": 5, "msft": -1}
+
+        Raises:
+            PreconditionFailedName: every stock need to exist on the DB, returns 412 status
+            PreconditionFailedAmount: no stock purchased amount can become lower than 0, returns 412 status
+
+        Returns:
+            Dict[str, int]: new purchased amount by normalized company code
+        """
+        try:
+            purchased_amounts = await self.db.run_sync(add_stock_amounts, amounts)
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        for company_code in self.normalized_codes:
+            stock_response_cache.invalidate(company_code)
+        return purchased_amounts
+
+    async def get_known_stocks(
+        self,
+    ) -> Tuple[Dict[str, StockModelResponseSchema], List[str]]:
+        """Gets the requested stocks from the response cache and the data base
+
+        Returns:
+            Tuple[Dict[str, StockModelResponseSchema], List[str]]: stocks found by code, and codes not found
+        """
+        stocks, codes = self.get_cached_stocks()
+        if codes:
+            query = select_stocks_aggregate(Stock.company_code.in_(codes))
+            for stock in (await self.db.scalars(query)).unique():
+                stocks[stock.company_code] = self.cache_db_stock(stock)
+        return stocks, [code for code in codes if code not in stocks]
+
+    async def get_new_stock(
+        self, company_code: str, semaphore: asyncio.Semaphore
+    ) -> Tuple[str, StockModelResponseSchema | None, str | None]:
+        """Retrieves a stock missing from the data base with its own session
+
+        Args:
+            company_code (str): normalized company stock code
+            semaphore (asyncio.Semaphore): bounds how many stocks are retrieved at a time
+
+        Returns:
+            Tuple[str, StockModelResponseSchema | None, str | None]: code, stock and error message
+        """
+        async with semaphore, self.session_factory() as db:
+            try:
+                stock_response = await AsyncStockController(
+                    company_code, db
+                ).get_stock_by_company_code()
+            except Exception as error:
+                return company_code, None, self.format_error(company_code, error)
+        return company_code, stock_response, None
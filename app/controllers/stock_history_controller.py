@@ -0,0 +1,457 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Iterator, List, Tuple
+from sqlalchemy import Row, Select, Update, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.controllers.stock_controller import (
+    normalize_company_code,
+    polygon_open_close_date,
+)
+from app.models.stock_model import Stock, StockHistory
+from app.schemas.stock_schema import PolygonAggregatesData, StockHistorySchema
+from shared.exceptions import NotFound
+from shared.polygon_client import PolygonError, polygon_client
+from shared import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StockHistoryController:
+    def __init__(self, company_code: str, session_factory: Callable[[], Session]):
+        """initializes the StockHistoryController class. Sessions are opened per step, as the
+        history is streamed after the request dependencies are closed
+
+        Args:
+            company_code (str): company stock code. E.g.: "aapl" or "AAPL"
+            session_factory (Callable[[], Session]): builds the sessions used to read and write history
+        """
+        self.company_code = company_code
+        self.normalized_code = normalize_company_code(company_code)
+        self.session_factory = session_factory
+        self.stock_id: int | None = None
+
+    def resolve_range(
+        self, date_from: date | None, date_to: date | None
+    ) -> Tuple[date, date]:
+        """Fills the missing bounds of a requested range: it ends at the last day with closing
+        data and spans HISTORY_DEFAULT_DAYS days
+
+        Args:
+            date_from (date | None): first day requested
+            date_to (date | None): last day requested
+
+        Returns:
+            Tuple[date, date]: first and last day
+        """
+        last_closed_day = date.fromisoformat(polygon_open_close_date())
+        date_to = min(date_to or last_closed_day, last_closed_day)
+        date_from = date_from or date_to - timedelta(days=settings.HISTORY_DEFAULT_DAYS)
+        return date_from, date_to
+
+    def ingest_missing_history(self, date_from: date, date_to: date) -> int:
+        """Ingests from polygon the days of the range not ingested yet, so the stored days
+        always are a single range
+
+        Args:
+            date_from (date): first day
+            date_to (date): last day
+
+        Raises:
+            NotFound: If the stock isn't on the data base or polygon fails, returns status 404
+
+        Returns:
+            int: number of days written
+        """
+        with self.session_factory() as db:
+            stock = db.execute(self.select_stock_history_range()).one_or_none()
+            if stock is None:
+                raise NotFound(self.company_code)
+            self.stock_id = stock.id
+
+            missing_ranges = self.get_missing_ranges(stock, date_from, date_to)
+            if not missing_ranges:
+                return 0
+            # no connection is held while polygon is requested
+            db.rollback()
+            pages = [
+                self.get_history_from_polygon(missing_from, missing_to)
+                for missing_from, missing_to in missing_ranges
+            ]
+            try:
+                written = 0
+                for rows in pages:
+                    written += self.write_history(db, rows)
+                db.execute(self.update_stock_history_range(stock, date_from, date_to))
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        logger.debug(f"ingested {written} days of {self.normalized_code} history")
+        return written
+
+    def select_stock_history_range(self) -> Select:
+        """Builds the query reading the stock id and its ingested range
+
+        Returns:
+            Select: sqlalchemy select statement for Stock
+        """
+        return select(Stock.id, Stock.history_from, Stock.history_to).where(
+            Stock.company_code == self.normalized_code
+        )
+
+    def get_missing_ranges(
+        self, stock: Row, date_from: date, date_to: date
+    ) -> List[Tuple[date, date]]:
+        """Returns the ranges to ingest so the stored range covers date_from to date_to. A range
+        far from the stored one is extended up to it, keeping the stored days contiguous
+
+        Args:
+            stock (Row): stock id, history_from and history_to
+            date_from (date): first day
+            date_to (date): last day
+
+        Returns:
+            List[Tuple[date, date]]: ranges of days to ingest
+        """
+        if date_from > date_to:
+            return []
+        if stock.history_from is None:
+            return [(date_from, date_to)]
+        missing_ranges = []
+        if date_from < stock.history_from:
+            missing_ranges.append((date_from, stock.history_from - timedelta(days=1)))
+        if date_to > stock.history_to:
+            missing_ranges.append((stock.history_to + timedelta(days=1), date_to))
+        return missing_ranges
+
+    def update_stock_history_range(
+        self, stock: Row, date_from: date, date_to: date
+    ) -> Update:
+        """Builds the statement extending the ingested range of the stock
+
+        Args:
+            stock (Row): stock id, history_from and history_to
+            date_from (date): first day ingested
+            date_to (date): last day ingested
+
+        Returns:
+            Update: sqlalchemy update statement for Stock
+        """
+        return (
+            update(Stock)
+            .where(Stock.id == stock.id)
+            .values(
+                history_from=min(filter(None, [stock.history_from, date_from])),
+                history_to=max(filter(None, [stock.history_to, date_to])),
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    def get_history_url(self, date_from: date, date_to: date) -> str:
+        """Builds the polygon aggregates url of a range
+
+        Args:
+            date_from (date): first day
+            date_to (date): last day
+
+        Returns:
+            str: url of the first page
+        """
+        return (
+            f"{settings.POLYGON_BASE_URL}/v2/aggs/ticker/{self.normalized_code}"
+            f"/range/1/day/{date_from.isoformat()}/{date_to.isoformat()}"
+            "?adjusted=true&sort=asc&limit=50000"
+        )
+
+    def get_history_from_polygon(self, date_from: date, date_to: date) -> List[dict]:
+        """Gets the daily bars of a range from polygon api aggregates, following its pages
+
+        Args:
+            date_from (date): first day
+            date_to (date): last day
+
+        Raises:
+            NotFound: If polygon doesn't have the stock, raises NotFound error and return status 404
+            PolygonUnavailable: If polygon keeps failing or rate limiting, returns status 503
+
+        Returns:
+            List[dict]: stock_history_table rows
+        """
+        rows = []
+        url = self.get_history_url(date_from, date_to)
+        while url:
+            try:
+                # not cached, the ingested days are stored
+                aggregates = PolygonAggregatesData(**polygon_client.get(url))
+            except PolygonError as error:
+                self.handle_polygon_error(error)
+            rows += self.format_history_rows(aggregates)
+            url = aggregates.next_url
+        return rows
+
+    def handle_polygon_error(self, error: PolygonError) -> None:
+        """Turns a polygon answer not worth retrying into NotFound
+
+        Args:
+            error (PolygonError): polygon answer not worth retrying
+
+        Raises:
+            NotFound: Always, returns status 404
+        """
+        logger.error(
+            f"could not get {self.company_code} history from polygon api (status {error.status_code})"
+        )
+        raise NotFound(self.company_code)
+
+    def format_history_rows(self, aggregates: PolygonAggregatesData) -> List[dict]:
+        """Formats a page of polygon aggregates into stock_history_table rows
+
+        Args:
+            aggregates (PolygonAggregatesData): pydantic schema with polygon api aggregates
+
+        Returns:
+            List[dict]: stock_history_table rows
+        """
+        return [
+            {
+                "stock_id": self.stock_id,
+                # bars start at midnight New York time, which is the same day in UTC
+                "date": datetime.fromtimestamp(bar.t / 1000, tz=timezone.utc).date(),
+                "open": bar.o,
+                "high": bar.h,
+                "low": bar.l,
+                "close": bar.c,
+                "volume": int(bar.v),
+            }
+            for bar in aggregates.results
+        ]
+
+    def write_history(self, db: Session, rows: List[dict]) -> int:
+        """Upserts history rows with bulk inserts of HISTORY_INGEST_CHUNK_SIZE rows, without committing
+
+        Args:
+            db (Session): sqlalchemy orm Session holding the transaction
+            rows (List[dict]): stock_history_table rows
+
+        Returns:
+            int: number of rows written
+        """
+        dialect_insert = (
+            postgresql.insert
+            if db.get_bind().dialect.name == "postgresql"
+            else sqlite.insert
+        )
+        statement = dialect_insert(StockHistory)
+        statement = statement.on_conflict_do_update(
+            index_elements=[StockHistory.stock_id, StockHistory.date],
+            set_={
+                column: statement.excluded[column]
+                for column in ["open", "high", "low", "close", "volume"]
+            },
+        )
+        for start in range(0, len(rows), settings.HISTORY_INGEST_CHUNK_SIZE):
+            db.execute(statement, rows[start : start + settings.HISTORY_INGEST_CHUNK_SIZE])
+        return len(rows)
+
+    def select_history_page(self, after: date, date_to: date) -> Select:
+        """Builds the query of a history page: the HISTORY_PAGE_SIZE days following after
+        (keyset pagination, served by the primary key index)
+
+        Args:
+            after (date): last day of the previous page
+            date_to (date): last day
+
+        Returns:
+            Select: sqlalchemy select statement for StockHistory
+        """
+        return (
+            select(
+                StockHistory.date,
+                StockHistory.open,
+                StockHistory.high,
+                StockHistory.low,
+                StockHistory.close,
+                StockHistory.volume,
+            )
+            .where(
+                StockHistory.stock_id == self.stock_id,
+                StockHistory.date > after,
+                StockHistory.date <= date_to,
+            )
+            .order_by(StockHistory.date)
+            .limit(settings.HISTORY_PAGE_SIZE)
+        )
+
+    def iter_history(self, date_from: date, date_to: date) -> Iterator[List[Row]]:
+        """Reads the stored history of a range page by page, each page with its own session
+        so a slow client doesn't hold a connection
+
+        Args:
+            date_from (date): first day
+            date_to (date): last day
+
+        Yields:
+            List[Row]: history page
+        """
+        after = date_from - timedelta(days=1)
+        while True:
+            with self.session_factory() as db:
+                rows = db.execute(self.select_history_page(after, date_to)).all()
+            if rows:
+                yield rows
+            if len(rows) < settings.HISTORY_PAGE_SIZE:
+                return
+            after = rows[-1].date
+
+    def stream_history(self, date_from: date, date_to: date) -> Iterator[str]:
+        """Streams the stored history of a range as a json list
+
+        Args:
+            date_from (date): first day
+            date_to (date): last day
+
+        Yields:
+            str: json chunk
+        """
+        yield "["
+        separator = ""
+        for rows in self.iter_history(date_from, date_to):
+            yield separator + self.format_history_page(rows)
+            separator = ","
+        yield "]"
+
+    def format_history_page(self, rows: List[Row]) -> str:
+        """Formats a history page into json list items
+
+        Args:
+            rows (List[Row]): history page
+
+        Returns:
+            str: comma separated json objects
+        """
+        return ",".join(
+            StockHistorySchema(**row._mapping).model_dump_json() for row in rows
+        )
+
+
+class AsyncStockHistoryController(StockHistoryController):
+    def __init__(
+        self, company_code: str, session_factory: Callable[[], AsyncSession]
+    ):
+        """initializes the AsyncStockHistoryController class, asyncio version of StockHistoryController
+
+        Args:
+            company_code (str): company stock code. E.g.: "aapl" or "AAPL"
+            session_factory (Callable[[], AsyncSession]): builds the sessions used to read and write history
+        """
+        super().__init__(company_code, session_factory)
+
+    async def ingest_missing_history(self, date_from: date, date_to: date) -> int:
+        """Ingests from polygon the days of the range not ingested yet, so the stored days
+        always are a single range
+
+        Args:
+            date_from (date): first day
+            date_to (date): last day
+
+        Raises:
+            NotFound: If the stock isn't on the data base or polygon fails, returns status 404
+
+        Returns:
+            int: number of days written
+        """
+        async with self.session_factory() as db:
+            stock = (await db.execute(self.select_stock_history_range())).one_or_none()
+            if stock is None:
+                raise NotFound(self.company_code)
+            self.stock_id = stock.id
+
+            missing_ranges = self.get_missing_ranges(stock, date_from, date_to)
+            if not missing_ranges:
+                return 0
+            # no connection is held while polygon is requested
+            await db.rollback()
+            pages = [
+                await self.get_history_from_polygon(missing_from, missing_to)
+                for missing_from, missing_to in missing_ranges
+            ]
+            try:
+                written = 0
+                for rows in pages:
+                    written += await db.run_sync(self.write_history, rows)
+                await db.execute(self.update_stock_history_range(stock, date_from, date_to))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        logger.debug(f"ingested {written} days of {self.normalized_code} history")
+        return written
+
+    async def get_history_from_polygon(
+        self, date_from: date, date_to: date
+    ) -> List[dict]:
+        """Gets the daily bars of a range from polygon api aggregates, following its pages
+
+        Args:
+            date_from (date): first day
+            date_to (date): last day
+
+        Raises:
+            NotFound: If polygon doesn't have the stock, raises NotFound error and return status 404
+            PolygonUnavailable: If polygon keeps failing or rate limiting, returns status 503
+
+        Returns:
+            List[dict]: stock_history_table rows
+        """
+        rows = []
+        url = self.get_history_url(date_from, date_to)
+        while url:
+            try:
+                aggregates = PolygonAggregatesData(**await polygon_client.get_async(url))
+            except PolygonError as error:
+                self.handle_polygon_error(error)
+            rows += self.format_history_rows(aggregates)
+            url = aggregates.next_url
+        return rows
+
+    async def iter_history(
+        self, date_from: date, date_to: date
+    ) -> AsyncIterator[List[Row]]:
+        """Reads the stored history of a range page by page, each page with its own session
+        so a slow client doesn't hold a connection
+
+        Args:
+            date_from (date): first day
+            date_to (date): last day
+
+        Yields:
+            List[Row]: history page
+        """
+        after = date_from - timedelta(days=1)
+        while True:
+            async with self.session_factory() as db:
+                rows = (await db.execute(self.select_history_page(after, date_to))).all()
+            if rows:
+                yield rows
+            if len(rows) < settings.HISTORY_PAGE_SIZE:
+                return
+            after = rows[-1].date
+
+    async def stream_history(self, date_from: date, date_to: date) -> AsyncIterator[str]:
+        """Streams the stored history of a range as a json list
+
+        Args:
+            date_from (date): first day
+            date_to (date): last day
+
+        Yields:
+            str: json chunk
+        """
+        yield "["
+        separator = ""
+        async for rows in self.iter_history(date_from, date_to):
+            yield separator + self.format_history_page(rows)
+            separator = ","
+        yield "]"
@@ -1,4 +1,15 @@
-from sqlalchemy import Column, Date, Float, ForeignKey, Integer, String
+from sqlalchemy import (
+    BigInteger,
+    CheckConstraint,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Integer,
+    String,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import relationship
 from shared.database import Base
 
@@ -24,16 +35,23 @@ class PerformanceData(Base):
     one_year = Column(Float)
 
 
-class MarketCap(Base):
-    __tablename__ = "market_cap_table"
+class Company(Base):
+    __tablename__ = "company_table"
 
+    # a competitor is stored once, shared by every stock listing it. Only its identity is shared,
+    # the market cap scraped with each stock is kept on the link so writes don't change other stocks
     id = Column(Integer, primary_key=True, autoincrement=True)
-    currency = Column(String(15))
-    value = Column(Float)
+    name = Column(String(150), nullable=False, unique=True)
 
 
 class Stock(Base):
     __tablename__ = "stock_table"
+    __table_args__ = (
+        # codes are stored normalized, so lookups are equality matches on the unique index
+        CheckConstraint(
+            "company_code = upper(company_code)", name="ck_stock_table_company_code_upper"
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     status = Column(String(15))
@@ -42,6 +60,14 @@ class Stock(Base):
     request_data = Column(Date)
     company_code = Column(String(20), unique=True)
     company_name = Column(String(150))
+    # when polygon and marketwatch data was last retrieved, null for stocks never refreshed
+    fetched_at = Column(DateTime(timezone=True), index=True)
+    # days range already ingested into stock_history_table, null if none
+    history_from = Column(Date)
+    history_to = Column(Date)
+    # bumped by every write changing the "Get" route data, it is the ETag of the response
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime(timezone=True))
 
     stock_values_id = Column(
         Integer, ForeignKey("stock_values_table.id"), nullable=False, index=True
@@ -52,17 +78,38 @@ class Stock(Base):
 
     stock_values = relationship("StockValues")
     performance_data = relationship("PerformanceData")
+    competitors = relationship(
+        "Competitor", back_populates="stock", order_by="Competitor.id"
+    )
 
 
 class Competitor(Base):
     __tablename__ = "competitor_table"
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String(150))
-    stock_id = Column(Integer, ForeignKey("stock_table.id"), nullable=False, index=True)
-    market_cap_id = Column(
-        Integer, ForeignKey("market_cap_table.id"), nullable=False, index=True
+    __table_args__ = (
+        # also serves the lookups of the competitors of a stock
+        UniqueConstraint("stock_id", "company_id", name="uq_competitor_table_stock_company"),
     )
 
-    stock = relationship("Stock")
-    market_cap = relationship("MarketCap")
+    # links a stock to the companies competing with it, ids keep the order marketwatch lists them
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    stock_id = Column(Integer, ForeignKey("stock_table.id"), nullable=False)
+    company_id = Column(Integer, ForeignKey("company_table.id"), nullable=False, index=True)
+    market_cap_currency = Column(String(15))
+    market_cap_value = Column(Float)
+
+    stock = relationship("Stock", back_populates="competitors")
+    company = relationship("Company")
+
+
+class StockHistory(Base):
+    __tablename__ = "stock_history_table"
+
+    # the primary key index keeps the days of a stock together, range queries are index range scans.
+    # Prices are 4 byte floats (no surrogate id either) to keep the rows small
+    stock_id = Column(Integer, ForeignKey("stock_table.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    open = Column(Float(precision=24))
+    high = Column(Float(precision=24))
+    low = Column(Float(precision=24))
+    close = Column(Float(precision=24))
+    volume = Column(BigInteger)
@@ -0,0 +1,26 @@
+from typing import Dict
+from fastapi import APIRouter
+from app.controllers.stock_controller import (
+    not_found_cache,
+    scrap_cache,
+    stock_response_cache,
+)
+from app.schemas.cache_schema import CacheStatsSchema
+from shared.polygon_client import polygon_cache
+
+router = APIRouter(prefix="/cache")
+
+
+@router.get("/stats", response_model=Dict[str, CacheStatsSchema])
+def get_cache_stats() -> Dict[str, CacheStatsSchema]:
+    """Returns the hit, miss and eviction counters of the in memory caches of this worker.
+
+    Returns:
+        Dict[str, CacheStatsSchema]: counters for each cache, by cache name
+    """
+    return {
+        "stock_response": CacheStatsSchema(**stock_response_cache.stats()),
+        "scrap": CacheStatsSchema(**scrap_cache.stats()),
+        "not_found": CacheStatsSchema(**not_found_cache.stats()),
+        "polygon": CacheStatsSchema(**polygon_cache.stats()),
+    }
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Response
+from app.controllers.stock_controller import (
+    not_found_cache,
+    scrap_cache,
+    stock_response_cache,
+)
+from shared.metrics import CONTENT_TYPE_LATEST, register_caches, render_metrics
+from shared.polygon_client import polygon_cache
+
+router = APIRouter()
+
+register_caches(
+    {
+        "stock_response": stock_response_cache,
+        "scrap": scrap_cache,
+        "not_found": not_found_cache,
+        "polygon": polygon_cache,
+    }
+)
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics() -> Response:
+    """Returns the metrics of this worker in the prometheus text format: latency of each
+    stock lookup stage and route, cache counters, scraps in flight and SQL statements
+
+    Returns:
+        Response: prometheus text exposition
+    """
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -1,12 +1,48 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.controllers.stock_controller import StockController
+from datetime import date
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from app.controllers.async_stock_controller import AsyncStockController
+from app.controllers.stock_analytics_controller import (
+    AsyncStockAnalyticsController,
+    StockAnalyticsController,
+)
+from app.controllers.stock_batch_controller import (
+    AsyncStockBatchController,
+    StockBatchController,
+)
+from app.controllers.stock_controller import (
+    StockController,
+    default_freshness,
+    normalize_company_code,
+)
+from app.controllers.stock_history_controller import (
+    AsyncStockHistoryController,
+    StockHistoryController,
+)
 from app.schemas.stock_schema import (
+    StockAnalyticsBatchSchema,
+    StockAnalyticsSchema,
+    StockBatchResponseSchema,
+    StockBulkUpdateRequestSchema,
+    StockBulkUpdateResponseSchema,
+    StockHistorySchema,
     StockModelResponseSchema,
     StockUpdateRequestSchema,
     StockUpdateResponseSchema,
 )
-from shared.dependencies import get_db
+from shared.exceptions import NotFound
+from shared.dependencies import (
+    get_async_db,
+    get_async_sessionmaker,
+    get_db,
+    get_sessionmaker,
+)
+from shared.freshness import FreshnessPolicy
+from shared import settings
 import logging
 
 logging.basicConfig(
@@ -17,30 +53,104 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/stock")
 
+# comma separated trading days windows of the analytics routes. E.g.: "5,20,60"
+WindowsQuery = Query(settings.ANALYTICS_DEFAULT_WINDOWS, pattern=r"^\d+(,\d+)*$")
+
+
+def json_response(content: BaseModel, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serializes a response model built by the controllers with pydantic, skipping the
+    validation FastAPI runs again on returned models (response_model is kept for the docs)
+
+    Args:
+        content (BaseModel): response model. E.g.: StockModelResponseSchema
+        headers (Optional[Dict[str, str]], optional): response headers. Defaults to None.
+
+    Returns:
+        Response: json response
+    """
+    return Response(content.model_dump_json(), media_type="application/json", headers=headers)
+
+
+def not_modified_response(headers: Dict[str, str]) -> Response:
+    """Answers a conditional request whose client copy is current
+
+    Args:
+        headers (Dict[str, str]): validator and cache headers. E.g.: {"ETag": '"3"'}
+
+    Returns:
+        Response: 304 response without a body
+    """
+    return Response(status_code=304, headers=headers)
+
+
+def parse_windows(windows: str) -> List[int]:
+    """Parses the windows query parameter of the analytics routes
+
+    Args:
+        windows (str): comma separated trading days windows. E.g.: "5,20,60"
+
+    Returns:
+        List[int]: windows
+    """
+    return [int(window) for window in windows.split(",")]
+
+
+def get_symbol_analytics(
+    stock_symbol: str, analytics: Dict[str, StockAnalyticsSchema]
+) -> StockAnalyticsSchema:
+    """Picks the indicators of the symbol of the analytics route
+
+    Args:
+        stock_symbol (str): company stock code. E.g.: "aapl" or "AAPL"
+        analytics (Dict[str, StockAnalyticsSchema]): indicators by normalized company code
+
+    Raises:
+        NotFound: If the symbol has no indicators, e.g. it is blank, returns status 404
+
+    Returns:
+        StockAnalyticsSchema: stock indicators
+    """
+    stock_analytics = analytics.get(normalize_company_code(stock_symbol))
+    if stock_analytics is None:
+        raise NotFound(stock_symbol)
+    return stock_analytics
+
 
-@router.get("/{stock_symbol}", response_model=StockModelResponseSchema)
 def get_stock_data(
-    stock_symbol: str, db: Session = Depends(get_db)
-) -> StockModelResponseSchema:
+    stock_symbol: str,
+    cache_control: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+) -> Response:
     """Returns the stock data with every field of the Stock model for the given symbol.
+    Stale data is returned right away and re-fetched in background, the X-Cache
+    (HIT, STALE or MISS) and Age headers tell how fresh it is. The ETag header is the stock
+    version, a request whose If-None-Match lists it is answered 304 without a body.
 
     Args:
         stock_symbol (str): company stock code. E.g.: "aapl" or "AAPL"
+        cache_control (Optional[str], optional): Cache-Control header overriding the freshness
+            policy, "max-age", "max-stale" and "no-cache" are supported. Defaults to Header(None).
+        if_none_match (Optional[str], optional): If-None-Match header, ETags of the client copy.
+            Defaults to Header(None).
         db (Session, optional): sqlalchemy session. Defaults to Depends(get_db).
 
     Returns:
-        StockModelResponseSchema: Stock Model with every field of the Stock model
+        Response: StockModelResponseSchema json with every field of the Stock model, or 304
     """
     logger.debug(f"Starting {stock_symbol} on get route")
     stock_controller = StockController(stock_symbol, db)
-    stock_data = stock_controller.get_stock_by_company_code()
+    freshness = FreshnessPolicy.from_cache_control(cache_control, default_freshness)
+    if if_none_match is not None:
+        stock_version = stock_controller.get_unmodified_version(if_none_match, freshness)
+        if stock_version is not None:
+            logger.debug(f"Finishing {stock_symbol} on get route, not modified")
+            return not_modified_response(stock_controller.format_cache_headers(stock_version))
+    stock_data = stock_controller.get_stock_by_company_code(freshness)
     logger.debug(f"Finishing {stock_symbol} on get route")
-    return stock_data
+    return json_response(stock_data, stock_controller.format_cache_headers(stock_data))
 
 
-@router.post(
-    "/{stock_symbol}", response_model=StockUpdateResponseSchema, status_code=201
-)
 def update_stock_amount(
     stock_symbol: str,
     amount_data: StockUpdateRequestSchema,
@@ -63,3 +173,362 @@ def update_stock_amount(
     return StockUpdateResponseSchema(
         message=f"{amount_data.amount} units of stock {stock_symbol} were added to your stock record"
     )
+
+
+def get_stocks_data(
+    symbols: str,
+    db: Session = Depends(get_db),
+    session_factory: sessionmaker = Depends(get_sessionmaker),
+) -> Response:
+    """Returns the stock data of several symbols at once. A symbol that can't be retrieved
+    is listed on errors instead of failing the whole batch.
+
+    Args:
+        symbols (str): comma separated company stock codes. E.g.: "AAPL,msft"
+        db (Session, optional): sqlalchemy session. Defaults to Depends(get_db).
+        session_factory (sessionmaker, optional): sqlalchemy sessionmaker used to retrieve unknown
+            stocks concurrently. Defaults to Depends(get_sessionmaker).
+
+    Returns:
+        Response: StockBatchResponseSchema json, stocks and errors by company code
+    """
+    logger.debug(f"Starting {symbols} on batch get route")
+    stock_batch_controller = StockBatchController(symbols.split(","), db, session_factory)
+    stocks_data = stock_batch_controller.get_stocks_by_company_codes()
+    logger.debug(f"Finishing {symbols} on batch get route")
+    return json_response(stocks_data)
+
+
+def update_stocks_amount(
+    amounts_data: StockBulkUpdateRequestSchema,
+    db: Session = Depends(get_db),
+) -> StockBulkUpdateResponseSchema:
+    """update the purchased amount of several stocks at once. E.g.: {"amounts": {"AAPL": 5, "MSFT": -1}}.
+    Every update is applied in a single transaction, if any of them fails nothing is updated.
+
+    Args:
+        amounts_data (StockBulkUpdateRequestSchema): request body
+        db (Session, optional): sqlalchemy session. Defaults to Depends(get_db).
+
+    Returns:
+        StockBulkUpdateResponseSchema: new purchased amount by company code
+    """
+    logger.debug(f"Starting {list(amounts_data.amounts)} on bulk post route")
+    stock_batch_controller = StockBatchController(list(amounts_data.amounts), db)
+    purchased_amounts = stock_batch_controller.update_stock_amounts_by_company_codes(
+        amounts_data.amounts
+    )
+    logger.debug(f"Finishing {list(amounts_data.amounts)} on bulk post route")
+    return StockBulkUpdateResponseSchema(purchased_amounts=purchased_amounts)
+
+
+def get_stock_history(
+    stock_symbol: str,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    session_factory: sessionmaker = Depends(get_sessionmaker),
+) -> StreamingResponse:
+    """Streams the daily open, high, low, close and volume of the stock between two days. Days not
+    stored yet are ingested from polygon first. The stock needs to be searched on the get route before.
+
+    Args:
+        stock_symbol (str): company stock code. E.g.: "aapl" or "AAPL"
+        date_from (Optional[date], optional): first day. Defaults to HISTORY_DEFAULT_DAYS before date_to.
+        date_to (Optional[date], optional): last day. Defaults to the last day with closing data.
+        session_factory (sessionmaker, optional): sqlalchemy sessionmaker, the history is streamed
+            after the request dependencies are closed. Defaults to Depends(get_sessionmaker).
+
+    Returns:
+        StreamingResponse: json list of StockHistorySchema
+    """
+    logger.debug(f"Starting {stock_symbol} on history route")
+    stock_history_controller = StockHistoryController(stock_symbol, session_factory)
+    date_from, date_to = stock_history_controller.resolve_range(date_from, date_to)
+    stock_history_controller.ingest_missing_history(date_from, date_to)
+    return StreamingResponse(
+        stock_history_controller.stream_history(date_from, date_to),
+        media_type="application/json",
+    )
+
+
+def get_stock_analytics(
+    stock_symbol: str,
+    windows: str = WindowsQuery,
+    session_factory: sessionmaker = Depends(get_sessionmaker),
+) -> StockAnalyticsSchema:
+    """Returns indicators computed over the stock daily history: the performance figures, and the
+    returns, moving averages and annualized volatility over each window. Missing history is ingested first.
+
+    Args:
+        stock_symbol (str): company stock code. E.g.: "aapl" or "AAPL"
+        windows (str, optional): comma separated trading days windows. Defaults to ANALYTICS_DEFAULT_WINDOWS.
+        session_factory (sessionmaker, optional): sqlalchemy sessionmaker. Defaults to Depends(get_sessionmaker).
+
+    Returns:
+        StockAnalyticsSchema: stock indicators, null when the history is too short
+    """
+    logger.debug(f"Starting {stock_symbol} on analytics route")
+    stock_analytics_controller = StockAnalyticsController(
+        [stock_symbol], parse_windows(windows), session_factory
+    )
+    analytics, errors = stock_analytics_controller.get_analytics()
+    for error in errors.values():
+        raise error
+    logger.debug(f"Finishing {stock_symbol} on analytics route")
+    return get_symbol_analytics(stock_symbol, analytics)
+
+
+def get_stocks_analytics(
+    symbols: str,
+    windows: str = WindowsQuery,
+    session_factory: sessionmaker = Depends(get_sessionmaker),
+) -> StockAnalyticsBatchSchema:
+    """Returns the indicators of several symbols at once, computed over a single array of every
+    history. A symbol that can't be retrieved is listed on errors instead of failing the whole batch.
+
+    Args:
+        symbols (str): comma separated company stock codes. E.g.: "AAPL,msft"
+        windows (str, optional): comma separated trading days windows. Defaults to ANALYTICS_DEFAULT_WINDOWS.
+        session_factory (sessionmaker, optional): sqlalchemy sessionmaker. Defaults to Depends(get_sessionmaker).
+
+    Returns:
+        StockAnalyticsBatchSchema: indicators and errors by company code
+    """
+    logger.debug(f"Starting {symbols} on batch analytics route")
+    stock_analytics_controller = StockAnalyticsController(
+        symbols.split(","), parse_windows(windows), session_factory
+    )
+    analytics = stock_analytics_controller.get_analytics_batch()
+    logger.debug(f"Finishing {symbols} on batch analytics route")
+    return analytics
+
+
+async def get_stock_data_async(
+    stock_symbol: str,
+    cache_control: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+) -> Response:
+    """Asyncio version of get_stock_data, the scrap and queries don't hold a threadpool worker.
+
+    Args:
+        stock_symbol (str): company stock code. E.g.: "aapl" or "AAPL"
+        cache_control (Optional[str], optional): Cache-Control header overriding the freshness
+            policy, "max-age", "max-stale" and "no-cache" are supported. Defaults to Header(None).
+        if_none_match (Optional[str], optional): If-None-Match header, ETags of the client copy.
+            Defaults to Header(None).
+        db (AsyncSession, optional): sqlalchemy async session. Defaults to Depends(get_async_db).
+
+    Returns:
+        Response: StockModelResponseSchema json with every field of the Stock model, or 304
+    """
+    logger.debug(f"Starting {stock_symbol} on get route")
+    stock_controller = AsyncStockController(stock_symbol, db)
+    freshness = FreshnessPolicy.from_cache_control(cache_control, default_freshness)
+    if if_none_match is not None:
+        stock_version = await stock_controller.get_unmodified_version(if_none_match, freshness)
+        if stock_version is not None:
+            logger.debug(f"Finishing {stock_symbol} on get route, not modified")
+            return not_modified_response(stock_controller.format_cache_headers(stock_version))
+    stock_data = await stock_controller.get_stock_by_company_code(freshness)
+    logger.debug(f"Finishing {stock_symbol} on get route")
+    return json_response(stock_data, stock_controller.format_cache_headers(stock_data))
+
+
+async def get_stocks_data_async(
+    symbols: str,
+    db: AsyncSession = Depends(get_async_db),
+    session_factory: async_sessionmaker = Depends(get_async_sessionmaker),
+) -> Response:
+    """Asyncio version of get_stocks_data.
+
+    Args:
+        symbols (str): comma separated company stock codes. E.g.: "AAPL,msft"
+        db (AsyncSession, optional): sqlalchemy async session. Defaults to Depends(get_async_db).
+        session_factory (async_sessionmaker, optional): sqlalchemy async sessionmaker used to retrieve
+            unknown stocks concurrently. Defaults to Depends(get_async_sessionmaker).
+
+    Returns:
+        Response: StockBatchResponseSchema json, stocks and errors by company code
+    """
+    logger.debug(f"Starting {symbols} on batch get route")
+    stock_batch_controller = AsyncStockBatchController(
+        symbols.split(","), db, session_factory
+    )
+    stocks_data = await stock_batch_controller.get_stocks_by_company_codes()
+    logger.debug(f"Finishing {symbols} on batch get route")
+    return json_response(stocks_data)
+
+
+async def get_stock_history_async(
+    stock_symbol: str,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    session_factory: async_sessionmaker = Depends(get_async_sessionmaker),
+) -> StreamingResponse:
+    """Asyncio version of get_stock_history.
+
+    Args:
+        stock_symbol (str): company stock code. E.g.: "aapl" or "AAPL"
+        date_from (Optional[date], optional): first day. Defaults to HISTORY_DEFAULT_DAYS before date_to.
+        date_to (Optional[date], optional): last day. Defaults to the last day with closing data.
+        session_factory (async_sessionmaker, optional): sqlalchemy async sessionmaker, the history is
+            streamed after the request dependencies are closed. Defaults to Depends(get_async_sessionmaker).
+
+    Returns:
+        StreamingResponse: json list of StockHistorySchema
+    """
+    logger.debug(f"Starting {stock_symbol} on history route")
+    stock_history_controller = AsyncStockHistoryController(stock_symbol, session_factory)
+    date_from, date_to = stock_history_controller.resolve_range(date_from, date_to)
+    await stock_history_controller.ingest_missing_history(date_from, date_to)
+    return StreamingResponse(
+        stock_history_controller.stream_history(date_from, date_to),
+        media_type="application/json",
+    )
+
+
+async def get_stock_analytics_async(
+    stock_symbol: str,
+    windows: str = WindowsQuery,
+    session_factory: async_sessionmaker = Depends(get_async_sessionmaker),
+) -> StockAnalyticsSchema:
+    """Asyncio version of get_stock_analytics.
+
+    Args:
+        stock_symbol (str): company stock code. E.g.: "aapl" or "AAPL"
+        windows (str, optional): comma separated trading days windows. Defaults to ANALYTICS_DEFAULT_WINDOWS.
+        session_factory (async_sessionmaker, optional): sqlalchemy async sessionmaker.
+            Defaults to Depends(get_async_sessionmaker).
+
+    Returns:
+        StockAnalyticsSchema: stock indicators, null when the history is too short
+    """
+    logger.debug(f"Starting {stock_symbol} on analytics route")
+    stock_analytics_controller = AsyncStockAnalyticsController(
+        [stock_symbol], parse_windows(windows), session_factory
+    )
+    analytics, errors = await stock_analytics_controller.get_analytics()
+    for error in errors.values():
+        raise error
+    logger.debug(f"Finishing {stock_symbol} on analytics route")
+    return get_symbol_analytics(stock_symbol, analytics)
+
+
+async def get_stocks_analytics_async(
+    symbols: str,
+    windows: str = WindowsQuery,
+    session_factory: async_sessionmaker = Depends(get_async_sessionmaker),
+) -> StockAnalyticsBatchSchema:
+    """Asyncio version of get_stocks_analytics.
+
+    Args:
+        symbols (str): comma separated company stock codes. E.g.: "AAPL,msft"
+        windows (str, optional): comma separated trading days windows. Defaults to ANALYTICS_DEFAULT_WINDOWS.
+        session_factory (async_sessionmaker, optional): sqlalchemy async sessionmaker.
+            Defaults to Depends(get_async_sessionmaker).
+
+    Returns:
+        StockAnalyticsBatchSchema: indicators and errors by company code
+    """
+    logger.debug(f"Starting {symbols} on batch analytics route")
+    stock_analytics_controller = AsyncStockAnalyticsController(
+        symbols.split(","), parse_windows(windows), session_factory
+    )
+    analytics = await stock_analytics_controller.get_analytics_batch()
+    logger.debug(f"Finishing {symbols} on batch analytics route")
+    return analytics
+
+
+async def update_stock_amount_async(
+    stock_symbol: str,
+    amount_data: StockUpdateRequestSchema,
+    db: AsyncSession = Depends(get_async_db),
+) -> StockUpdateResponseSchema:
+    """Asyncio version of update_stock_amount.
+
+    Args:
+        stock_symbol (str): company stock code. E.g.: "aapl" or "AAPL"
+        amount_data (StockUpdateRequestSchema): request body
+        db (AsyncSession, optional): sqlalchemy async session. Defaults to Depends(get_async_db).
+
+    Returns:
+        StockUpdateResponseSchema: Message object with name of stock and amount added
+    """
+    stock_controller = AsyncStockController(stock_symbol, db)
+    logger.debug(f"Starting {stock_symbol} on post route, adding {amount_data.amount}")
+    await stock_controller.update_stock_amount_by_company_code(amount_data.amount)
+    logger.debug(f"Finishing {stock_symbol} on post route")
+    return StockUpdateResponseSchema(
+        message=f"{amount_data.amount} units of stock {stock_symbol} were added to your stock record"
+    )
+
+
+async def update_stocks_amount_async(
+    amounts_data: StockBulkUpdateRequestSchema,
+    db: AsyncSession = Depends(get_async_db),
+) -> StockBulkUpdateResponseSchema:
+    """Asyncio version of update_stocks_amount.
+
+    Args:
+        amounts_data (StockBulkUpdateRequestSchema): request body
+        db (AsyncSession, optional): sqlalchemy async session. Defaults to Depends(get_async_db).
+
+    Returns:
+        StockBulkUpdateResponseSchema: new purchased amount by company code
+    """
+    logger.debug(f"Starting {list(amounts_data.amounts)} on bulk post route")
+    stock_batch_controller = AsyncStockBatchController(list(amounts_data.amounts), db)
+    purchased_amounts = await stock_batch_controller.update_stock_amounts_by_company_codes(
+        amounts_data.amounts
+    )
+    logger.debug(f"Finishing {list(amounts_data.amounts)} on bulk post route")
+    return StockBulkUpdateResponseSchema(purchased_amounts=purchased_amounts)
+
+
+router.add_api_route(
+    "",
+    get_stocks_data_async if settings.USE_ASYNC_REQUEST_PATH else get_stocks_data,
+    methods=["GET"],
+    response_model=StockBatchResponseSchema,
+)
+router.add_api_route(
+    "",
+    update_stocks_amount_async if settings.USE_ASYNC_REQUEST_PATH else update_stocks_amount,
+    methods=["POST"],
+    response_model=StockBulkUpdateResponseSchema,
+    status_code=201,
+)
+# registered before "/{stock_symbol}", which would match it otherwise
+router.add_api_route(
+    "/analytics",
+    get_stocks_analytics_async if settings.USE_ASYNC_REQUEST_PATH else get_stocks_analytics,
+    methods=["GET"],
+    response_model=StockAnalyticsBatchSchema,
+)
+router.add_api_route(
+    "/{stock_symbol}",
+    get_stock_data_async if settings.USE_ASYNC_REQUEST_PATH else get_stock_data,
+    methods=["GET"],
+    response_model=StockModelResponseSchema,
+)
+router.add_api_route(
+    "/{stock_symbol}/history",
+    get_stock_history_async if settings.USE_ASYNC_REQUEST_PATH else get_stock_history,
+    methods=["GET"],
+    response_class=StreamingResponse,
+    responses={200: {"model": List[StockHistorySchema]}},
+)
+router.add_api_route(
+    "/{stock_symbol}/analytics",
+    get_stock_analytics_async if settings.USE_ASYNC_REQUEST_PATH else get_stock_analytics,
+    methods=["GET"],
+    response_model=StockAnalyticsSchema,
+)
+router.add_api_route(
+    "/{stock_symbol}",
+    update_stock_amount_async if settings.USE_ASYNC_REQUEST_PATH else update_stock_amount,
+    methods=["POST"],
+    response_model=StockUpdateResponseSchema,
+    status_code=201,
+)
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+
+
+class CacheStatsSchema(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    max_entries: int
+    ttl: float
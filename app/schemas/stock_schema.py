@@ -1,5 +1,5 @@
-from datetime import date
-from typing import List
+from datetime import date, datetime
+from typing import Dict, List, Optional
 from pydantic import BaseModel, ConfigDict, Field
 
 
@@ -38,6 +38,22 @@ class StockModelResponseSchema(BaseModel):
     stock_values: StockValuesSchema
     performance_data: PerformanceDataSchema
     competitors: List[CompetitorSchema]
+    # when the polygon and marketwatch data was retrieved, not part of the response body
+    fetched_at: Optional[datetime] = Field(default=None, exclude=True)
+    # stored version (ETag) and last write, not part of the response body either
+    version: Optional[int] = Field(default=None, exclude=True)
+    updated_at: Optional[datetime] = Field(default=None, exclude=True)
+
+
+class StockVersionSchema(BaseModel):
+    version: int
+    updated_at: Optional[datetime] = None
+    fetched_at: Optional[datetime] = None
+
+
+class StockBatchResponseSchema(BaseModel):
+    stocks: Dict[str, StockModelResponseSchema]
+    errors: Dict[str, str]
 
 
 class StockUpdateRequestSchema(BaseModel):
@@ -47,6 +63,47 @@ class StockUpdateRequestSchema(BaseModel):
 class StockUpdateResponseSchema(BaseModel):
     message: str
 
+
+class StockBulkUpdateRequestSchema(BaseModel):
+    amounts: Dict[str, int]
+
+
+class StockBulkUpdateResponseSchema(BaseModel):
+    purchased_amounts: Dict[str, int]
+
+
+class StockHistorySchema(BaseModel):
+    date: date
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: int
+
+
+class PerformanceAnalyticsSchema(BaseModel):
+    five_days: Optional[float]
+    one_month: Optional[float]
+    three_months: Optional[float]
+    year_to_date: Optional[float]
+    one_year: Optional[float]
+
+
+class StockAnalyticsSchema(BaseModel):
+    company_code: str
+    date: Optional[date]
+    close: Optional[float]
+    performance_data: PerformanceAnalyticsSchema
+    returns: Dict[str, Optional[float]]
+    moving_averages: Dict[str, Optional[float]]
+    volatility: Dict[str, Optional[float]]
+
+
+class StockAnalyticsBatchSchema(BaseModel):
+    stocks: Dict[str, StockAnalyticsSchema]
+    errors: Dict[str, str]
+
+
 class PolygonStockData(BaseModel):
     status: str
     from_: str = Field(..., alias='from')
@@ -60,6 +117,20 @@ class PolygonStockData(BaseModel):
     preMarket: float
     model_config = ConfigDict(populate_by_name=True)
 
+class PolygonAggregateBar(BaseModel):
+    t: int
+    o: float
+    h: float
+    l: float
+    c: float
+    v: float
+
+
+class PolygonAggregatesData(BaseModel):
+    results: List[PolygonAggregateBar] = []
+    next_url: Optional[str] = None
+
+
 class MarketWatchData(BaseModel):
     company_name: str
     performance_data: PerformanceDataSchema
@@ -0,0 +1,175 @@
+"""Compares computing the analytics indicators with a pure Python loop over StockHistory ORM
+rows against the NumPy path of StockAnalyticsController (column rows into contiguous arrays).
+
+Usage:
+    python -m benchmarks.bench_analytics [symbols] [years] [iterations]
+
+BENCH_DATABASE_URL points it to another database (e.g. a local Postgres), defaults to a
+temporary sqlite file.
+"""
+
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.controllers.stock_analytics_controller import (
+    PERFORMANCE_CALENDAR_DAYS,
+    PERFORMANCE_TRADING_DAYS,
+    TRADING_DAYS_PER_YEAR,
+    StockAnalyticsController,
+)
+from app.models.stock_model import *
+from shared.database import Base
+
+WINDOWS = [5, 20, 60]
+
+
+def populate(db: Session, symbols: int, years: int) -> Dict[str, int]:
+    """Inserts symbols stocks with years of random weekday closes"""
+    rng = np.random.default_rng(0)
+    stock_values_id = db.scalar(insert(StockValues).values().returning(StockValues.id))
+    performance_data_id = db.scalar(
+        insert(PerformanceData).values().returning(PerformanceData.id)
+    )
+    days = [
+        date(2024, 8, 9) - timedelta(days=offset) for offset in range(years * 365, -1, -1)
+    ]
+    days = [day for day in days if day.weekday() < 5]
+    stock_ids = {}
+    for index in range(symbols):
+        company_code = f"S{index}"
+        stock_ids[company_code] = db.scalar(
+            insert(Stock)
+            .values(
+                company_code=company_code,
+                stock_values_id=stock_values_id,
+                performance_data_id=performance_data_id,
+            )
+            .returning(Stock.id)
+        )
+        closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+        db.execute(
+            insert(StockHistory),
+            [
+                {
+                    "stock_id": stock_ids[company_code],
+                    "date": day,
+                    "open": close,
+                    "high": close,
+                    "low": close,
+                    "close": close,
+                    "volume": 1000,
+                }
+                for day, close in zip(days, closes.tolist())
+            ],
+        )
+    db.commit()
+    return stock_ids
+
+
+def python_analytics(db: Session, stock_ids: Dict[str, int], date_from: date) -> Dict[str, dict]:
+    """Same indicators computed with plain loops over ORM rows"""
+    histories: Dict[int, List[StockHistory]] = {stock_id: [] for stock_id in stock_ids.values()}
+    for row in db.scalars(
+        select(StockHistory)
+        .where(StockHistory.stock_id.in_(list(stock_ids.values())), StockHistory.date >= date_from)
+        .order_by(StockHistory.stock_id, StockHistory.date)
+    ):
+        histories[row.stock_id].append(row)
+
+    def change(last: float, reference: float | None) -> float | None:
+        return None if reference is None else (last / reference - 1) * 100
+
+    def close_on_or_before(rows: List[StockHistory], day: date) -> float | None:
+        reference = None
+        for row in rows:
+            if row.date > day:
+                break
+            reference = row.close
+        return reference
+
+    analytics = {}
+    for company_code, stock_id in stock_ids.items():
+        rows = histories[stock_id]
+        last = rows[-1].close
+        indicators = {
+            "five_days": change(last, rows[-PERFORMANCE_TRADING_DAYS - 1].close),
+            "year_to_date": change(
+                last, close_on_or_before(rows, date(rows[-1].date.year - 1, 12, 31))
+            ),
+        }
+        for name, calendar_days in PERFORMANCE_CALENDAR_DAYS.items():
+            indicators[name] = change(
+                last, close_on_or_before(rows, rows[-1].date - timedelta(days=calendar_days))
+            )
+        for window in WINDOWS:
+            closes = [row.close for row in rows[-window - 1 :]]
+            log_returns = [math.log(b / a) for a, b in zip(closes, closes[1:])]
+            indicators[f"returns_{window}"] = change(last, closes[0])
+            indicators[f"moving_average_{window}"] = sum(closes[1:]) / window
+            indicators[f"volatility_{window}"] = (
+                statistics.stdev(log_returns) * math.sqrt(TRADING_DAYS_PER_YEAR) * 100
+            )
+        analytics[company_code] = indicators
+    return analytics
+
+
+def main(symbols: int, years: int, iterations: int) -> None:
+    database_url = os.getenv(
+        "BENCH_DATABASE_URL",
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+    )
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with SessionLocal() as db:
+        stock_ids = populate(db, symbols, years)
+
+    controller = StockAnalyticsController(list(stock_ids), WINDOWS, SessionLocal)
+    date_from, date_to = date(2024, 8, 9) - timedelta(days=372), date(2024, 8, 9)
+
+    def numpy_analytics():
+        with SessionLocal() as db:
+            rows = db.execute(controller.select_history(stock_ids, date_from, date_to)).all()
+        return controller.format_analytics(stock_ids, rows)
+
+    def loop_analytics():
+        with SessionLocal() as db:
+            return python_analytics(db, stock_ids, date_from)
+
+    numpy_result, loop_result = numpy_analytics(), loop_analytics()
+    for company_code in stock_ids:
+        assert math.isclose(
+            numpy_result[company_code].volatility["20"],
+            round(loop_result[company_code]["volatility_20"], 4),
+            abs_tol=1e-3,
+        )
+
+    print(f"{database_url.split(':')[0]}, {symbols} symbols, {years} years stored, last year read")
+    for name, compute in [("python loop over orm", loop_analytics), ("numpy", numpy_analytics)]:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            compute()
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>22}: {elapsed / iterations * 1000:8.2f} ms per batch, "
+            f"{elapsed / iterations / symbols * 1000:6.3f} ms per symbol"
+        )
+
+
+if __name__ == "__main__":
+    main(
+        symbols=int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+        years=int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+        iterations=int(sys.argv[3]) if len(sys.argv) > 3 else 5,
+    )
@@ -0,0 +1,148 @@
+"""Compares the statements and time spent inserting a stock aggregate with the previous
+commit-per-row path against StockController.insert_new_stock.
+
+Usage:
+    python -m benchmarks.bench_insert_new_stock [competitors] [iterations]
+
+BENCH_DATABASE_URL points it to another database (e.g. a local Postgres), defaults to a
+temporary sqlite file.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.controllers.stock_controller import StockController, normalize_company_code
+from app.models.stock_model import *
+from app.schemas.stock_schema import (
+    CompetitorSchema,
+    MarketCapSchema,
+    PerformanceDataSchema,
+    StockModelResponseSchema,
+    StockValuesSchema,
+)
+from shared.database import Base
+
+
+def build_stock_response(company_code: str, competitors: int) -> StockModelResponseSchema:
+    return StockModelResponseSchema(
+        status="OK",
+        purchased_amount=0,
+        purchased_status="",
+        request_data="2024-08-09",
+        # stored codes are normalized, see the company_code check constraint
+        company_code=normalize_company_code(company_code),
+        company_name=f"{company_code} Inc.",
+        stock_values=StockValuesSchema(open=205.3, high=209.99, low=201.07, close=207.23),
+        performance_data=PerformanceDataSchema(
+            five_days=-5.52,
+            one_month=-9.94,
+            three_months=14.82,
+            year_to_date=8.98,
+            one_year=17.75,
+        ),
+        competitors=[
+            CompetitorSchema(
+                name=f"Competitor {index}",
+                market_cap=MarketCapSchema(currency=f"${index}B", value=index / 10),
+            )
+            for index in range(competitors)
+        ],
+    )
+
+
+def add_commit_and_refresh(db: Session, instance: object) -> object:
+    db.add(instance)
+    db.commit()
+    db.refresh(instance)
+    return instance
+
+
+def legacy_insert_new_stock(db: Session, stock_response: StockModelResponseSchema) -> None:
+    """Previous insert path, one commit and refresh per row"""
+    stock_values = add_commit_and_refresh(
+        db, StockValues(**stock_response.stock_values.model_dump())
+    )
+    performance_data = add_commit_and_refresh(
+        db, PerformanceData(**stock_response.performance_data.model_dump())
+    )
+    stock = add_commit_and_refresh(
+        db,
+        Stock(
+            status=stock_response.status,
+            purchased_amount=stock_response.purchased_amount,
+            purchased_status=stock_response.purchased_status,
+            request_data=stock_response.request_data,
+            company_code=stock_response.company_code,
+            company_name=stock_response.company_name,
+            stock_values_id=stock_values.id,
+            performance_data_id=performance_data.id,
+        ),
+    )
+    for curr_competitor in stock_response.competitors:
+        company = db.scalars(
+            select(Company).where(Company.name == curr_competitor.name)
+        ).one_or_none() or add_commit_and_refresh(db, Company(name=curr_competitor.name))
+        add_commit_and_refresh(
+            db,
+            Competitor(
+                stock_id=stock.id,
+                company_id=company.id,
+                market_cap_currency=curr_competitor.market_cap.currency,
+                market_cap_value=curr_competitor.market_cap.value,
+            ),
+        )
+
+
+def main(competitors: int, iterations: int) -> None:
+    database_url = os.getenv(
+        "BENCH_DATABASE_URL",
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+    )
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    counters = {"statements": 0, "commits": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        counters["statements"] += 1
+
+    @event.listens_for(engine, "commit")
+    def count_commit(conn):
+        counters["commits"] += 1
+
+    def controller_insert_new_stock(db: Session, stock_response: StockModelResponseSchema):
+        StockController(stock_response.company_code, db).insert_new_stock(stock_response)
+
+    print(f"{database_url.split(':')[0]}, {competitors} competitors, {iterations} iterations")
+    for name, insert_new_stock in [
+        ("commit per row", legacy_insert_new_stock),
+        ("single transaction", controller_insert_new_stock),
+    ]:
+        counters.update(statements=0, commits=0)
+        start = time.perf_counter()
+        for iteration in range(iterations):
+            with SessionLocal() as db:
+                insert_new_stock(
+                    db, build_stock_response(f"{name[0]}{iteration}", competitors)
+                )
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>20}: {counters['statements'] / iterations:6.1f} statements, "
+            f"{counters['commits'] / iterations:5.1f} commits, "
+            f"{elapsed / iterations * 1000:8.2f} ms per stock"
+        )
+
+
+if __name__ == "__main__":
+    main(
+        competitors=int(sys.argv[1]) if len(sys.argv) > 1 else 10,
+        iterations=int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+    )
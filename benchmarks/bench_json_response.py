@@ -0,0 +1,135 @@
+"""Compares the requests per second a worker answers on the "Get" and batch "Get" routes when
+FastAPI validates and serializes the returned models (previous path) against json_response.
+
+Usage:
+    python -m benchmarks.bench_json_response [competitors] [requests]
+
+Stocks are served from the response cache, so the routes don't touch the data base. Requests
+are sent straight to the ASGI application, without an http server, to measure what the
+worker spends on each request.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite://")
+
+from fastapi import Depends, FastAPI, Response
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.controllers.async_stock_controller import AsyncStockController
+from app.controllers.stock_batch_controller import AsyncStockBatchController
+from app.controllers.stock_controller import stock_response_cache
+from app.routers.stock_router import get_stock_data_async, get_stocks_data_async
+from app.schemas.stock_schema import StockBatchResponseSchema, StockModelResponseSchema
+from benchmarks.bench_insert_new_stock import build_stock_response
+from shared.dependencies import get_async_db, get_async_sessionmaker
+
+BATCH_SYMBOLS = [f"BENCH{index}" for index in range(20)]
+
+
+async def get_stock_data_validated(
+    stock_symbol: str, response: Response, db: AsyncSession = Depends(get_async_db)
+) -> StockModelResponseSchema:
+    stock_controller = AsyncStockController(stock_symbol, db)
+    stock_data = await stock_controller.get_stock_by_company_code()
+    response.headers.update(stock_controller.format_cache_headers(stock_data))
+    return stock_data
+
+
+async def get_stocks_data_validated(
+    symbols: str,
+    db: AsyncSession = Depends(get_async_db),
+    session_factory: async_sessionmaker = Depends(get_async_sessionmaker),
+) -> StockBatchResponseSchema:
+    return await AsyncStockBatchController(
+        symbols.split(","), db, session_factory
+    ).get_stocks_by_company_codes()
+
+
+def build_app(get_stock, get_stocks) -> FastAPI:
+    app = FastAPI()
+    app.add_api_route(
+        "/stock", get_stocks, methods=["GET"], response_model=StockBatchResponseSchema
+    )
+    app.add_api_route(
+        "/stock/{stock_symbol}",
+        get_stock,
+        methods=["GET"],
+        response_model=StockModelResponseSchema,
+    )
+    return app
+
+
+async def request(app: FastAPI, path: str, query_string: bytes = b"") -> bytes:
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message["body"])
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string,
+        "headers": [],
+        "server": ("bench", 80),
+        "client": ("bench", 1),
+    }
+    await app(scope, receive, send)
+    return b"".join(body)
+
+
+async def requests_per_second(app: FastAPI, path: str, query_string: bytes, count: int) -> float:
+    for _ in range(count // 10):
+        await request(app, path, query_string)
+    started_at = time.perf_counter()
+    for _ in range(count):
+        await request(app, path, query_string)
+    return count / (time.perf_counter() - started_at)
+
+
+async def main(competitors: int, count: int) -> None:
+    for company_code in BATCH_SYMBOLS:
+        stock_response_cache.set(
+            company_code,
+            build_stock_response(company_code, competitors).model_copy(
+                update={"fetched_at": datetime.now(timezone.utc)}
+            ),
+        )
+    validated = build_app(get_stock_data_validated, get_stocks_data_validated)
+    serialized = build_app(get_stock_data_async, get_stocks_data_async)
+    batch_query = f"symbols={','.join(BATCH_SYMBOLS)}".encode()
+    for label, path, query_string in [
+        ("get", f"/stock/{BATCH_SYMBOLS[0]}", b""),
+        (f"batch get ({len(BATCH_SYMBOLS)} symbols)", "/stock", batch_query),
+    ]:
+        assert await request(validated, path, query_string) == await request(
+            serialized, path, query_string
+        )
+        before = await requests_per_second(validated, path, query_string, count)
+        after = await requests_per_second(serialized, path, query_string, count)
+        print(
+            f"{label}, {competitors} competitors: validated {before:.0f} req/s, "
+            f"json_response {after:.0f} req/s ({after / before:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    competitors = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    asyncio.run(main(competitors, count))
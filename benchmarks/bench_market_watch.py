@@ -0,0 +1,107 @@
+"""Compares the per-symbol latency and the memory of the MarketWatch scrap read with a plain
+http request and parsed with lxml against the playwright browser pool scrap.
+
+Usage:
+    python -m benchmarks.bench_market_watch [mode] [symbols]
+
+mode is "http", "browser" or "both" (default), with "both" each mode runs in its own process
+so their memory doesn't add up. RSS is the resident memory of the process and all its
+children (chromium, Xvfb), read from /proc.
+
+BENCH_MARKET_WATCH_URL points it to a marketwatch site (e.g. https://www.marketwatch.com),
+defaults to a local server answering test/fixtures/market_watch/aapl.html for every symbol.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+from app.controllers.market_watch_controller import MarketWatchController
+from app.controllers.stock_controller import StockController
+from shared.browser_pool import browser_pool
+from shared import settings
+from test.fake_market_watch import FakeMarketWatch, read_fixture
+
+SYMBOLS = ["AAPL", "MSFT", "GOOG", "AMZN", "META", "NVDA", "TSLA", "NFLX", "INTC", "AMD"]
+
+
+def tree_rss_mb() -> float:
+    """Resident memory of this process and its descendants, in MB"""
+    parents: Dict[int, int] = {}
+    rss: Dict[int, int] = {}
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/stat") as stat:
+                # the command name may contain spaces, the fields start after its ")"
+                fields = stat.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        parents[int(pid)] = int(fields[1])
+        rss[int(pid)] = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    tree, pending = set(), [os.getpid()]
+    while pending:
+        pid = pending.pop()
+        tree.add(pid)
+        pending += [child for child, parent in parents.items() if parent == pid]
+    return sum(rss.get(pid, 0) for pid in tree) / 2**20
+
+
+def run_mode(mode: str, symbols: List[str]) -> None:
+    scrap: Callable[[str], object]
+    start = time.perf_counter()
+    if mode == "http":
+        scrap = lambda company_code: MarketWatchController(company_code).fetch()
+    else:
+        browser_pool.start()
+        scrap = lambda company_code: browser_pool.run(
+            StockController(company_code, None).scrap_market_watch
+        )
+    startup = time.perf_counter() - start
+
+    latencies, peak_rss = [], tree_rss_mb()
+    for company_code in symbols:
+        start = time.perf_counter()
+        scrap(company_code)
+        latencies.append(time.perf_counter() - start)
+        peak_rss = max(peak_rss, tree_rss_mb())
+    if mode == "browser":
+        browser_pool.stop()
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    print(
+        f"{mode:>8}: startup {startup * 1000:8.1f} ms, per symbol mean "
+        f"{statistics.mean(latencies_ms):8.1f} ms, p50 {latencies_ms[len(latencies_ms) // 2]:8.1f} ms, "
+        f"max {latencies_ms[-1]:8.1f} ms, peak rss {peak_rss:7.1f} MB"
+    )
+
+
+def main(mode: str, symbols: int) -> None:
+    if mode == "both":
+        for each_mode in ["http", "browser"]:
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_market_watch", each_mode, str(symbols)],
+                check=False,
+            )
+        return
+
+    fake_market_watch = None
+    base_url = os.getenv("BENCH_MARKET_WATCH_URL")
+    if base_url is None:
+        fake_market_watch = FakeMarketWatch({}, default=(200, read_fixture("aapl.html")))
+        base_url = fake_market_watch.start()
+    settings.MARKET_WATCH_BASE_URL = base_url
+    try:
+        run_mode(mode, [SYMBOLS[index % len(SYMBOLS)] for index in range(symbols)])
+    finally:
+        if fake_market_watch is not None:
+            fake_market_watch.stop()
+
+
+if __name__ == "__main__":
+    main(
+        mode=sys.argv[1] if len(sys.argv) > 1 else "both",
+        symbols=int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    )
@@ -1,20 +1,68 @@
+import asyncio
+from contextlib import asynccontextmanager
+import logging
 import uvicorn
 from fastapi import FastAPI
 
-from shared.database import Base, engine
+from shared.browser_pool import browser_pool
+from shared import settings
+from shared.database import Base, async_engine, engine
+from shared.metrics import RequestLatencyMiddleware, count_sql_statements
+from shared.polygon_client import polygon_client
 from app.routers.stock_router import router
+from app.routers.cache_router import router as cache_router
+from app.routers.metrics_router import router as metrics_router
+from app.controllers.refresh_controller import stock_refresh_scheduler
 
 from app.models.stock_model import *
-from shared.exceptions import NotFound, PreconditionFailedAmount, PreconditionFailedName
+from shared.exceptions import (
+    InvalidWindows,
+    NotFound,
+    PolygonUnavailable,
+    PreconditionFailedAmount,
+    PreconditionFailedName,
+    ScrapeUnavailable,
+    TooManySymbols,
+)
 from shared.exceptions_handler import (
+    invalid_windows_exception_handler,
     not_found_exception_handler,
+    polygon_unavailable_exception_handler,
     precondition_failed_name_exception_handler,
     precondition_failed_amount_exception_handler,
+    scrape_unavailable_exception_handler,
+    too_many_symbols_exception_handler,
 )
 
-app = FastAPI()
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # warm-up only, off the event loop: the pool starts again on the first scrap if it fails here,
+    # and routes that don't scrape keep working meanwhile
+    try:
+        await asyncio.to_thread(browser_pool.start)
+    except Exception as error:
+        logger.error(f"could not start the browser pool, it will be started on the first scrap: {error}")
+    if settings.STOCK_REFRESH_ENABLED:
+        stock_refresh_scheduler.start()
+    yield
+    stock_refresh_scheduler.stop()
+    browser_pool.stop()
+    await polygon_client.aclose()
+
+
+count_sql_statements(engine)
+count_sql_statements(async_engine.sync_engine)
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(router)
+app.include_router(cache_router)
+app.include_router(metrics_router)
+app.add_middleware(RequestLatencyMiddleware)
 app.add_exception_handler(NotFound, not_found_exception_handler)
 app.add_exception_handler(
     PreconditionFailedName, precondition_failed_name_exception_handler
@@ -22,6 +70,10 @@ app.add_exception_handler(
 app.add_exception_handler(
     PreconditionFailedAmount, precondition_failed_amount_exception_handler
 )
+app.add_exception_handler(TooManySymbols, too_many_symbols_exception_handler)
+app.add_exception_handler(InvalidWindows, invalid_windows_exception_handler)
+app.add_exception_handler(PolygonUnavailable, polygon_unavailable_exception_handler)
+app.add_exception_handler(ScrapeUnavailable, scrape_unavailable_exception_handler)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,101 @@
+"""Seeds the data base with many stocks without the web server.
+
+Usage:
+    python seed.py symbols.txt
+    cat symbols.txt | python seed.py -
+
+Symbols are separated by new lines, spaces or commas, "#" starts a comment. Stocks already
+on the data base are skipped, the others are fetched from polygon and marketwatch with
+bounded concurrency and inserted in batches. Symbols done are appended to a checkpoint
+file, running the same command again resumes where it stopped.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from app.controllers.seed_controller import SeedProgress, StockSeeder
+from shared.browser_pool import browser_pool
+from shared.database import AsyncSessionLocal, async_engine
+from shared.polygon_client import polygon_client
+from shared.rate_limit import TokenBucket
+from shared import settings
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Seeds the data base with many stocks.")
+    parser.add_argument(
+        "symbols", nargs="?", default="-", help='symbols file, "-" reads stdin (default)'
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.SEED_CONCURRENCY,
+        help="stocks fetched at the same time",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=settings.SEED_BATCH_SIZE,
+        help="stocks inserted per transaction",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=settings.SEED_CHECKPOINT_PATH,
+        help='symbols done file, "" disables it',
+    )
+    parser.add_argument(
+        "--rate-per-minute",
+        type=float,
+        default=0,
+        help="maximum stocks fetched per minute, 0 for no limit (default)",
+    )
+    parser.add_argument(
+        "--report-interval", type=float, default=5, help="seconds between progress lines"
+    )
+    parser.add_argument("--verbose", action="store_true", help="logs every request")
+    return parser.parse_args(argv)
+
+
+def report(progress: SeedProgress) -> None:
+    print(progress.format(), file=sys.stderr, flush=True)
+
+
+async def main(args: argparse.Namespace) -> SeedProgress:
+    checkpoint_path = args.checkpoint or None
+    if checkpoint_path is not None and os.path.dirname(checkpoint_path):
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+    seeder = StockSeeder(
+        AsyncSessionLocal,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        checkpoint_path=checkpoint_path,
+        rate_limit=(
+            TokenBucket(rate=args.rate_per_minute / 60, capacity=1)
+            if args.rate_per_minute > 0
+            else None
+        ),
+        report=report,
+        report_interval=args.report_interval,
+    )
+    symbols = sys.stdin if args.symbols == "-" else open(args.symbols)
+    try:
+        return await seeder.seed(symbols)
+    finally:
+        if symbols is not sys.stdin:
+            symbols.close()
+        await polygon_client.aclose()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    try:
+        progress = asyncio.run(main(args))
+    finally:
+        browser_pool.stop()
+    sys.exit(1 if progress.failed else 0)
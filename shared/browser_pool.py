@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import random
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+from playwright.async_api import Browser, Page, Playwright, async_playwright
+
+from shared import settings
+from shared.exceptions import ScrapeUnavailable
+from shared.metrics import browser_queue_depth, browser_rejections, observe_stage
+
+if sys.platform.startswith("linux"):
+    from xvfbwrapper import Xvfb
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+]
+
+
+class PooledBrowser:
+    def __init__(self, browser: Browser):
+        """Keeps track of how much a launched browser was used
+
+        Args:
+            browser (Browser): playwright chromium browser
+        """
+        self.browser = browser
+        self.uses = 0
+        self.active = 0
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        max_pages: int,
+        max_uses: int,
+        headless: bool = False,
+        max_queue: int = settings.BROWSER_POOL_MAX_QUEUE,
+        queue_timeout: float = settings.BROWSER_POOL_QUEUE_TIMEOUT,
+        deadline: float = settings.SCRAPE_DEADLINE,
+    ):
+        """Long-lived playwright chromium shared by every scrape. Playwright runs on
+        its own thread and event loop, each job gets a fresh context and page. Jobs
+        beyond max_pages wait in a bounded queue, the ones it can't take are rejected.
+        Unless headless, a single Xvfb display lives as long as the pool (on linux).
+
+        Args:
+            max_pages (int): maximum number of pages opened at the same time
+            max_uses (int): number of jobs served by a browser before it is recycled
+            headless (bool, optional): launch chromium in headless mode, it is also used when
+                Xvfb can't be started. Defaults to False.
+            max_queue (int, optional): maximum number of jobs waiting for a page.
+                Defaults to BROWSER_POOL_MAX_QUEUE.
+            queue_timeout (float, optional): seconds a job waits for a page before it is rejected.
+                Defaults to BROWSER_POOL_QUEUE_TIMEOUT.
+            deadline (float, optional): seconds a job may take overall, queue wait included,
+                before it is cancelled. Defaults to SCRAPE_DEADLINE.
+        """
+        self.max_pages = max_pages
+        self.max_uses = max_uses
+        self.headless = headless
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        # jobs waiting for a page, and average seconds a job holds one (a few seconds for a
+        # chromium scrap, refined by the jobs served) to tell rejected clients when to retry
+        self._waiting = 0
+        self._job_seconds = 5.0
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._playwright: Playwright | None = None
+        self._display = None
+        self._current: PooledBrowser | None = None
+        self._retired: list[PooledBrowser] = []
+        self._launch_lock: asyncio.Lock | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    def start(self) -> None:
+        """Starts the playwright thread and launches the first browser, does nothing if already started"""
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever, name="browser-pool", daemon=True
+            )
+            thread.start()
+            try:
+                asyncio.run_coroutine_threadsafe(self._start(), loop).result()
+            except Exception:
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join()
+                loop.close()
+                raise
+            self._loop, self._thread = loop, thread
+
+    def stop(self) -> None:
+        """Closes every browser, playwright and its thread"""
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop, self._thread = None, None
+
+    def submit(self, job: Callable[[Page], Awaitable[T]]) -> Future:
+        """Schedules a job on the pool, it receives a fresh page that is closed once it finishes
+        or once deadline is reached
+
+        Args:
+            job (Callable[[Page], Awaitable[T]]): coroutine function receiving a playwright page
+
+        Returns:
+            Future: concurrent future with the job result, cancelling it cancels the job
+        """
+        try:
+            self.start()
+        except Exception as error:
+            failed_future = Future()
+            failed_future.set_exception(error)
+            return failed_future
+        return asyncio.run_coroutine_threadsafe(self._run_until_deadline(job), self._loop)
+
+    def run(self, job: Callable[[Page], Awaitable[T]]) -> T:
+        """Runs a job on the pool and blocks until it finishes
+
+        Args:
+            job (Callable[[Page], Awaitable[T]]): coroutine function receiving a playwright page
+
+        Returns:
+            T: job result
+        """
+        return self.submit(job).result()
+
+    async def run_async(self, job: Callable[[Page], Awaitable[T]]) -> T:
+        """Runs a job on the pool without blocking the caller event loop
+
+        Args:
+            job (Callable[[Page], Awaitable[T]]): coroutine function receiving a playwright page
+
+        Returns:
+            T: job result
+        """
+        if self._loop is None:
+            await asyncio.to_thread(self.start)
+        return await asyncio.wrap_future(self.submit(job))
+
+    async def _start(self) -> None:
+        self._launch_lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(self.max_pages)
+        if sys.platform.startswith("linux") and not self.headless:
+            self._start_display()
+        try:
+            self._playwright = await async_playwright().start()
+        except Exception:
+            if self._display is not None:
+                self._display.stop()
+                self._display = None
+            raise
+        try:
+            await self._acquire_browser()
+        except Exception as error:
+            logger.error(f"could not launch browser on pool start: {error}")
+
+    def _start_display(self) -> None:
+        """Starts the Xvfb display shared by the browsers, falling back to headless without it"""
+        try:
+            with observe_stage("xvfb_start"):
+                # xvfbwrapper raises from the constructor when the Xvfb binary is missing
+                display = Xvfb()
+                display.start()
+        except Exception as error:
+            logger.warning(f"could not start Xvfb, launching chromium headless: {error}")
+            self.headless = True
+            return
+        self._display = display
+
+    async def _stop(self) -> None:
+        try:
+            for pooled in [self._current, *self._retired]:
+                if pooled is not None:
+                    await self._close(pooled)
+            self._current = None
+            self._retired = []
+            await self._playwright.stop()
+        finally:
+            if self._display is not None:
+                self._display.stop()
+                self._display = None
+
+    @asynccontextmanager
+    async def _page_slot(self) -> AsyncIterator[None]:
+        """Holds one of the max_pages slots while the with block runs
+
+        Raises:
+            ScrapeUnavailable: If max_queue jobs are already waiting, or no slot frees up
+                within queue_timeout seconds, returns status 503
+        """
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            browser_rejections.labels("queue_full").inc()
+            raise ScrapeUnavailable(self.retry_after())
+        self._waiting += 1
+        try:
+            with browser_queue_depth.track_inprogress(), observe_stage("browser_queue"):
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            browser_rejections.labels("queue_timeout").inc()
+            raise ScrapeUnavailable(self.retry_after())
+        finally:
+            self._waiting -= 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._job_seconds += 0.2 * (time.monotonic() - start - self._job_seconds)
+            self._semaphore.release()
+
+    def retry_after(self) -> float:
+        """Estimates when the jobs waiting now will have been served
+
+        Returns:
+            float: seconds, at least 1
+        """
+        return max(1.0, self._job_seconds * (self._waiting + 1) / self.max_pages)
+
+    async def _run_until_deadline(self, job: Callable[[Page], Awaitable[T]]) -> T:
+        """Runs a job, cancelling it (which frees its page) once it has taken deadline seconds
+
+        Raises:
+            ScrapeUnavailable: If the job is rejected by the queue or reaches the deadline,
+                returns status 503
+        """
+        try:
+            return await asyncio.wait_for(self._run(job), self.deadline)
+        except asyncio.TimeoutError:
+            browser_rejections.labels("deadline").inc()
+            raise ScrapeUnavailable(self.retry_after())
+
+    async def _run(self, job: Callable[[Page], Awaitable[T]]) -> T:
+        async with self._page_slot():
+            pooled = await self._acquire_browser()
+            pooled.uses += 1
+            pooled.active += 1
+            try:
+                with observe_stage("browser_context"):
+                    context = await pooled.browser.new_context(
+                        user_agent=random.choice(USER_AGENTS)
+                    )
+                try:
+                    with observe_stage("browser_page"):
+                        await context.add_init_script(
+                            "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+                        )
+                        page = await context.new_page()
+                    return await job(page)
+                finally:
+                    try:
+                        await context.close()
+                    except Exception as error:
+                        logger.warning(f"could not close browser context: {error}")
+            finally:
+                pooled.active -= 1
+                if pooled is not self._current and pooled.active == 0:
+                    await self._close(pooled)
+
+    async def _acquire_browser(self) -> PooledBrowser:
+        """Returns the current browser, launching a new one when it crashed or reached max_uses"""
+        async with self._launch_lock:
+            current = self._current
+            if (
+                current is not None
+                and current.browser.is_connected()
+                and current.uses < self.max_uses
+            ):
+                return current
+
+            if current is not None:
+                logger.debug(
+                    f"recycling browser after {current.uses} uses (connected: {current.browser.is_connected()})"
+                )
+                if current.active == 0:
+                    await self._close(current)
+                else:
+                    self._retired.append(current)
+
+            with observe_stage("browser_launch"):
+                browser = await self._playwright.chromium.launch(headless=self.headless)
+            self._current = PooledBrowser(browser)
+            return self._current
+
+    async def _close(self, pooled: PooledBrowser) -> None:
+        if pooled in self._retired:
+            self._retired.remove(pooled)
+        try:
+            await pooled.browser.close()
+        except Exception as error:
+            logger.warning(f"could not close browser: {error}")
+
+
+browser_pool = BrowserPool(
+    max_pages=settings.BROWSER_POOL_MAX_PAGES,
+    max_uses=settings.BROWSER_POOL_MAX_USES,
+    headless=settings.BROWSER_HEADLESS,
+)
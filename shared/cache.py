@@ -0,0 +1,232 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Hashable, Iterator
+
+
+class TTLCache:
+    def __init__(self, max_entries: int, ttl: float):
+        """Bounded in memory cache, entries expire after ttl seconds and the least recently
+        used one is evicted when max_entries is reached. Safe to share between threads
+
+        Args:
+            max_entries (int): maximum number of entries, 0 disables the cache
+            ttl (float): seconds an entry is kept
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        """Returns the cached value for key, None if missing or expired
+
+        Args:
+            key (Hashable): cache key
+
+        Returns:
+            Any | None: cached value
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """Stores value for key, evicting the least recently used entries if the cache is full
+
+        Args:
+            key (Hashable): cache key
+            value (Any): value to cache
+            ttl (float | None, optional): seconds this entry is kept. Defaults to the cache ttl.
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Removes key from the cache
+
+        Args:
+            key (Hashable): cache key
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes every entry from the cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Returns the cache counters
+
+        Returns:
+            dict: hits, misses, evictions, entries, max_entries and ttl
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+            }
+
+
+class SqliteCache:
+    def __init__(self, path: str, table: str, max_entries: int, ttl: float):
+        """Same interface as TTLCache, stored on a sqlite file so every worker process of the
+        host shares it. Values are pickled, counters are kept per process
+
+        Args:
+            path (str): sqlite file path. E.g.: "cache/scrap.sqlite"
+            table (str): table holding this cache entries, several caches can share a file
+            max_entries (int): maximum number of entries, 0 disables the cache
+            ttl (float): seconds an entry is kept
+        """
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value BLOB, expires_at REAL, accessed_at REAL)"
+            )
+
+    def get(self, key: Hashable) -> Any | None:
+        """Returns the cached value for key, None if missing or expired
+
+        Args:
+            key (Hashable): cache key
+
+        Returns:
+            Any | None: cached value
+        """
+        now = time.time()
+        with self._connect() as connection:
+            row = connection.execute(
+                f"SELECT value FROM {self.table} WHERE key = ? AND expires_at > ?",
+                (str(key), now),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, str(key))
+            )
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """Stores value for key, evicting expired and least recently used entries if the cache is full
+
+        Args:
+            key (Hashable): cache key
+            value (Any): value to cache
+            ttl (float | None, optional): seconds this entry is kept. Defaults to the cache ttl.
+        """
+        if self.max_entries <= 0:
+            return
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)",
+                (str(key), pickle.dumps(value), now + (ttl or self.ttl), now),
+            )
+            connection.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+            evicted = connection.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        self.evictions += evicted
+
+    def invalidate(self, key: Hashable) -> None:
+        """Removes key from the cache
+
+        Args:
+            key (Hashable): cache key
+        """
+        with self._connect() as connection:
+            connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (str(key),))
+
+    def clear(self) -> None:
+        """Removes every entry from the cache"""
+        with self._connect() as connection:
+            connection.execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> dict:
+        """Returns the cache counters
+
+        Returns:
+            dict: hits, misses, evictions, entries, max_entries and ttl
+        """
+        with self._connect() as connection:
+            entries = connection.execute(
+                f"SELECT count(*) FROM {self.table} WHERE expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+        }
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # a connection per call, the cache is used from several threads and processes
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+def build_cache(
+    backend: str, name: str, max_entries: int, ttl: float, path: str
+) -> TTLCache | SqliteCache:
+    """Builds a cache for the configured backend
+
+    Args:
+        backend (str): "memory" (per process) or "sqlite" (shared by the workers of a host)
+        name (str): cache name, used as sqlite table name
+        max_entries (int): maximum number of entries
+        ttl (float): seconds an entry is kept
+        path (str): sqlite file path, only used by the sqlite backend
+
+    Returns:
+        TTLCache | SqliteCache: cache instance
+    """
+    if backend == "sqlite":
+        return SqliteCache(path, name, max_entries, ttl)
+    return TTLCache(max_entries, ttl)
@@ -1,8 +1,21 @@
-from shared.database import SessionLocal
+from shared.database import AsyncSessionLocal, SessionLocal
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_sessionmaker():
+    return SessionLocal
+
+
+def get_async_sessionmaker():
+    return AsyncSessionLocal
@@ -11,3 +11,25 @@ class PreconditionFailedName(Exception):
 class PreconditionFailedAmount(Exception):
     def __init__(self, name: str):
         self.name = name
+
+
+class TooManySymbols(Exception):
+    def __init__(self, limit: int):
+        self.limit = limit
+
+
+class InvalidWindows(Exception):
+    def __init__(self, max_window: int, max_windows: int):
+        self.max_window = max_window
+        self.max_windows = max_windows
+
+
+class PolygonUnavailable(Exception):
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+
+
+class ScrapeUnavailable(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("marketwatch scrap queue is full")
+        self.retry_after = retry_after
@@ -1,6 +1,15 @@
+import math
 from fastapi import Request
 from fastapi.responses import JSONResponse
-from shared.exceptions import NotFound, PreconditionFailedAmount, PreconditionFailedName
+from shared.exceptions import (
+    InvalidWindows,
+    NotFound,
+    PolygonUnavailable,
+    PreconditionFailedAmount,
+    PreconditionFailedName,
+    ScrapeUnavailable,
+    TooManySymbols,
+)
 
 
 async def not_found_exception_handler(request: Request, exc: NotFound):
@@ -28,3 +37,38 @@ async def precondition_failed_amount_exception_handler(
             "message": f"Precondition failed, {exc.name} total stock amount is not valid."
         },
     )
+
+
+async def too_many_symbols_exception_handler(request: Request, exc: TooManySymbols):
+    return JSONResponse(
+        status_code=422,
+        content={"message": f"Too many symbols, at most {exc.limit} per request."},
+    )
+
+
+async def invalid_windows_exception_handler(request: Request, exc: InvalidWindows):
+    return JSONResponse(
+        status_code=422,
+        content={
+            "message": f"Invalid windows, at most {exc.max_windows} windows "
+            f"of at most {exc.max_window} trading days."
+        },
+    )
+
+
+async def polygon_unavailable_exception_handler(
+    request: Request, exc: PolygonUnavailable
+):
+    return JSONResponse(
+        status_code=503,
+        content={"message": "Polygon api is unavailable, try again later."},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
+async def scrape_unavailable_exception_handler(request: Request, exc: ScrapeUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"message": "MarketWatch scrap is saturated, try again later."},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
@@ -0,0 +1,124 @@
+import math
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+
+class FreshnessPolicy:
+    def __init__(self, fresh_for: float, stale_for: float):
+        """Stale-while-revalidate policy of stored data. Data younger than fresh_for is served
+        as is, up to stale_for seconds older it is served while it is re-fetched in background,
+        older data is re-fetched before answering
+
+        Args:
+            fresh_for (float): seconds data is fresh
+            stale_for (float): seconds after fresh_for stale data can still be served
+        """
+        self.fresh_for = fresh_for
+        self.stale_for = stale_for
+
+    @classmethod
+    def from_cache_control(
+        cls, cache_control: str | None, default: "FreshnessPolicy"
+    ) -> "FreshnessPolicy":
+        """Builds the policy of a request from its Cache-Control header: "max-age=N" sets
+        fresh_for, "max-stale=N" sets stale_for ("max-stale" alone accepts any age) and
+        "no-cache" asks for data re-fetched now
+
+        Args:
+            cache_control (str | None): request Cache-Control header. E.g.: "max-age=60, max-stale=600"
+            default (FreshnessPolicy): policy used for the missing directives
+
+        Returns:
+            FreshnessPolicy: request policy
+        """
+        fresh_for, stale_for = default.fresh_for, default.stale_for
+        for directive in (cache_control or "").split(","):
+            name, _, value = directive.strip().lower().partition("=")
+            try:
+                if name == "no-cache":
+                    return cls(fresh_for=0, stale_for=0)
+                if name == "max-age":
+                    fresh_for = float(value)
+                elif name == "max-stale":
+                    stale_for = float(value) if value else math.inf
+            except ValueError:
+                continue
+        return cls(fresh_for=fresh_for, stale_for=stale_for)
+
+    def age(self, fetched_at: datetime | None) -> float | None:
+        """Returns the age of data retrieved at fetched_at
+
+        Args:
+            fetched_at (datetime | None): when the data was retrieved, naive datetimes are UTC
+
+        Returns:
+            float | None: seconds since fetched_at, None if unknown
+        """
+        if fetched_at is None:
+            return None
+        if fetched_at.tzinfo is None:
+            fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (datetime.now(timezone.utc) - fetched_at).total_seconds())
+
+    def cache_status(self, fetched_at: datetime | None) -> str:
+        """Tells how data retrieved at fetched_at can be served
+
+        Args:
+            fetched_at (datetime | None): when the data was retrieved, None if unknown
+
+        Returns:
+            str: "HIT" (fresh), "STALE" (served while re-fetched in background, also when the
+                age is unknown) or "MISS" (re-fetched before answering)
+        """
+        age = self.age(fetched_at)
+        if age is None:
+            return "STALE"
+        if age < self.fresh_for:
+            return "HIT"
+        if age < self.fresh_for + self.stale_for:
+            return "STALE"
+        return "MISS"
+
+
+def format_etag(version: int) -> str:
+    """Formats the ETag header of a stored version
+
+    Args:
+        version (int): version of the data. E.g.: 3
+
+    Returns:
+        str: strong entity tag. E.g.: '"3"'
+    """
+    return f'"{version}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Tells if an If-None-Match header lists etag, with the weak comparison the header uses
+
+    Args:
+        if_none_match (str): request If-None-Match header. E.g.: '"2", W/"3"' or "*"
+        etag (str): current entity tag. E.g.: '"3"'
+
+    Returns:
+        bool: True if the client copy is current
+    """
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag.removeprefix("W/")
+        for tag in if_none_match.split(",")
+    )
+
+
+def format_http_date(moment: datetime) -> str:
+    """Formats a datetime as an http date, for the Last-Modified header
+
+    Args:
+        moment (datetime): naive datetimes are UTC
+
+    Returns:
+        str: E.g.: "Sat, 17 Oct 2026 18:42:16 GMT"
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return format_datetime(moment.astimezone(timezone.utc), usegmt=True)
@@ -0,0 +1,46 @@
+import threading
+from collections import Counter
+from typing import Hashable, List
+
+
+class HitCounter:
+    def __init__(self, max_keys: int):
+        """Counts how often keys are requested, keeping only the max_keys most requested
+        ones. Safe to share between threads
+
+        Args:
+            max_keys (int): maximum number of keys tracked
+        """
+        self.max_keys = max_keys
+        self._hits: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def hit(self, key: Hashable) -> None:
+        """Counts a request of key
+
+        Args:
+            key (Hashable): requested key. E.g.: "AAPL"
+        """
+        with self._lock:
+            self._hits[key] += 1
+            if len(self._hits) > 2 * self.max_keys:
+                self._hits = Counter(dict(self._hits.most_common(self.max_keys)))
+
+    def most_common(self, n: int) -> List[Hashable]:
+        """Returns the n most requested keys, most requested first
+
+        Args:
+            n (int): number of keys
+
+        Returns:
+            List[Hashable]: keys
+        """
+        with self._lock:
+            return [key for key, _ in self._hits.most_common(n)]
+
+    def decay(self) -> None:
+        """Halves every count, so the ranking follows recent requests"""
+        with self._lock:
+            self._hits = Counter(
+                {key: hits // 2 for key, hits in self._hits.items() if hits > 1}
+            )
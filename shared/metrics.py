@@ -0,0 +1,170 @@
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Dict, Iterator
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import Engine, event
+from shared.cache import SqliteCache, TTLCache
+
+# from a fast cache hit to a slow browser scrap
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+)
+
+stage_latency = Histogram(
+    "stock_stage_duration_seconds",
+    "Time spent in each stage of a stock lookup",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+request_latency = Histogram(
+    "http_request_duration_seconds",
+    "Time spent answering a request, by route",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+scrapes_in_flight = Gauge(
+    "market_watch_scrapes_in_flight",
+    "MarketWatch scraps running, by mode",
+    ["mode"],
+)
+browser_queue_depth = Gauge(
+    "browser_pool_queue_depth",
+    "Browser scraps waiting for a page",
+)
+browser_rejections = Counter(
+    "browser_pool_rejections_total",
+    "Browser scraps rejected, by reason (queue full, wait timeout or deadline)",
+    ["reason"],
+)
+sql_statements = Counter(
+    "sql_statements_total",
+    "SQL statements sent to the data base, by operation",
+    ["operation"],
+)
+
+SQL_OPERATIONS = {"select", "insert", "update", "delete"}
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    """Observes the time spent in the with block on stage_latency, also when it raises.
+    Works around awaits too
+
+    Args:
+        stage (str): stage name. E.g.: "polygon"
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_latency.labels(stage).observe(time.perf_counter() - start)
+
+
+def observe_future(stage: str, future: Future) -> Future:
+    """Observes the time until future is done on stage_latency, for stages running in background
+
+    Args:
+        stage (str): stage name. E.g.: "market_watch"
+        future (Future): concurrent future of the stage
+
+    Returns:
+        Future: the same future
+    """
+    start = time.perf_counter()
+    future.add_done_callback(
+        lambda _: stage_latency.labels(stage).observe(time.perf_counter() - start)
+    )
+    return future
+
+
+def count_sql_statements(engine: Engine) -> None:
+    """Counts the statements sent through engine on sql_statements
+
+    Args:
+        engine (Engine): sqlalchemy engine, the sync_engine of an AsyncEngine for asyncio
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip()[:6].lower()
+        sql_statements.labels(operation if operation in SQL_OPERATIONS else "other").inc()
+
+
+class CacheCollector:
+    def __init__(self, caches: Dict[str, TTLCache | SqliteCache]):
+        """Exposes the counters the caches already keep, read when metrics are scraped so
+        cache lookups don't pay for them
+
+        Args:
+            caches (Dict[str, TTLCache | SqliteCache]): caches by name, see shared.cache
+        """
+        self.caches = caches
+
+    def collect(self):
+        hits = CounterMetricFamily("cache_hits", "Cache lookups found", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache lookups missed", labels=["cache"])
+        evictions = CounterMetricFamily(
+            "cache_evictions", "Cache entries evicted", labels=["cache"]
+        )
+        entries = GaugeMetricFamily("cache_entries", "Cache entries kept", labels=["cache"])
+        for name, cache in self.caches.items():
+            stats = cache.stats()
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            evictions.add_metric([name], stats["evictions"])
+            entries.add_metric([name], stats["entries"])
+        return [hits, misses, evictions, entries]
+
+
+def register_caches(caches: Dict[str, TTLCache | SqliteCache]) -> None:
+    """Exposes the counters of caches on the metrics
+
+    Args:
+        caches (Dict[str, TTLCache | SqliteCache]): caches by name
+    """
+    REGISTRY.register(CacheCollector(caches))
+
+
+class RequestLatencyMiddleware:
+    def __init__(self, app):
+        """ASGI middleware observing the time spent answering each request on request_latency,
+        until the last byte of the body (streamed ones included)
+
+        Args:
+            app: ASGI application
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # the route template (e.g. /stock/{stock_symbol}) keeps the label count bounded
+            route = scope.get("route")
+            request_latency.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - start)
+
+
+def render_metrics() -> bytes:
+    """Renders every metric of this worker in the prometheus text format
+
+    Returns:
+        bytes: metrics page, served with CONTENT_TYPE_LATEST
+    """
+    return generate_latest(REGISTRY)
+
@@ -0,0 +1,307 @@
+import asyncio
+import contextvars
+import math
+import random
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import date
+from typing import Iterator
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from shared.cache import SqliteCache, TTLCache, build_cache
+from shared.exceptions import PolygonUnavailable
+from shared.rate_limit import TokenBucket
+from shared import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# answered when polygon is overloaded or rate limits us, worth retrying
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class PolygonError(Exception):
+    def __init__(self, status_code: int, url: str):
+        """Polygon answered a status not worth retrying. E.g.: 404 for an unknown symbol
+
+        Args:
+            status_code (int): http status code
+            url (str): requested url
+        """
+        super().__init__(f"polygon answered {status_code} for {url}")
+        self.status_code = status_code
+        self.url = url
+
+
+def open_close_ttl(day: str) -> float:
+    """Returns how long the /open-close data of a day can be cached: forever for past days,
+    whose data doesn't change anymore, POLYGON_CACHE_TTL for today
+
+    Args:
+        day (str): iso date. E.g.: "2024-08-09"
+
+    Returns:
+        float: seconds
+    """
+    if date.fromisoformat(day) < date.today():
+        return math.inf
+    return settings.POLYGON_CACHE_TTL
+
+
+class PolygonClient:
+    def __init__(
+        self,
+        cache: TTLCache | SqliteCache,
+        rate_limit: TokenBucket | None = None,
+        max_retries: int = settings.POLYGON_MAX_RETRIES,
+        backoff: float = settings.POLYGON_BACKOFF,
+        max_backoff: float = settings.POLYGON_MAX_BACKOFF,
+        pool_size: int = settings.POLYGON_POOL_SIZE,
+    ):
+        """Polygon api client keeping its connections open, with timeouts, retries of 429 and
+        5xx answers, a rate limit shared by the sync and asyncio paths and a response cache
+
+        Args:
+            cache (TTLCache | SqliteCache): cache of the responses requested with a ttl
+            rate_limit (TokenBucket | None, optional): bounds the requests sent, retries included.
+                Defaults to None (no limit).
+            max_retries (int, optional): retries of a request. Defaults to POLYGON_MAX_RETRIES.
+            backoff (float, optional): seconds before the first retry, doubled each retry and
+                jittered. Defaults to POLYGON_BACKOFF.
+            max_backoff (float, optional): maximum seconds between two tries. Defaults to POLYGON_MAX_BACKOFF.
+            pool_size (int, optional): connections kept open. Defaults to POLYGON_POOL_SIZE.
+        """
+        self.cache = cache
+        self.rate_limit = rate_limit
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=pool_size))
+        # an httpx client can't be shared between event loops, one is kept per loop
+        self._async_clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, httpx.AsyncClient
+        ] = weakref.WeakKeyDictionary()
+        # budget of the current thread or task the requests are charged to as well, see limited_by
+        self._caller_rate_limit: contextvars.ContextVar[TokenBucket | None] = (
+            contextvars.ContextVar("caller_rate_limit", default=None)
+        )
+
+    @contextmanager
+    def limited_by(self, rate_limit: TokenBucket | None) -> Iterator[None]:
+        """Charges every request sent from the current thread or task within the block, retries
+        included, to rate_limit too, waiting for its tokens. E.g.: the budget of the background
+        refresh. Cached responses take no token
+
+        Args:
+            rate_limit (TokenBucket | None): caller budget, None for no extra limit
+        """
+        token = self._caller_rate_limit.set(rate_limit)
+        try:
+            yield
+        finally:
+            self._caller_rate_limit.reset(token)
+
+    def url(self, path: str) -> str:
+        """Builds the url of a path on POLYGON_BASE_URL
+
+        Args:
+            path (str): path, or absolute url (e.g. the next_url of a page). E.g.: "/v1/open-close/AAPL/2024-08-09"
+
+        Returns:
+            str: url
+        """
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{settings.POLYGON_BASE_URL}{path}"
+
+    def get(self, path: str, ttl: float | None = None) -> dict:
+        """Requests a polygon endpoint, retrying 429 and 5xx answers and connection failures
+
+        Args:
+            path (str): path or absolute url. E.g.: "/v1/open-close/AAPL/2024-08-09"
+            ttl (float | None, optional): seconds the response is cached, math.inf keeps it until
+                evicted. Defaults to None (not cached).
+
+        Raises:
+            PolygonError: If polygon answers a status not worth retrying. E.g.: 404
+            PolygonUnavailable: If the retries are exhausted or the rate limit wait is too long,
+                returns status 503
+
+        Returns:
+            dict: response json
+        """
+        url = self.url(path)
+        if ttl and (cached := self.cache.get(url)) is not None:
+            return cached
+        retry_after = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay(attempt, retry_after))
+            if (caller_rate_limit := self._caller_rate_limit.get()) is not None:
+                caller_rate_limit.acquire()
+            if self.rate_limit is not None and not self.rate_limit.acquire(
+                timeout=settings.POLYGON_RATE_LIMIT_TIMEOUT
+            ):
+                raise PolygonUnavailable(1 / self.rate_limit.rate)
+            try:
+                response = self.session.get(
+                    url,
+                    headers=self.headers(),
+                    timeout=(settings.POLYGON_CONNECT_TIMEOUT, settings.POLYGON_READ_TIMEOUT),
+                )
+            except (requests.ConnectionError, requests.Timeout) as error:
+                logger.warning(f"polygon request failed (try {attempt + 1}): {error}")
+                retry_after = None
+                continue
+            if response.status_code == 200:
+                return self.cache_response(url, response.json(), ttl)
+            if response.status_code not in RETRY_STATUS:
+                raise PolygonError(response.status_code, url)
+            logger.warning(f"polygon answered {response.status_code} (try {attempt + 1})")
+            retry_after = response.headers.get("Retry-After")
+        raise PolygonUnavailable(self.retry_delay(self.max_retries + 1, retry_after))
+
+    async def get_async(self, path: str, ttl: float | None = None) -> dict:
+        """asyncio version of get, sleeping and waiting for the rate limit without blocking the loop
+
+        Args:
+            path (str): path or absolute url. E.g.: "/v1/open-close/AAPL/2024-08-09"
+            ttl (float | None, optional): seconds the response is cached. Defaults to None (not cached).
+
+        Raises:
+            PolygonError: If polygon answers a status not worth retrying. E.g.: 404
+            PolygonUnavailable: If the retries are exhausted or the rate limit wait is too long
+
+        Returns:
+            dict: response json
+        """
+        url = self.url(path)
+        if ttl and (cached := self.cache.get(url)) is not None:
+            return cached
+        client = self.async_client()
+        retry_after = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.retry_delay(attempt, retry_after))
+            await self.acquire_async()
+            try:
+                response = await client.get(url, headers=self.headers())
+            except httpx.TransportError as error:
+                logger.warning(f"polygon request failed (try {attempt + 1}): {error!r}")
+                retry_after = None
+                continue
+            if response.status_code == 200:
+                return self.cache_response(url, response.json(), ttl)
+            if response.status_code not in RETRY_STATUS:
+                raise PolygonError(response.status_code, url)
+            logger.warning(f"polygon answered {response.status_code} (try {attempt + 1})")
+            retry_after = response.headers.get("Retry-After")
+        raise PolygonUnavailable(self.retry_delay(self.max_retries + 1, retry_after))
+
+    async def acquire_async(self) -> None:
+        """Waits for a rate limit token (and one of the caller budget, see limited_by) without
+        blocking the event loop
+
+        Raises:
+            PolygonUnavailable: If no token is available within POLYGON_RATE_LIMIT_TIMEOUT seconds
+        """
+        if (caller_rate_limit := self._caller_rate_limit.get()) is not None:
+            while wait := caller_rate_limit.try_acquire():
+                await asyncio.sleep(wait)
+        if self.rate_limit is None:
+            return
+        deadline = time.monotonic() + settings.POLYGON_RATE_LIMIT_TIMEOUT
+        while wait := self.rate_limit.try_acquire():
+            if time.monotonic() + wait > deadline:
+                raise PolygonUnavailable(wait)
+            await asyncio.sleep(wait)
+
+    def async_client(self) -> httpx.AsyncClient:
+        """Returns the httpx client of the running event loop, creating it on first use
+
+        Returns:
+            httpx.AsyncClient: client keeping up to pool_size connections open
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    settings.POLYGON_READ_TIMEOUT, connect=settings.POLYGON_CONNECT_TIMEOUT
+                ),
+                limits=httpx.Limits(
+                    max_connections=None, max_keepalive_connections=self.pool_size
+                ),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Closes the httpx client of the running event loop"""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def headers(self) -> dict:
+        """Builds the request headers
+
+        Returns:
+            dict: authorization header
+        """
+        return {"Authorization": f"Bearer {settings.POLYGON_API_KEY}"}
+
+    def retry_delay(self, attempt: int, retry_after: str | None) -> float:
+        """Returns the seconds to wait before a try: the Retry-After polygon sent if any,
+        otherwise a random delay up to backoff * 2 ** (attempt - 1) so clients don't retry in step
+
+        Args:
+            attempt (int): try about to be made, 1 for the first retry
+            retry_after (str | None): Retry-After header of the last answer
+
+        Returns:
+            float: seconds, at most max_backoff
+        """
+        try:
+            return min(float(retry_after), self.max_backoff)
+        except (TypeError, ValueError):
+            return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def cache_response(self, url: str, data: dict, ttl: float | None) -> dict:
+        """Caches a response requested with a ttl
+
+        Args:
+            url (str): requested url
+            data (dict): response json
+            ttl (float | None): seconds the response is cached, None doesn't cache it
+
+        Returns:
+            dict: data
+        """
+        if ttl:
+            self.cache.set(url, data, ttl)
+        return data
+
+
+polygon_cache = build_cache(
+    settings.POLYGON_CACHE_BACKEND,
+    "polygon",
+    max_entries=settings.POLYGON_CACHE_MAX_ENTRIES,
+    ttl=settings.POLYGON_CACHE_TTL,
+    path=settings.POLYGON_CACHE_PATH,
+)
+
+polygon_client = PolygonClient(
+    polygon_cache,
+    rate_limit=(
+        TokenBucket(
+            rate=settings.POLYGON_RATE_PER_MINUTE / 60, capacity=settings.POLYGON_RATE_BURST
+        )
+        if settings.POLYGON_RATE_PER_MINUTE > 0
+        else None
+    ),
+)
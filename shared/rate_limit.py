@@ -0,0 +1,56 @@
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        """Token bucket rate limiter: tokens are added at rate per second up to capacity,
+        every call takes one. Safe to share between threads
+
+        Args:
+            rate (float): tokens added per second
+            capacity (float): maximum number of tokens, allows bursts of that size
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Takes a token if one is available
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until the next one
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        """Blocks until a token is taken
+
+        Args:
+            timeout (float | None, optional): maximum seconds to wait. Defaults to None (no limit).
+
+        Returns:
+            bool: True if a token was taken, False on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
@@ -0,0 +1,134 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Playwright browser pool used by the MarketWatch scraper
+BROWSER_POOL_MAX_PAGES = int(os.getenv("BROWSER_POOL_MAX_PAGES", "4"))
+BROWSER_POOL_MAX_USES = int(os.getenv("BROWSER_POOL_MAX_USES", "50"))
+# headless chromium needs no virtual display but is easier for bot protections to spot, without
+# it a single Xvfb display is started with the pool (on linux) and shared by every browser
+BROWSER_HEADLESS = os.getenv("BROWSER_HEADLESS", "false").lower() == "true"
+# scraps waiting for a page beyond BROWSER_POOL_MAX_QUEUE, or for longer than
+# BROWSER_POOL_QUEUE_TIMEOUT seconds, are rejected with a 503 instead of piling up
+BROWSER_POOL_MAX_QUEUE = int(os.getenv("BROWSER_POOL_MAX_QUEUE", "16"))
+BROWSER_POOL_QUEUE_TIMEOUT = float(os.getenv("BROWSER_POOL_QUEUE_TIMEOUT", "20"))
+# seconds a scrap may take overall, queue wait included, it is cancelled and answered 503 after it
+SCRAPE_DEADLINE = float(os.getenv("SCRAPE_DEADLINE", "45"))
+
+# MarketWatch scrap, "http" reads the page without a browser and falls back to the browser pool
+# when it fails or gets a bot challenge, "browser" always scraps with the browser pool
+MARKET_WATCH_SCRAP_MODE = os.getenv("MARKET_WATCH_SCRAP_MODE", "http")
+MARKET_WATCH_BASE_URL = os.getenv("MARKET_WATCH_BASE_URL", "https://www.marketwatch.com")
+MARKET_WATCH_HTTP_TIMEOUT = float(os.getenv("MARKET_WATCH_HTTP_TIMEOUT", "10"))
+MARKET_WATCH_HTTP_WORKERS = int(os.getenv("MARKET_WATCH_HTTP_WORKERS", "8"))
+
+# Serves the stock routes with the asyncio controller, set to "false" to use the sync one
+USE_ASYNC_REQUEST_PATH = os.getenv("USE_ASYNC_REQUEST_PATH", "true").lower() == "true"
+
+# Polygon api
+POLYGON_BASE_URL = os.getenv("POLYGON_BASE_URL", "https://api.polygon.io")
+POLYGON_API_KEY = os.getenv("POLYGON_API_KEY", "bmN7i7CrzrpKqFvgbB1fEaztCwZKSUjJ")
+POLYGON_CONNECT_TIMEOUT = float(os.getenv("POLYGON_CONNECT_TIMEOUT", "3.05"))
+POLYGON_READ_TIMEOUT = float(os.getenv("POLYGON_READ_TIMEOUT", "10"))
+POLYGON_POOL_SIZE = int(os.getenv("POLYGON_POOL_SIZE", "16"))
+# retries of a request answered 429 or 5xx (or failing to connect), after a jittered exponential
+# backoff starting at POLYGON_BACKOFF seconds, or the Retry-After polygon sends
+POLYGON_MAX_RETRIES = int(os.getenv("POLYGON_MAX_RETRIES", "3"))
+POLYGON_BACKOFF = float(os.getenv("POLYGON_BACKOFF", "0.5"))
+POLYGON_MAX_BACKOFF = float(os.getenv("POLYGON_MAX_BACKOFF", "10"))
+# requests per minute allowed by the polygon plan (5 on the free plan), 0 for no limit
+POLYGON_RATE_PER_MINUTE = float(os.getenv("POLYGON_RATE_PER_MINUTE", "0"))
+POLYGON_RATE_BURST = float(os.getenv("POLYGON_RATE_BURST", "1"))
+# seconds a request waits for the rate limit before answering 503
+POLYGON_RATE_LIMIT_TIMEOUT = float(os.getenv("POLYGON_RATE_LIMIT_TIMEOUT", "30"))
+# polygon responses cache, past days never change and are kept until evicted,
+# the others for POLYGON_CACHE_TTL seconds
+POLYGON_CACHE_BACKEND = os.getenv("POLYGON_CACHE_BACKEND", "memory")
+POLYGON_CACHE_PATH = os.getenv("POLYGON_CACHE_PATH", "cache/polygon.sqlite")
+POLYGON_CACHE_TTL = float(os.getenv("POLYGON_CACHE_TTL", "60"))
+POLYGON_CACHE_MAX_ENTRIES = int(os.getenv("POLYGON_CACHE_MAX_ENTRIES", "4096"))
+
+# In memory cache of assembled "Get" route responses (per worker process)
+STOCK_RESPONSE_CACHE_TTL = float(os.getenv("STOCK_RESPONSE_CACHE_TTL", "30"))
+STOCK_RESPONSE_CACHE_MAX_ENTRIES = int(
+    os.getenv("STOCK_RESPONSE_CACHE_MAX_ENTRIES", "1024")
+)
+
+# Coalesces lookups of the same new stock across workers with a Postgres advisory lock
+SINGLE_FLIGHT_ADVISORY_LOCK = (
+    os.getenv("SINGLE_FLIGHT_ADVISORY_LOCK", "false").lower() == "true"
+)
+# seconds a lookup waits for another worker fetching the same stock before fetching it too
+SINGLE_FLIGHT_LOCK_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_LOCK_TIMEOUT", "30"))
+
+# MarketWatch scrap results cache, "memory" (per worker) or "sqlite" (shared by the workers of a host)
+SCRAP_CACHE_BACKEND = os.getenv("SCRAP_CACHE_BACKEND", "memory")
+SCRAP_CACHE_PATH = os.getenv("SCRAP_CACHE_PATH", "cache/scrap.sqlite")
+SCRAP_CACHE_TTL = float(os.getenv("SCRAP_CACHE_TTL", "3600"))
+SCRAP_CACHE_MAX_ENTRIES = int(os.getenv("SCRAP_CACHE_MAX_ENTRIES", "4096"))
+# seconds a company code not found on polygon or marketwatch answers 404 without a new lookup
+NOT_FOUND_CACHE_TTL = float(os.getenv("NOT_FOUND_CACHE_TTL", "600"))
+
+# Batch lookup route (GET /stock?symbols=AAPL,MSFT)
+BATCH_MAX_SYMBOLS = int(os.getenv("BATCH_MAX_SYMBOLS", "200"))
+BATCH_FETCH_CONCURRENCY = int(os.getenv("BATCH_FETCH_CONCURRENCY", "8"))
+
+# Polygon /open-close day, empty uses the last weekday before today
+POLYGON_OPEN_CLOSE_DATE = os.getenv("POLYGON_OPEN_CLOSE_DATE", "")
+# days requested when polygon answers 404 for the day (market holiday), a symbol is only
+# deemed unknown once all of them answered 404
+POLYGON_OPEN_CLOSE_LOOKBACK_DAYS = int(os.getenv("POLYGON_OPEN_CLOSE_LOOKBACK_DAYS", "3"))
+# a day is skipped as a market holiday once this many different symbols had no data for it
+# (a single symbol may be halted, delisted or late), for POLYGON_HOLIDAY_TTL seconds
+POLYGON_HOLIDAY_MIN_SYMBOLS = int(os.getenv("POLYGON_HOLIDAY_MIN_SYMBOLS", "3"))
+POLYGON_HOLIDAY_TTL = int(os.getenv("POLYGON_HOLIDAY_TTL", "86400"))
+
+# Background refresh of stocks whose data is older than STOCK_REFRESH_MAX_AGE seconds
+STOCK_REFRESH_ENABLED = os.getenv("STOCK_REFRESH_ENABLED", "true").lower() == "true"
+STOCK_REFRESH_MAX_AGE = float(os.getenv("STOCK_REFRESH_MAX_AGE", "86400"))
+STOCK_REFRESH_POLL_INTERVAL = float(os.getenv("STOCK_REFRESH_POLL_INTERVAL", "60"))
+STOCK_REFRESH_BATCH_SIZE = int(os.getenv("STOCK_REFRESH_BATCH_SIZE", "20"))
+STOCK_REFRESH_WORKERS = int(os.getenv("STOCK_REFRESH_WORKERS", "2"))
+# number of most requested symbols refreshed before the others
+STOCK_REFRESH_HOT_SYMBOLS = int(os.getenv("STOCK_REFRESH_HOT_SYMBOLS", "100"))
+# requests per minute the refresh is allowed to send to each source, 0 disables the limit
+POLYGON_REFRESH_RATE_PER_MINUTE = float(
+    os.getenv("POLYGON_REFRESH_RATE_PER_MINUTE", "5")
+)
+MARKET_WATCH_REFRESH_RATE_PER_MINUTE = float(
+    os.getenv("MARKET_WATCH_REFRESH_RATE_PER_MINUTE", "10")
+)
+
+# Stale-while-revalidate of the "Get" route: data is served as is for STOCK_FRESH_FOR seconds,
+# then for STOCK_STALE_FOR more seconds while it is re-fetched in background
+STOCK_FRESH_FOR = float(os.getenv("STOCK_FRESH_FOR", str(STOCK_REFRESH_MAX_AGE)))
+STOCK_STALE_FOR = float(os.getenv("STOCK_STALE_FOR", "604800"))
+STOCK_REVALIDATE_WORKERS = int(os.getenv("STOCK_REVALIDATE_WORKERS", "2"))
+
+# Daily history route (GET /stock/{symbol}/history)
+HISTORY_DEFAULT_DAYS = int(os.getenv("HISTORY_DEFAULT_DAYS", "365"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "1000"))
+HISTORY_INGEST_CHUNK_SIZE = int(os.getenv("HISTORY_INGEST_CHUNK_SIZE", "5000"))
+
+# Analytics routes (GET /stock/{symbol}/analytics and GET /stock/analytics?symbols=AAPL,MSFT)
+ANALYTICS_DEFAULT_WINDOWS = os.getenv("ANALYTICS_DEFAULT_WINDOWS", "5,20,60")
+# largest window in trading days (1260 is about five years of history) and windows per request
+ANALYTICS_MAX_WINDOW = int(os.getenv("ANALYTICS_MAX_WINDOW", "1260"))
+ANALYTICS_MAX_WINDOWS = int(os.getenv("ANALYTICS_MAX_WINDOWS", "10"))
+
+# Seeding CLI (python seed.py symbols.txt)
+SEED_CONCURRENCY = int(os.getenv("SEED_CONCURRENCY", "8"))
+SEED_BATCH_SIZE = int(os.getenv("SEED_BATCH_SIZE", "100"))
+SEED_CHECKPOINT_PATH = os.getenv("SEED_CHECKPOINT_PATH", "cache/seed.checkpoint")
+
+# Data base connection pool, per engine and per worker process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# seconds after which a connection is replaced, -1 keeps them forever
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# seconds a Postgres statement may run before being cancelled, 0 for no limit
+DB_STATEMENT_TIMEOUT = float(os.getenv("DB_STATEMENT_TIMEOUT", "0"))
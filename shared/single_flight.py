@@ -0,0 +1,89 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        """Coalesces concurrent calls sharing a key: the first caller runs the function and
+        every caller arriving while it runs waits for its result instead. Works for threads
+        (sync routes) and event loops (async routes) at the same time
+        """
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Runs fn unless a call for key is already in flight, in that case waits for it
+
+        Args:
+            key (Hashable): key identifying the call. E.g.: "AAPL"
+            fn (Callable[[], T]): function to run
+
+        Returns:
+            T: fn result, or the result of the call in flight
+        """
+        call, leader = self._join(key)
+        if not leader:
+            return call.result()
+        try:
+            result = fn()
+        except BaseException as error:
+            self._finish(key, call, error=error)
+            raise
+        self._finish(key, call, result=result)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Asyncio version of do
+
+        Args:
+            key (Hashable): key identifying the call. E.g.: "AAPL"
+            fn (Callable[[], Awaitable[T]]): coroutine function to run
+
+        Returns:
+            T: fn result, or the result of the call in flight
+        """
+        call, leader = self._join(key)
+        if not leader:
+            # shielded so a cancelled follower doesn't cancel the call for everyone else
+            return await asyncio.shield(asyncio.wrap_future(call))
+        try:
+            result = await fn()
+        except BaseException as error:
+            self._finish(key, call, error=error)
+            raise
+        self._finish(key, call, result=result)
+        return result
+
+    def in_flight(self) -> int:
+        """Returns the number of calls currently running"""
+        with self._lock:
+            return len(self._calls)
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = Future()
+            return call, True
+
+    def _finish(
+        self,
+        key: Hashable,
+        call: Future,
+        result: object = None,
+        error: BaseException | None = None,
+    ) -> None:
+        with self._lock:
+            del self._calls[key]
+        if error is None:
+            call.set_result(result)
+        elif isinstance(error, Exception):
+            call.set_exception(error)
+        else:
+            # leader was cancelled or interrupted
+            call.cancel()
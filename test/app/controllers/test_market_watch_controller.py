@@ -0,0 +1,150 @@
+import asyncio
+import re
+from concurrent.futures import Future
+
+import pytest
+
+from app.controllers.market_watch_controller import (
+    BotChallenge,
+    MarketWatchController,
+    MarketWatchUnavailable,
+    is_bot_challenge,
+    parse_market_watch,
+)
+from app.schemas.stock_schema import (
+    CompetitorSchema,
+    MarketCapSchema,
+    MarketWatchData,
+    PerformanceDataSchema,
+)
+from shared import settings
+from shared.exceptions import NotFound
+from test.fake_market_watch import FakeMarketWatch, read_fixture
+
+AAPL_MARKET_WATCH = MarketWatchData(
+    company_name="Apple Inc.",
+    performance_data=PerformanceDataSchema(
+        five_days=1.18,
+        one_month=-5.61,
+        three_months=13.21,
+        year_to_date=12.32,
+        one_year=21.54,
+    ),
+    competitors=[
+        CompetitorSchema(
+            name="Microsoft Corp.", market_cap=MarketCapSchema(currency="$3.05T", value=0.41)
+        ),
+        CompetitorSchema(
+            name="Alphabet Inc. Cl C", market_cap=MarketCapSchema(currency="$2.01T", value=-1.2)
+        ),
+        CompetitorSchema(
+            name="Samsung Electronics Co. Ltd.",
+            market_cap=MarketCapSchema(currency="₩471.02T", value=2.08),
+        ),
+    ],
+)
+
+BROWSER_MARKET_WATCH = AAPL_MARKET_WATCH.model_copy(update={"company_name": "From browser"})
+
+
+def serve_market_watch(monkeypatch) -> FakeMarketWatch:
+    fake_market_watch = FakeMarketWatch(
+        {
+            "AAPL": (200, read_fixture("aapl.html")),
+            "BLOCKED": (403, read_fixture("challenge.html")),
+            "CHANGED": (200, "<html><body><h1>Apple Inc.</h1></body></html>"),
+        }
+    )
+    monkeypatch.setattr(settings, "MARKET_WATCH_BASE_URL", fake_market_watch.start())
+    return fake_market_watch
+
+
+def browser_fallback(calls: list):
+    def fallback() -> Future:
+        calls.append(True)
+        web_data_future = Future()
+        web_data_future.set_result(BROWSER_MARKET_WATCH)
+        return web_data_future
+
+    return fallback
+
+
+def test_parse_market_watch_fixture():
+    assert parse_market_watch(read_fixture("aapl.html")) == AAPL_MARKET_WATCH
+
+
+def test_parse_market_watch_table_without_tbody():
+    html = re.sub(r"</?tbody[^>]*>", "", read_fixture("aapl.html"))
+
+    assert parse_market_watch(html) == AAPL_MARKET_WATCH
+
+
+def test_parse_market_watch_challenge_error():
+    html = read_fixture("challenge.html")
+
+    assert is_bot_challenge(200, html)
+    assert not is_bot_challenge(200, read_fixture("aapl.html"))
+    with pytest.raises(MarketWatchUnavailable):
+        parse_market_watch(html)
+
+
+def test_fetch_market_watch_without_browser(monkeypatch):
+    fake_market_watch = serve_market_watch(monkeypatch)
+    calls = []
+    try:
+        web_data = MarketWatchController("AAPL").submit(browser_fallback(calls)).result(5)
+    finally:
+        fake_market_watch.stop()
+
+    assert web_data == AAPL_MARKET_WATCH
+    assert calls == []
+    assert fake_market_watch.requests == ["/investing/stock/AAPL"]
+
+
+def test_fetch_market_watch_falls_back_to_browser(monkeypatch):
+    fake_market_watch = serve_market_watch(monkeypatch)
+    calls = []
+    try:
+        with pytest.raises(BotChallenge):
+            MarketWatchController("BLOCKED").fetch()
+        blocked = MarketWatchController("BLOCKED").submit(browser_fallback(calls)).result(5)
+        changed = MarketWatchController("CHANGED").submit(browser_fallback(calls)).result(5)
+    finally:
+        fake_market_watch.stop()
+
+    assert blocked == BROWSER_MARKET_WATCH
+    assert changed == BROWSER_MARKET_WATCH
+    assert len(calls) == 2
+
+
+def test_fetch_market_watch_not_found_does_not_fall_back(monkeypatch):
+    fake_market_watch = serve_market_watch(monkeypatch)
+    calls = []
+    try:
+        with pytest.raises(NotFound):
+            MarketWatchController("XXXXX").submit(browser_fallback(calls)).result(5)
+    finally:
+        fake_market_watch.stop()
+
+    assert calls == []
+
+
+def test_async_fetch_market_watch_falls_back_to_browser(monkeypatch):
+    fake_market_watch = serve_market_watch(monkeypatch)
+    calls = []
+
+    async def fallback() -> MarketWatchData:
+        return browser_fallback(calls)().result()
+
+    async def fetch():
+        return await asyncio.gather(
+            MarketWatchController("AAPL").fetch_async(fallback),
+            MarketWatchController("BLOCKED").fetch_async(fallback),
+        )
+
+    try:
+        assert asyncio.run(fetch()) == [AAPL_MARKET_WATCH, BROWSER_MARKET_WATCH]
+    finally:
+        fake_market_watch.stop()
+
+    assert len(calls) == 1
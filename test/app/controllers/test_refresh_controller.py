@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update
+
+from app.controllers.refresh_controller import RefreshScheduler
+from app.controllers.stock_controller import (
+    StockController,
+    non_trading_day_symbols,
+    polygon_open_close_date,
+    stock_hits,
+)
+from app.models.stock_model import *
+from shared.exceptions import NotFound
+from shared.rate_limit import TokenBucket
+from shared import settings
+from test.fake_polygon import FakePolygon
+from test.app.controllers.test_stock_controller import (
+    TestingSessionLocal,
+    build_stock_response,
+)
+
+
+def build_scheduler(
+    batch_size: int, polygon_rate_limit: TokenBucket | None = None
+) -> RefreshScheduler:
+    return RefreshScheduler(
+        TestingSessionLocal,
+        max_age=60,
+        poll_interval=60,
+        batch_size=batch_size,
+        workers=2,
+        polygon_rate_limit=polygon_rate_limit or TokenBucket(rate=1000, capacity=1000),
+        market_watch_rate_limit=TokenBucket(rate=1000, capacity=1000),
+    )
+
+
+def insert_stale_stocks(*company_codes: str) -> None:
+    db = TestingSessionLocal()
+    for company_code in company_codes:
+        StockController(company_code, db).insert_new_stock(
+            build_stock_response(company_code, 2)
+        )
+    # every other stock of the data base is made fresh, so only these ones are stale
+    db.execute(update(Stock).values(fetched_at=datetime.now(timezone.utc)))
+    db.execute(
+        update(Stock)
+        .where(Stock.company_code.in_(company_codes))
+        .values(fetched_at=datetime.now(timezone.utc) - timedelta(hours=1))
+    )
+    db.commit()
+    db.close()
+
+
+def test_refresh_stale_stocks_overwrites_data(monkeypatch):
+    insert_stale_stocks("STALE")
+    db = TestingSessionLocal()
+    db.execute(
+        update(Stock).where(Stock.company_code == "STALE").values(purchased_amount=7)
+    )
+    db.commit()
+    db.close()
+
+    def get_new_stock(self):
+        stock_response = build_stock_response(self.normalized_code, 3)
+        stock_response.company_name = "Stale Refreshed Inc."
+        stock_response.stock_values.close = 300.0
+        return stock_response
+
+    monkeypatch.setattr(StockController, "get_new_stock", get_new_stock)
+
+    assert build_scheduler(batch_size=5).refresh_stale_stocks() == 1
+
+    db = TestingSessionLocal()
+    stock = db.scalars(select(Stock).where(Stock.company_code == "STALE")).one()
+    assert stock.company_name == "Stale Refreshed Inc."
+    assert stock.purchased_amount == 7
+    assert stock.stock_values.close == 300.0
+    assert [competitor.company.name for competitor in stock.competitors] == [
+        f"Competitor {index}" for index in range(3)
+    ]
+    db.close()
+
+    assert build_scheduler(batch_size=5).select_stale_company_codes() == []
+
+
+def test_refresh_stale_stocks_most_requested_first():
+    insert_stale_stocks("COLD", "HOT")
+    for _ in range(3):
+        stock_hits.hit("HOT")
+
+    assert build_scheduler(batch_size=1).select_stale_company_codes() == ["HOT"]
+    assert build_scheduler(batch_size=2).select_stale_company_codes() == ["HOT", "COLD"]
+
+
+def test_refresh_failed_stock_is_not_retried_right_away(monkeypatch):
+    insert_stale_stocks("GONE")
+
+    def get_new_stock(self):
+        raise NotFound(self.company_code)
+
+    monkeypatch.setattr(StockController, "get_new_stock", get_new_stock)
+    scheduler = build_scheduler(batch_size=5)
+
+    assert scheduler.refresh_stale_stocks() == 0
+    assert scheduler.select_stale_company_codes() == []
+
+
+def test_refresh_charges_every_polygon_request(monkeypatch):
+    insert_stale_stocks("STEPBACK")
+    holiday = polygon_open_close_date()
+    fake_polygon = FakePolygon(holidays=(holiday,))
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+
+    def get_new_stock(self):
+        self.get_stock_from_polygon()
+        return build_stock_response(self.normalized_code, 2)
+
+    monkeypatch.setattr(StockController, "get_new_stock", get_new_stock)
+    # no token is added back during the test
+    polygon_rate_limit = TokenBucket(rate=1e-6, capacity=3)
+    try:
+        refreshed = build_scheduler(5, polygon_rate_limit).refresh_stale_stocks()
+    finally:
+        non_trading_day_symbols.invalidate(holiday)
+        fake_polygon.stop()
+
+    assert refreshed == 1
+    # the holiday and the day before it took a token each
+    assert len(fake_polygon.requests) == 2
+    assert polygon_rate_limit.try_acquire() == 0
+    assert polygon_rate_limit.try_acquire() > 0
+
+
+def test_refresh_without_rate_limits(monkeypatch):
+    insert_stale_stocks("UNLIMITED")
+    monkeypatch.setattr(
+        StockController,
+        "get_new_stock",
+        lambda self: build_stock_response(self.normalized_code, 2),
+    )
+    scheduler = RefreshScheduler(
+        TestingSessionLocal,
+        max_age=60,
+        poll_interval=60,
+        batch_size=5,
+        workers=2,
+        polygon_rate_limit=None,
+        market_watch_rate_limit=None,
+    )
+
+    assert scheduler.refresh_stale_stocks() == 1
@@ -0,0 +1,124 @@
+import asyncio
+from datetime import date
+import os
+import tempfile
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.controllers.async_stock_controller import AsyncStockController
+from app.controllers.seed_controller import StockSeeder
+from app.controllers.stock_controller import StockController
+from app.models.stock_model import *
+from app.schemas.stock_schema import (
+    CompetitorSchema,
+    MarketCapSchema,
+    PerformanceDataSchema,
+    StockModelResponseSchema,
+    StockValuesSchema,
+)
+from shared.database import Base, get_async_database_url
+from shared.exceptions import NotFound
+
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stocks.db')}"
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(
+    get_async_database_url(SQLALCHEMY_DATABASE_URL), poolclass=NullPool
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, bind=async_engine
+)
+
+Base.metadata.create_all(bind=engine)
+
+
+def build_stock_response(company_code: str) -> StockModelResponseSchema:
+    return StockModelResponseSchema(
+        status="OK",
+        purchased_amount=0,
+        purchased_status="",
+        request_data=date(2024, 8, 9),
+        company_code=company_code,
+        company_name=f"{company_code} Inc.",
+        stock_values=StockValuesSchema(open=205.3, high=209.99, low=201.07, close=207.23),
+        performance_data=PerformanceDataSchema(
+            five_days=-5.52,
+            one_month=-9.94,
+            three_months=14.82,
+            year_to_date=8.98,
+            one_year=17.75,
+        ),
+        competitors=[
+            CompetitorSchema(
+                name="Competitor", market_cap=MarketCapSchema(currency="$1B", value=0.1)
+            )
+        ],
+    )
+
+
+def patch_get_new_stock(monkeypatch, failing_codes: set) -> list:
+    fetched = []
+
+    async def get_new_stock(self):
+        fetched.append(self.normalized_code)
+        await asyncio.sleep(0)
+        if self.normalized_code.startswith("X"):
+            raise NotFound(self.company_code)
+        if self.normalized_code in failing_codes:
+            raise RuntimeError("polygon is down")
+        return build_stock_response(self.normalized_code)
+
+    monkeypatch.setattr(AsyncStockController, "get_new_stock", get_new_stock)
+    return fetched
+
+
+def test_seed_stocks_in_batches_and_resume(monkeypatch):
+    with TestingSessionLocal() as db:
+        StockController("AMZN", db).insert_new_stock(build_stock_response("AMZN"))
+    checkpoint_path = os.path.join(tempfile.mkdtemp(), "seed.checkpoint")
+    symbols = ["aapl\n", "msft, goog  # big tech\n", "\n", "AAPL amzn\n", "XXXXX\n", "FAIL\n"]
+    fetched = patch_get_new_stock(monkeypatch, failing_codes={"FAIL"})
+    commits = []
+
+    def count_commit(conn):
+        commits.append(True)
+
+    event.listen(async_engine.sync_engine, "commit", count_commit)
+    seeder = StockSeeder(
+        TestingAsyncSessionLocal, concurrency=3, batch_size=2, checkpoint_path=checkpoint_path
+    )
+    try:
+        progress = asyncio.run(seeder.seed(symbols))
+    finally:
+        event.remove(async_engine.sync_engine, "commit", count_commit)
+
+    assert (progress.read, progress.seeded, progress.skipped) == (6, 3, 1)
+    assert (progress.not_found, progress.failed) == (1, 1)
+    assert sorted(fetched) == ["AAPL", "FAIL", "GOOG", "MSFT", "XXXXX"]
+    # 3 new stocks inserted 2 per transaction
+    assert len(commits) == 2
+    with open(checkpoint_path) as checkpoint:
+        assert sorted(checkpoint.read().split()) == ["AAPL", "GOOG", "MSFT", "XXXXX"]
+    with TestingSessionLocal() as db:
+        assert sorted(db.scalars(select(Stock.company_code))) == [
+            "AAPL",
+            "AMZN",
+            "GOOG",
+            "MSFT",
+        ]
+
+    fetched = patch_get_new_stock(monkeypatch, failing_codes=set())
+    seeder = StockSeeder(
+        TestingAsyncSessionLocal, concurrency=3, batch_size=2, checkpoint_path=checkpoint_path
+    )
+    progress = asyncio.run(seeder.seed(symbols))
+
+    assert (progress.read, progress.seeded, progress.skipped) == (6, 1, 5)
+    assert fetched == ["FAIL"]
+    with TestingSessionLocal() as db:
+        assert "FAIL" in db.scalars(select(Stock.company_code)).all()
@@ -0,0 +1,54 @@
+import math
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app.controllers.stock_analytics_controller import compute_analytics
+
+
+def build_history(first_day: date, closes: list) -> tuple:
+    days, day = [], first_day
+    while len(days) < len(closes):
+        if day.weekday() < 5:
+            days.append((day - date(1970, 1, 1)).days)
+        day += timedelta(days=1)
+    return days, closes
+
+
+def test_compute_analytics_matches_python_loop():
+    rng = np.random.default_rng(1)
+    histories = [
+        build_history(date(2023, 1, 2), list(100 + np.cumsum(rng.normal(0, 1, 400)))),
+        build_history(date(2024, 3, 1), list(50 + np.cumsum(rng.normal(0, 1, 30)))),
+    ]
+    segments = np.concatenate([np.full(len(days), index) for index, (days, _) in enumerate(histories)])
+    days = np.concatenate([days for days, _ in histories]).astype(np.int64)
+    closes = np.concatenate([closes for _, closes in histories]).astype(np.float64)
+
+    analytics = compute_analytics(segments, days, closes, 3, [5, 20])
+
+    for index, (history_days, history_closes) in enumerate(histories):
+        last_close, last_day = history_closes[-1], history_days[-1]
+
+        def close_on_or_before(target_day: int) -> float:
+            previous = [c for d, c in zip(history_days, history_closes) if d <= target_day]
+            return previous[-1] if previous else math.nan
+
+        assert analytics["close"][index] == last_close
+        assert analytics["five_days"][index] == pytest.approx(
+            (last_close / history_closes[-6] - 1) * 100
+        )
+        one_month = (last_close / close_on_or_before(last_day - 30) - 1) * 100
+        assert np.isclose(analytics["one_month"][index], one_month, equal_nan=True)
+        assert analytics["moving_average_20"][index] == pytest.approx(
+            sum(history_closes[-20:]) / 20
+        )
+        log_returns = np.diff(np.log(history_closes[-21:]))
+        assert analytics["volatility_20"][index] == pytest.approx(
+            np.std(log_returns, ddof=1) * math.sqrt(252) * 100
+        )
+
+    assert math.isnan(analytics["one_year"][1])
+    assert math.isnan(analytics["close"][2])
+    assert analytics["date"][2] == -1
@@ -0,0 +1,403 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, func, literal, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+from app.controllers.async_stock_controller import AsyncStockController
+from app.controllers import stock_controller
+from app.controllers.stock_controller import (
+    StockController,
+    non_trading_day_symbols,
+    not_found_cache,
+    polygon_open_close_date,
+    polygon_open_close_days,
+)
+from app.models.stock_model import *
+from app.schemas.stock_schema import (
+    CompetitorSchema,
+    MarketCapSchema,
+    PerformanceDataSchema,
+    StockModelResponseSchema,
+    StockValuesSchema,
+)
+from shared.database import Base, get_async_database_url
+from shared.exceptions import NotFound
+from shared import settings
+from test.fake_polygon import FakePolygon
+
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stocks.db')}"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": 30},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(
+    get_async_database_url(SQLALCHEMY_DATABASE_URL), poolclass=NullPool
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, bind=async_engine
+)
+
+Base.metadata.create_all(bind=engine)
+
+
+def count_statements(statements: list):
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    return before_cursor_execute
+
+
+def build_stock_response(company_code: str, competitors: int) -> StockModelResponseSchema:
+    return StockModelResponseSchema(
+        status="OK",
+        purchased_amount=0,
+        purchased_status="",
+        request_data=date(2024, 8, 9),
+        company_code=company_code,
+        company_name=f"{company_code} Inc.",
+        stock_values=StockValuesSchema(open=205.3, high=209.99, low=201.07, close=207.23),
+        performance_data=PerformanceDataSchema(
+            five_days=-5.52,
+            one_month=-9.94,
+            three_months=14.82,
+            year_to_date=8.98,
+            one_year=17.75,
+        ),
+        competitors=[
+            CompetitorSchema(
+                name=f"Competitor {index}",
+                market_cap=MarketCapSchema(currency=f"${index}B", value=index / 10),
+            )
+            for index in range(competitors)
+        ],
+    )
+
+
+def test_get_new_stock_cancels_scrap_when_polygon_fails(monkeypatch):
+    web_data_future = Future()
+
+    def get_stock_from_polygon(self):
+        raise NotFound(self.company_code)
+
+    monkeypatch.setattr(StockController, "start_market_watch", lambda self: web_data_future)
+    monkeypatch.setattr(StockController, "get_stock_from_polygon", get_stock_from_polygon)
+
+    with pytest.raises(NotFound):
+        StockController("xxxxx", None).get_new_stock()
+
+    assert web_data_future.cancelled()
+
+
+def test_async_get_new_stock_cancels_scrap_when_polygon_fails(monkeypatch):
+    scrap_cancelled = asyncio.Event()
+
+    async def get_market_watch(self):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            scrap_cancelled.set()
+            raise
+
+    async def get_stock_from_polygon(self):
+        await asyncio.sleep(0.01)
+        raise NotFound(self.company_code)
+
+    monkeypatch.setattr(AsyncStockController, "get_market_watch", get_market_watch)
+    monkeypatch.setattr(AsyncStockController, "get_stock_from_polygon", get_stock_from_polygon)
+
+    async def get_new_stock():
+        with pytest.raises(NotFound):
+            await AsyncStockController("xxxxx", None).get_new_stock()
+        await asyncio.wait_for(scrap_cancelled.wait(), timeout=1)
+
+    asyncio.run(get_new_stock())
+
+
+def test_insert_new_stock_issues_constant_statements():
+    statements = []
+    listener = count_statements(statements)
+    db = TestingSessionLocal()
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        StockController("BULK", db).insert_new_stock(build_stock_response("BULK", 10))
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+        db.close()
+
+    assert len(statements) == 5
+
+    db = TestingSessionLocal()
+    stock = db.scalars(select(Stock).where(Stock.company_code == "BULK")).one()
+    competitors = db.scalars(
+        select(Competitor).where(Competitor.stock_id == stock.id).order_by(Competitor.id)
+    ).all()
+    assert [competitor.company.name for competitor in competitors] == [
+        f"Competitor {index}" for index in range(10)
+    ]
+    assert [competitor.market_cap_currency for competitor in competitors] == [
+        f"${index}B" for index in range(10)
+    ]
+    db.close()
+
+
+def test_insert_new_stock_shares_competitor_companies():
+    db = TestingSessionLocal()
+    StockController("SHAREA", db).insert_new_stock(build_stock_response("SHAREA", 3))
+    companies = db.scalar(select(func.count()).select_from(Company))
+    stock_response = build_stock_response("SHAREB", 3)
+    stock_response.competitors[0].market_cap.currency = "$9B"
+    StockController("SHAREB", db).insert_new_stock(stock_response)
+
+    # the competitors of both stocks are the same 3 companies, each stock keeps the market caps
+    # scraped with it, so writing one doesn't change the data (and version) of the other
+    assert db.scalar(select(func.count()).select_from(Company)) == companies
+    assert db.scalars(
+        select(Competitor.market_cap_currency)
+        .join(Company)
+        .where(Company.name == "Competitor 0")
+        .order_by(Competitor.id)
+    ).all()[-2:] == ["$0B", "$9B"]
+    stock = db.scalars(StockController("SHAREA", db).select_stock_aggregate()).unique().one()
+    assert StockController("SHAREA", db).format_db_stock_response(stock).competitors[
+        0
+    ].market_cap.currency == "$0B"
+    db.close()
+
+
+def test_insert_new_stock_rolls_back_on_failure():
+    db = TestingSessionLocal()
+    StockController("DUPE", db).insert_new_stock(build_stock_response("DUPE", 1))
+    stock_values_count = db.scalar(select(func.count()).select_from(StockValues))
+
+    with pytest.raises(Exception):
+        StockController("DUPE", db).insert_new_stock(build_stock_response("DUPE", 1))
+
+    assert db.scalar(select(func.count()).select_from(StockValues)) == stock_values_count
+    db.close()
+
+
+def test_concurrent_lookups_of_new_stock_fetch_once(monkeypatch):
+    fetches = []
+    lock = threading.Lock()
+
+    def get_new_stock(self):
+        with lock:
+            fetches.append(self.normalized_code)
+        time.sleep(0.2)
+        return build_stock_response("FLIGHT", 2)
+
+    monkeypatch.setattr(StockController, "get_new_stock", get_new_stock)
+
+    def get_stock(company_code: str):
+        db = TestingSessionLocal()
+        try:
+            return StockController(company_code, db).get_stock_by_company_code()
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(get_stock, ["flight"] * 8))
+
+    assert fetches == ["FLIGHT"]
+    assert all(response.company_code == "FLIGHT" for response in responses)
+
+
+def test_async_concurrent_lookups_of_new_stock_fetch_once(monkeypatch):
+    fetches = []
+
+    async def get_new_stock(self):
+        fetches.append(self.normalized_code)
+        await asyncio.sleep(0.2)
+        return build_stock_response("AFLIGHT", 2)
+
+    monkeypatch.setattr(AsyncStockController, "get_new_stock", get_new_stock)
+
+    async def get_stock(company_code: str):
+        async with TestingAsyncSessionLocal() as db:
+            return await AsyncStockController(company_code, db).get_stock_by_company_code()
+
+    async def get_stocks():
+        return await asyncio.gather(*[get_stock("aflight") for _ in range(8)])
+
+    responses = asyncio.run(get_stocks())
+
+    assert fetches == ["AFLIGHT"]
+    assert all(response.company_code == "AFLIGHT" for response in responses)
+
+
+def test_cold_lookups_do_not_hold_connections_while_fetching(monkeypatch):
+    # 100 lookups sharing 2 connections, each fetch waits until the 100 are in flight
+    small_pool_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False, "timeout": 30},
+        pool_size=2,
+        max_overflow=0,
+        pool_timeout=3,
+    )
+    in_flight = []
+    all_in_flight = threading.Event()
+    lock = threading.Lock()
+
+    def get_new_stock(self):
+        with lock:
+            in_flight.append(self.normalized_code)
+            if len(in_flight) == 100:
+                all_in_flight.set()
+        all_in_flight.wait(timeout=10)
+        return build_stock_response(self.normalized_code, 2)
+
+    monkeypatch.setattr(StockController, "get_new_stock", get_new_stock)
+
+    def get_stock(company_code: str):
+        with sessionmaker(bind=small_pool_engine)() as db:
+            return StockController(company_code, db).get_stock_by_company_code()
+
+    company_codes = [f"POOL{index:03}" for index in range(100)]
+    with ThreadPoolExecutor(max_workers=100) as executor:
+        responses = list(executor.map(get_stock, company_codes))
+
+    assert all_in_flight.is_set()
+    assert [response.company_code for response in responses] == company_codes
+    assert small_pool_engine.pool.checkedout() == 0
+    small_pool_engine.dispose()
+
+
+def test_advisory_lock_does_not_hold_pooled_connections_while_fetching(monkeypatch):
+    # sqlite stands in for Postgres, the lock statements always succeed
+    small_pool_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False, "timeout": 30},
+        pool_size=1,
+        max_overflow=0,
+    )
+    checked_out = []
+
+    def get_new_stock(self):
+        checked_out.append(small_pool_engine.pool.checkedout())
+        return build_stock_response(self.normalized_code, 2)
+
+    monkeypatch.setattr(StockController, "get_new_stock", get_new_stock)
+    monkeypatch.setattr(StockController, "use_advisory_lock", lambda self: True)
+    monkeypatch.setattr(
+        StockController, "select_try_advisory_lock", lambda self: select(literal(True))
+    )
+    monkeypatch.setattr(
+        StockController, "select_advisory_unlock", lambda self: select(literal(True))
+    )
+    monkeypatch.setattr(stock_controller, "lock_engine", engine)
+
+    with sessionmaker(bind=small_pool_engine)() as db:
+        stock_response = StockController("LOCKED", db).get_and_insert_new_stock()
+
+    assert stock_response.company_code == "LOCKED"
+    assert checked_out == [0]
+    small_pool_engine.dispose()
+
+
+def test_advisory_lock_waits_for_the_stock_fetched_by_another_worker(monkeypatch):
+    db = TestingSessionLocal()
+    StockController("ELSEWHERE", db).insert_new_stock(build_stock_response("ELSEWHERE", 1))
+
+    def get_new_stock(self):
+        raise AssertionError("fetched twice")
+
+    monkeypatch.setattr(StockController, "get_new_stock", get_new_stock)
+    monkeypatch.setattr(StockController, "use_advisory_lock", lambda self: True)
+    monkeypatch.setattr(
+        StockController, "select_try_advisory_lock", lambda self: select(literal(False))
+    )
+    monkeypatch.setattr(stock_controller, "lock_engine", engine)
+
+    stock_response = StockController("ELSEWHERE", db).get_and_insert_new_stock()
+    db.close()
+
+    assert stock_response.company_code == "ELSEWHERE"
+
+
+def test_async_cold_lookups_do_not_hold_connections_while_fetching(monkeypatch):
+    small_pool_engine = create_async_engine(
+        get_async_database_url(SQLALCHEMY_DATABASE_URL),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=2,
+        max_overflow=0,
+        pool_timeout=3,
+    )
+    SmallPoolSession = async_sessionmaker(
+        autoflush=False, expire_on_commit=False, bind=small_pool_engine
+    )
+    in_flight = []
+
+    async def get_new_stock(self):
+        in_flight.append(self.normalized_code)
+        if len(in_flight) == 100:
+            all_in_flight.set()
+        await asyncio.wait_for(all_in_flight.wait(), timeout=10)
+        return build_stock_response(self.normalized_code, 2)
+
+    monkeypatch.setattr(AsyncStockController, "get_new_stock", get_new_stock)
+
+    async def get_stock(company_code: str):
+        async with SmallPoolSession() as db:
+            return await AsyncStockController(company_code, db).get_stock_by_company_code()
+
+    async def get_stocks(company_codes: list):
+        try:
+            return await asyncio.gather(*[get_stock(code) for code in company_codes])
+        finally:
+            await small_pool_engine.dispose()
+
+    all_in_flight = asyncio.Event()
+    company_codes = [f"APOOL{index:03}" for index in range(100)]
+    responses = asyncio.run(get_stocks(company_codes))
+
+    assert [response.company_code for response in responses] == company_codes
+
+
+def test_not_found_company_code_is_not_looked_up_again(monkeypatch):
+    fake_polygon = FakePolygon(unknown_symbols=("NOPE",))
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+    monkeypatch.setattr(StockController, "start_market_watch", lambda self: Future())
+
+    try:
+        for _ in range(3):
+            with pytest.raises(NotFound):
+                StockController("nope", None).get_new_stock()
+    finally:
+        fake_polygon.stop()
+
+    assert len(fake_polygon.requests) == len(polygon_open_close_days())
+
+
+def test_polygon_lookup_steps_back_past_market_holidays(monkeypatch):
+    holiday = polygon_open_close_date()
+    fake_polygon = FakePolygon(holidays=(holiday,))
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+    monkeypatch.setattr(settings, "POLYGON_HOLIDAY_MIN_SYMBOLS", 2)
+
+    try:
+        polygon_data = StockController("holiday", None).get_stock_from_polygon()
+        # a single symbol without data may be halted, the day is still requested
+        assert polygon_open_close_date() == holiday
+        polygon_data = asyncio.run(AsyncStockController("holidaz", None).get_stock_from_polygon())
+        assert polygon_open_close_date() != holiday
+        # confirmed by two symbols, the holiday is not requested again
+        StockController("holiday", None).get_stock_from_polygon()
+    finally:
+        non_trading_day_symbols.invalidate(holiday)
+        fake_polygon.stop()
+
+    assert polygon_data.from_ == polygon_open_close_days()[1]
+    assert not_found_cache.get("HOLIDAY") is None
+    assert [path.rsplit("/", 1)[1] for path in fake_polygon.requests].count(holiday) == 2
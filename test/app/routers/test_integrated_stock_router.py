@@ -1,23 +1,57 @@
-from datetime import datetime
+from concurrent.futures import Future
+from datetime import date, datetime, timezone
+import os
+import tempfile
+import threading
+import time
+import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
-
+from sqlalchemy.pool import NullPool
+
+from app.controllers.async_stock_controller import AsyncStockController
+from app.controllers.stock_controller import (
+    StockController,
+    not_found_cache,
+    release_revalidation,
+    revalidating_codes,
+    stock_response_cache,
+)
 from app.models.stock_model import *
+from app.schemas.stock_schema import StockModelResponseSchema
 from main import app
-from shared.database import Base
-from shared.dependencies import get_db
+from shared.browser_pool import browser_pool
+from shared.database import Base, get_async_database_url
+from shared.exceptions import ScrapeUnavailable
+from shared import settings
+from shared.polygon_client import polygon_client
+from shared.dependencies import (
+    get_async_db,
+    get_async_sessionmaker,
+    get_db,
+    get_sessionmaker,
+)
+from test.fake_polygon import FakePolygon, fake_bar
 
-SQLALCHEMY_DATABASE_URL = "sqlite://"
+# file based so the sync and the asyncio engines see the same data
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stocks.db')}"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# every TestClient request runs on its own event loop, connections can't be pooled
+async_engine = create_async_engine(
+    get_async_database_url(SQLALCHEMY_DATABASE_URL), poolclass=NullPool
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, bind=async_engine
+)
+
 
 Base.metadata.drop_all(bind=engine)
 Base.metadata.create_all(bind=engine)
@@ -31,7 +65,15 @@ def override_get_db():
         db.close()
 
 
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
+app.dependency_overrides[get_sessionmaker] = lambda: TestingSessionLocal
+app.dependency_overrides[get_async_sessionmaker] = lambda: TestingAsyncSessionLocal
 
 client = TestClient(app)
 
@@ -54,8 +96,8 @@ def populate_db():
     )
     db.add(performance_data)
 
-    market_cap = MarketCap(**{"currency": "$2.97T", "value": -0.30})
-    db.add(market_cap)
+    company = Company(**{"name": "Microsoft Corp."})
+    db.add(company)
 
     stock = Stock(
         **{
@@ -67,12 +109,18 @@ def populate_db():
             "company_name": "Apple Inc.",
             "stock_values_id": 1,
             "performance_data_id": 1,
+            "fetched_at": datetime.now(timezone.utc),
         }
     )
     db.add(stock)
 
     competitor = Competitor(
-        **{"name": "Microsoft Corp.", "stock_id": 1, "market_cap_id": 1}
+        **{
+            "stock_id": 1,
+            "company_id": 1,
+            "market_cap_currency": "$2.97T",
+            "market_cap_value": -0.30,
+        }
     )
     db.add(competitor)
 
@@ -113,12 +161,80 @@ def test_get_stock_data():
     }
 
 
-def test_get_non_existent_stock_data_error():
-    response = client.get("/stock/xxxxx")
+def test_get_stock_data_loads_aggregate_in_one_statement():
+    stock_response_cache.clear()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for curr_engine in [engine, async_engine.sync_engine]:
+        event.listen(curr_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.get("/stock/AAPL")
+    finally:
+        for curr_engine in [engine, async_engine.sync_engine]:
+            event.remove(curr_engine, "before_cursor_execute", before_cursor_execute)
+
+    assert response.status_code == 200
+    assert len(statements) <= 1
+
+
+def test_get_non_existent_stock_data_error(monkeypatch):
+    fake_polygon = FakePolygon(unknown_symbols=("XXXXX",))
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+    not_found_cache.invalidate("XXXXX")
+    try:
+        response = client.get("/stock/xxxxx")
+    finally:
+        fake_polygon.stop()
 
     assert response.status_code == 404
 
     assert response.json() == {"message": "xxxxx not found."}
+    assert fake_polygon.requests
+
+
+def test_get_stock_data_polygon_unavailable_error(monkeypatch):
+    fake_polygon = FakePolygon()
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+    monkeypatch.setattr(polygon_client, "max_retries", 1)
+    fake_polygon.fail_next(429, times=2, retry_after="0.2")
+    try:
+        response = client.get("/stock/BUSY")
+    finally:
+        fake_polygon.stop()
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert response.json() == {"message": "Polygon api is unavailable, try again later."}
+    assert len(fake_polygon.requests) == 2
+
+
+def test_get_stock_data_scrape_unavailable_error(monkeypatch):
+    def reject(job):
+        future = Future()
+        future.set_exception(ScrapeUnavailable(2.5))
+        return future
+
+    async def reject_async(job):
+        raise ScrapeUnavailable(2.5)
+
+    fake_polygon = FakePolygon()
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+    monkeypatch.setattr(settings, "MARKET_WATCH_SCRAP_MODE", "browser")
+    monkeypatch.setattr(browser_pool, "submit", reject)
+    monkeypatch.setattr(browser_pool, "run_async", reject_async)
+    try:
+        response = client.get("/stock/QUEUED")
+    finally:
+        fake_polygon.stop()
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert response.json() == {"message": "MarketWatch scrap is saturated, try again later."}
+    # a saturated pool doesn't make the stock not found
+    assert not_found_cache.get("QUEUED") is None
 
 
 def test_update_stock_amount():
@@ -149,3 +265,319 @@ def test_update_non_existent_stock_amount_error():
     assert response.status_code == 412
 
     assert response.json() == {"message": "Precondition failed, xxxxx is not valid."}
+
+
+def test_update_stock_amount_lower_case_symbol():
+    response = client.post("/stock/aapl", json={"amount": 1})
+
+    assert response.status_code == 201
+
+
+def test_update_stock_amount_wildcard_symbol_error():
+    response = client.post("/stock/AAP_", json={"amount": 1})
+
+    assert response.status_code == 412
+
+    assert response.json() == {"message": "Precondition failed, AAP_ is not valid."}
+
+
+def test_get_stock_data_cached_until_updated():
+    client.get("/stock/AAPL")
+    hits = stock_response_cache.hits
+    purchased_amount = client.get("/stock/AAPL").json()["purchased_amount"]
+
+    assert stock_response_cache.hits == hits + 1
+
+    client.post("/stock/AAPL", json={"amount": 2})
+
+    assert client.get("/stock/aapl").json()["purchased_amount"] == purchased_amount + 2
+
+
+def test_get_stock_data_serializes_cached_model():
+    client.get("/stock/AAPL")
+    response = client.get("/stock/AAPL")
+
+    assert response.headers["content-type"] == "application/json"
+    assert response.content == stock_response_cache.get("AAPL").model_dump_json().encode()
+    assert "fetched_at" not in response.json()
+
+
+def test_get_stock_data_not_modified():
+    etag = client.get("/stock/AAPL").headers["ETag"]
+    stock_response_cache.clear()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for curr_engine in [engine, async_engine.sync_engine]:
+        event.listen(curr_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.get("/stock/AAPL", headers={"If-None-Match": etag})
+    finally:
+        for curr_engine in [engine, async_engine.sync_engine]:
+            event.remove(curr_engine, "before_cursor_execute", before_cursor_execute)
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    # only the version columns are read
+    assert len(statements) == 1
+    assert "competitor_table" not in statements[0]
+
+    response = client.get("/stock/AAPL", headers={"If-None-Match": f'W/{etag}, "0"'})
+
+    assert response.status_code == 304
+
+
+def test_get_stock_data_modified_after_update():
+    etag = client.get("/stock/AAPL").headers["ETag"]
+    client.post("/stock/AAPL", json={"amount": 1})
+
+    response = client.get("/stock/AAPL", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert "Last-Modified" in response.headers
+    assert client.get(
+        "/stock/AAPL", headers={"If-None-Match": response.headers["ETag"]}
+    ).status_code == 304
+
+
+def test_get_cache_stats():
+    response = client.get("/cache/stats")
+
+    assert response.status_code == 200
+
+    assert set(response.json()["stock_response"]) == {
+        "hits",
+        "misses",
+        "evictions",
+        "entries",
+        "max_entries",
+        "ttl",
+    }
+
+
+def test_get_metrics():
+    client.get("/stock/AAPL")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'cache_hits_total{cache="stock_response"}' in response.text
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="/stock/{stock_symbol}",status="200"}'
+        in response.text
+    )
+    assert "stock_stage_duration_seconds_bucket" in response.text
+
+
+def test_get_stocks_data_partial_failure():
+    response = client.get("/stock?symbols=aapl,xxxxx,AAPL")
+
+    assert response.status_code == 200
+
+    assert list(response.json()["stocks"]) == ["AAPL"]
+    assert response.json()["stocks"]["AAPL"]["company_name"] == "Apple Inc."
+    assert list(response.json()["errors"]) == ["XXXXX"]
+
+
+def test_get_stocks_data_too_many_symbols_error():
+    symbols = ",".join(f"S{index}" for index in range(1000))
+    response = client.get(f"/stock?symbols={symbols}")
+
+    assert response.status_code == 422
+
+
+def test_update_stocks_amount():
+    purchased_amount = client.get("/stock/AAPL").json()["purchased_amount"]
+    response = client.post("/stock", json={"amounts": {"AAPL": 2, "aapl": 1}})
+
+    assert response.status_code == 201
+
+    assert response.json() == {"purchased_amounts": {"AAPL": purchased_amount + 3}}
+    assert client.get("/stock/AAPL").json()["purchased_amount"] == purchased_amount + 3
+
+
+def test_update_stocks_amount_rolls_back_on_error():
+    purchased_amount = client.get("/stock/AAPL").json()["purchased_amount"]
+    response = client.post("/stock", json={"amounts": {"AAPL": 1, "xxxxx": 1}})
+
+    assert response.status_code == 412
+
+    assert response.json() == {"message": "Precondition failed, xxxxx is not valid."}
+    assert client.get("/stock/AAPL").json()["purchased_amount"] == purchased_amount
+
+
+def patch_get_new_stock(monkeypatch, close: float) -> None:
+    stock_response = StockModelResponseSchema(**client.get("/stock/AAPL").json())
+    stock_response.stock_values.close = close
+    stock_response.purchased_amount = 0
+
+    def get_new_stock(self):
+        return stock_response.model_copy(update={"fetched_at": datetime.now(timezone.utc)})
+
+    async def get_new_stock_async(self):
+        return get_new_stock(self)
+
+    monkeypatch.setattr(StockController, "get_new_stock", get_new_stock)
+    monkeypatch.setattr(AsyncStockController, "get_new_stock", get_new_stock_async)
+
+
+def disable_revalidation(monkeypatch) -> None:
+    """Stops queuing background re-fetches and waits for the queued ones to finish, so they
+    don't race the test writes"""
+    monkeypatch.setattr(StockController, "revalidate_in_background", lambda self: None)
+    monkeypatch.setattr(AsyncStockController, "revalidate_in_background", lambda self: None)
+    deadline = time.monotonic() + 5
+    while revalidating_codes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not revalidating_codes
+
+
+def test_get_stock_data_fresh_cache_headers():
+    response = client.get("/stock/AAPL")
+
+    assert response.status_code == 200
+
+    assert response.headers["X-Cache"] == "HIT"
+    assert int(response.headers["Age"]) >= 0
+
+
+def test_get_stock_data_stale_served_while_revalidating(monkeypatch):
+    # the re-fetch itself is covered by the no-cache test, a TestClient request closes its
+    # event loop when it returns so a real background write could be left half done
+    revalidated = threading.Event()
+
+    def revalidate(self, bind):
+        release_revalidation(self.normalized_code)
+        revalidated.set()
+
+    async def revalidate_async(self, bind):
+        revalidate(self, bind)
+
+    monkeypatch.setattr(StockController, "revalidate", revalidate)
+    monkeypatch.setattr(AsyncStockController, "revalidate", revalidate_async)
+    close = client.get("/stock/AAPL").json()["stock_values"]["close"]
+    response = client.get("/stock/AAPL", headers={"Cache-Control": "max-age=0"})
+
+    assert response.status_code == 200
+
+    assert response.headers["X-Cache"] == "STALE"
+    assert response.json()["stock_values"]["close"] == close
+    assert revalidated.wait(timeout=5)
+
+
+def test_get_stock_data_no_cache_refetches(monkeypatch):
+    disable_revalidation(monkeypatch)
+    purchased_amount = client.get("/stock/AAPL").json()["purchased_amount"]
+    patch_get_new_stock(monkeypatch, 210.5)
+    response = client.get("/stock/AAPL", headers={"Cache-Control": "no-cache"})
+
+    assert response.status_code == 200
+
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json()["stock_values"]["close"] == 210.5
+    assert response.json()["purchased_amount"] == purchased_amount
+    assert client.get("/stock/AAPL").json()["stock_values"]["close"] == 210.5
+
+
+def test_get_stock_history(monkeypatch):
+    fake_polygon = FakePolygon(page_size=20)
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+    monkeypatch.setattr(settings, "HISTORY_PAGE_SIZE", 7)
+    try:
+        response = client.get("/stock/aapl/history?from=2024-01-01&to=2024-02-29")
+        history_requests = len(fake_polygon.requests)
+
+        assert response.status_code == 200
+
+        days = [row["date"] for row in response.json()]
+        assert len(days) == 44
+        assert days[0] == "2024-01-01" and days[-1] == "2024-02-29"
+        assert days == sorted(days)
+        assert response.json()[0] == {
+            "date": "2024-01-01",
+            "open": fake_bar(date(2024, 1, 1))["o"],
+            "high": fake_bar(date(2024, 1, 1))["h"],
+            "low": fake_bar(date(2024, 1, 1))["l"],
+            "close": fake_bar(date(2024, 1, 1))["c"],
+            "volume": int(fake_bar(date(2024, 1, 1))["v"]),
+        }
+        assert history_requests == 3
+
+        response = client.get("/stock/AAPL/history?from=2024-02-01&to=2024-03-08")
+
+        assert [row["date"] for row in response.json()][-1] == "2024-03-08"
+        assert len(fake_polygon.requests) == history_requests + 1
+        assert "/2024-03-01/2024-03-08" in fake_polygon.requests[-1]
+    finally:
+        fake_polygon.stop()
+
+
+def test_get_non_existent_stock_history_error():
+    response = client.get("/stock/xxxxx/history?from=2024-01-01&to=2024-02-29")
+
+    assert response.status_code == 404
+
+    assert response.json() == {"message": "xxxxx not found."}
+
+
+def test_get_stock_analytics(monkeypatch):
+    fake_polygon = FakePolygon(page_size=1000)
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+    monkeypatch.setattr(settings, "POLYGON_OPEN_CLOSE_DATE", "2024-08-09")
+    try:
+        response = client.get("/stock/aapl/analytics?windows=5,20")
+    finally:
+        fake_polygon.stop()
+
+    assert response.status_code == 200
+
+    analytics = response.json()
+    closes = [fake_bar(date(2024, 8, day))["c"] for day in [5, 6, 7, 8, 9]]
+    assert analytics["date"] == "2024-08-09"
+    assert analytics["close"] == closes[-1]
+    assert analytics["moving_averages"]["5"] == pytest.approx(sum(closes) / 5, abs=1e-4)
+    assert set(analytics["returns"]) == {"5", "20"}
+    assert analytics["performance_data"]["one_year"] is not None
+
+
+def test_get_stocks_analytics_partial_failure(monkeypatch):
+    monkeypatch.setattr(settings, "POLYGON_OPEN_CLOSE_DATE", "2024-08-09")
+    response = client.get("/stock/analytics?symbols=AAPL,xxxxx&windows=5")
+
+    assert response.status_code == 200
+
+    assert list(response.json()["stocks"]) == ["AAPL"]
+    assert response.json()["errors"] == {"XXXXX": "xxxxx not found."}
+
+
+def test_get_stock_analytics_invalid_windows_error():
+    response = client.get("/stock/AAPL/analytics?windows=5,a")
+
+    assert response.status_code == 422
+
+
+def test_get_stock_analytics_too_large_windows_error():
+    response = client.get(f"/stock/AAPL/analytics?windows=5,{settings.ANALYTICS_MAX_WINDOW + 1}")
+
+    assert response.status_code == 422
+    assert response.json() == {
+        "message": f"Invalid windows, at most {settings.ANALYTICS_MAX_WINDOWS} windows "
+        f"of at most {settings.ANALYTICS_MAX_WINDOW} trading days."
+    }
+
+    response = client.get(
+        f"/stock/analytics?symbols=AAPL&windows={'5,' * settings.ANALYTICS_MAX_WINDOWS}5"
+    )
+
+    assert response.status_code == 422
+
+
+def test_get_stock_analytics_blank_symbol_error():
+    response = client.get("/stock/%20/analytics")
+
+    assert response.status_code == 404
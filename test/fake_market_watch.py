@@ -0,0 +1,65 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "market_watch")
+
+
+def read_fixture(name: str) -> str:
+    """Saved marketwatch page of test/fixtures/market_watch"""
+    with open(os.path.join(FIXTURES_PATH, name), encoding="utf-8") as fixture:
+        return fixture.read()
+
+
+class FakeMarketWatch:
+    def __init__(self, pages: Dict[str, Tuple[int, str]], default: Tuple[int, str] = (404, "")):
+        """Local marketwatch serving /investing/stock/{company_code} pages
+
+        Args:
+            pages (Dict[str, Tuple[int, str]]): status code and html by company code
+            default (Tuple[int, str], optional): answer of the other company codes. Defaults to a 404.
+        """
+        self.pages = pages
+        self.default = default
+        self.requests: list[str] = []
+        fake_market_watch = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keeps the connection open like marketwatch does
+            protocol_version = "HTTP/1.1"
+            # headers and body are sent apart, don't wait for the client ack in between
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                fake_market_watch.requests.append(self.path)
+                company_code = self.path.rsplit("/", 1)[-1]
+                status, html = fake_market_watch.pages.get(
+                    company_code, fake_market_watch.default
+                )
+                content = html.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> str:
+        """Serves in background
+
+        Returns:
+            str: base url
+        """
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self) -> None:
+        """Stops serving"""
+        self.server.shutdown()
+        self.server.server_close()
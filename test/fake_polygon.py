@@ -0,0 +1,132 @@
+import json
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def fake_bar(day: date) -> dict:
+    """Deterministic daily bar of a day"""
+    base = 100 + day.toordinal() % 50
+    return {
+        "t": int(datetime.combine(day, time(4), tzinfo=timezone.utc).timestamp() * 1000),
+        "o": base + 0.5,
+        "h": base + 2.0,
+        "l": base - 1.0,
+        "c": base + 1.0,
+        "v": 1000.0 * (day.toordinal() % 7 + 1),
+    }
+
+
+def fake_open_close(symbol: str, day: str) -> dict:
+    """Deterministic /open-close answer of a symbol on a day"""
+    bar = fake_bar(date.fromisoformat(day))
+    return {
+        "status": "OK",
+        "from": day,
+        "symbol": symbol,
+        "open": bar["o"],
+        "high": bar["h"],
+        "low": bar["l"],
+        "close": bar["c"],
+        "volume": bar["v"],
+        "afterHours": bar["c"],
+        "preMarket": bar["o"],
+    }
+
+
+class FakePolygon:
+    def __init__(self, page_size: int = 100, unknown_symbols: tuple = (), holidays: tuple = ()):
+        """Local polygon api serving daily open-close data (/v1/open-close/...) and weekday
+        aggregates (/v2/aggs/ticker/...) in pages of page_size bars
+
+        Args:
+            page_size (int, optional): bars per page. Defaults to 100.
+            unknown_symbols (tuple, optional): symbols answered 404. Defaults to ().
+            holidays (tuple, optional): days ("%Y-%m-%d") answered 404 by /open-close. Defaults to ().
+        """
+        self.page_size = page_size
+        self.unknown_symbols = set(unknown_symbols)
+        self.holidays = set(holidays)
+        self.requests: list[str] = []
+        self.failures: list[tuple[int, dict, dict]] = []
+        self._lock = threading.Lock()
+        fake_polygon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with fake_polygon._lock:
+                    fake_polygon.requests.append(self.path)
+                    failure = fake_polygon.failures.pop(0) if fake_polygon.failures else None
+                if failure is not None:
+                    self.send_json(*failure)
+                    return
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")
+                if parts[:2] == ["v1", "open-close"] and len(parts) == 4:
+                    if parts[2] in fake_polygon.unknown_symbols or parts[3] in fake_polygon.holidays:
+                        self.send_json(404, {"status": "NOT_FOUND"})
+                    else:
+                        self.send_json(200, fake_open_close(parts[2], parts[3]))
+                    return
+                if parts[:3] != ["v2", "aggs", "ticker"] or len(parts) != 9:
+                    self.send_json(404, {"status": "NOT_FOUND"})
+                    return
+                day, last_day = date.fromisoformat(parts[7]), date.fromisoformat(parts[8])
+                bars = []
+                while day <= last_day:
+                    if day.weekday() < 5:
+                        bars.append(fake_bar(day))
+                    day += timedelta(days=1)
+                cursor = int(parse_qs(url.query).get("cursor", ["0"])[0])
+                body = {"results": bars[cursor : cursor + fake_polygon.page_size]}
+                if cursor + fake_polygon.page_size < len(bars):
+                    body["next_url"] = (
+                        f"{fake_polygon.base_url}{url.path}?cursor={cursor + fake_polygon.page_size}"
+                    )
+                self.send_json(200, body)
+
+            def send_json(self, status: int, body: dict, headers: dict | None = None):
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def fail_next(self, status: int, times: int = 1, retry_after: str | None = None) -> None:
+        """Answers the next requests with an error, whatever they ask for
+
+        Args:
+            status (int): http status code. E.g.: 429
+            times (int, optional): number of requests failed. Defaults to 1.
+            retry_after (str | None, optional): Retry-After header. Defaults to None.
+        """
+        headers = {} if retry_after is None else {"Retry-After": retry_after}
+        with self._lock:
+            self.failures += [(status, {"status": "ERROR"}, headers)] * times
+
+    def start(self) -> str:
+        """Serves in background
+
+        Returns:
+            str: base url
+        """
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self) -> None:
+        """Stops serving"""
+        self.server.shutdown()
+        self.server.server_close()
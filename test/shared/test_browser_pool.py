@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+from shared import browser_pool as browser_pool_module
+from shared.browser_pool import BrowserPool
+from shared.exceptions import ScrapeUnavailable
+
+
+class FakeContext:
+    async def add_init_script(self, script):
+        pass
+
+    async def new_page(self):
+        return "page"
+
+    async def close(self):
+        pass
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.closed = False
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self, user_agent):
+        return FakeContext()
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeChromium:
+    def __init__(self):
+        self.browsers = []
+
+    async def launch(self, headless):
+        self.browsers.append(FakeBrowser())
+        return self.browsers[-1]
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.chromium = FakeChromium()
+
+
+def build_fake_pool(max_uses: int) -> BrowserPool:
+    pool = BrowserPool(max_pages=2, max_uses=max_uses, headless=True)
+    pool._playwright = FakePlaywright()
+    pool._launch_lock = asyncio.Lock()
+    pool._semaphore = asyncio.Semaphore(pool.max_pages)
+    return pool
+
+
+def test_browser_pool_recycles_browser_after_max_uses():
+    pool = build_fake_pool(max_uses=2)
+
+    async def job(page):
+        return page
+
+    async def run_jobs():
+        for _ in range(5):
+            assert await pool._run(job) == "page"
+
+    asyncio.run(run_jobs())
+    browsers = pool._playwright.chromium.browsers
+
+    # 2 jobs per browser, the ones recycled are closed
+    assert len(browsers) == 3
+    assert [browser.closed for browser in browsers] == [True, True, False]
+    assert pool._retired == []
+
+
+def test_browser_pool_relaunches_disconnected_browser():
+    pool = build_fake_pool(max_uses=10)
+
+    async def run_jobs():
+        release = asyncio.Event()
+
+        async def hold_page(page):
+            await release.wait()
+
+        holding = asyncio.create_task(pool._run(hold_page))
+        await asyncio.sleep(0.01)
+        crashed = pool._current.browser
+        crashed.connected = False
+
+        # the crashed browser is replaced, and kept open until its running job finishes
+        await pool._run(lambda page: asyncio.sleep(0))
+        assert pool._current.browser is not crashed
+        assert not crashed.closed
+        assert len(pool._retired) == 1
+
+        release.set()
+        await holding
+        assert crashed.closed
+        assert pool._retired == []
+
+    asyncio.run(run_jobs())
+
+
+def test_browser_pool_cancels_jobs_past_deadline():
+    pool = build_fake_pool(max_uses=10)
+    pool.deadline = 0.1
+
+    async def run_jobs():
+        with pytest.raises(ScrapeUnavailable):
+            await pool._run_until_deadline(lambda page: asyncio.sleep(10))
+        # the page is freed for the next jobs
+        assert pool._current.active == 0
+        assert await pool._run_until_deadline(lambda page: asyncio.sleep(0, page)) == "page"
+
+    asyncio.run(run_jobs())
+    assert pool._semaphore._value == pool.max_pages
+
+
+def test_browser_pool_rejects_jobs_beyond_queue():
+    pool = BrowserPool(max_pages=1, max_uses=10, headless=True, max_queue=1, queue_timeout=0.2)
+
+    async def admit():
+        pool._semaphore = asyncio.Semaphore(1)
+        release = asyncio.Event()
+
+        async def hold_page():
+            async with pool._page_slot():
+                await release.wait()
+
+        async def wait_page():
+            async with pool._page_slot():
+                pass
+
+        holding = asyncio.create_task(hold_page())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(wait_page())
+        await asyncio.sleep(0)
+
+        # the queue is full, the third job is rejected right away
+        with pytest.raises(ScrapeUnavailable) as error:
+            await wait_page()
+        assert error.value.retry_after >= 1
+
+        # the queued job gives up after queue_timeout
+        with pytest.raises(ScrapeUnavailable):
+            await waiting
+
+        release.set()
+        await holding
+        # a free page is handed out again
+        await asyncio.wait_for(wait_page(), 1)
+        assert pool._waiting == 0
+
+    asyncio.run(admit())
+
+
+def test_browser_pool_falls_back_to_headless_without_xvfb(monkeypatch):
+    class BrokenXvfb:
+        def __init__(self):
+            raise OSError("Can not find Xvfb. Please install it and try again.")
+
+    monkeypatch.setattr(browser_pool_module.sys, "platform", "linux")
+    monkeypatch.setattr(browser_pool_module, "Xvfb", BrokenXvfb, raising=False)
+    pool = BrowserPool(max_pages=1, max_uses=10)
+    pool.start()
+    try:
+        assert pool.headless
+        assert pool._display is None
+    finally:
+        pool.stop()
@@ -0,0 +1,63 @@
+import time
+
+from shared.cache import SqliteCache, TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("AAPL", 1)
+    cache.set("MSFT", 2)
+    cache.get("AAPL")
+    cache.set("GOOG", 3)
+
+    assert cache.get("MSFT") is None
+    assert cache.get("AAPL") == 1
+    assert cache.get("GOOG") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(max_entries=2, ttl=0.01)
+    cache.set("AAPL", 1)
+    time.sleep(0.02)
+
+    assert cache.get("AAPL") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_ttl_cache_counts_hits_and_misses():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("AAPL", 1)
+    cache.get("AAPL")
+    cache.get("MSFT")
+    cache.invalidate("AAPL")
+    cache.get("AAPL")
+
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = SqliteCache(path, "scrap", max_entries=2, ttl=60)
+    cache.set("AAPL", {"company_name": "Apple Inc."})
+
+    assert SqliteCache(path, "scrap", max_entries=2, ttl=60).get("AAPL") == {
+        "company_name": "Apple Inc."
+    }
+    assert SqliteCache(path, "not_found", max_entries=2, ttl=60).get("AAPL") is None
+
+
+def test_sqlite_cache_evicts_and_expires(tmp_path):
+    cache = SqliteCache(str(tmp_path / "cache.sqlite"), "scrap", max_entries=2, ttl=60)
+    cache.set("AAPL", 1)
+    cache.set("MSFT", 2, ttl=0.01)
+    time.sleep(0.02)
+    cache.set("GOOG", 3)
+    cache.set("AMZN", 4)
+
+    assert cache.get("MSFT") is None
+    assert cache.get("AAPL") is None
+    assert cache.get("AMZN") == 4
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,37 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+from shared.freshness import FreshnessPolicy
+
+
+def test_freshness_policy_cache_status():
+    policy = FreshnessPolicy(fresh_for=60, stale_for=600)
+    now = datetime.now(timezone.utc)
+
+    assert policy.cache_status(now) == "HIT"
+    assert policy.cache_status(now - timedelta(seconds=120)) == "STALE"
+    assert policy.cache_status(now - timedelta(seconds=700)) == "MISS"
+    assert policy.cache_status(None) == "STALE"
+
+
+def test_freshness_policy_naive_datetimes_are_utc():
+    policy = FreshnessPolicy(fresh_for=60, stale_for=600)
+    fetched_at = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=10)
+
+    assert 10 <= policy.age(fetched_at) < 20
+
+
+def test_freshness_policy_from_cache_control():
+    default = FreshnessPolicy(fresh_for=60, stale_for=600)
+
+    policy = FreshnessPolicy.from_cache_control("max-age=5, max-stale=10", default)
+    assert (policy.fresh_for, policy.stale_for) == (5, 10)
+
+    policy = FreshnessPolicy.from_cache_control("max-stale", default)
+    assert (policy.fresh_for, policy.stale_for) == (60, math.inf)
+
+    policy = FreshnessPolicy.from_cache_control("no-cache", default)
+    assert (policy.fresh_for, policy.stale_for) == (0, 0)
+
+    policy = FreshnessPolicy.from_cache_control(None, default)
+    assert (policy.fresh_for, policy.stale_for) == (60, 600)
@@ -0,0 +1,19 @@
+from shared.hit_counter import HitCounter
+
+
+def test_hit_counter_ranks_most_requested_first():
+    hits = HitCounter(max_keys=10)
+    for key in ["AAPL", "MSFT", "MSFT", "GOOG", "MSFT", "GOOG"]:
+        hits.hit(key)
+
+    assert hits.most_common(2) == ["MSFT", "GOOG"]
+
+
+def test_hit_counter_decay_forgets_old_requests():
+    hits = HitCounter(max_keys=10)
+    hits.hit("AAPL")
+    hits.hit("MSFT")
+    hits.hit("MSFT")
+    hits.decay()
+
+    assert hits.most_common(10) == ["MSFT"]
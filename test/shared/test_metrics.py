@@ -0,0 +1,62 @@
+from prometheus_client import CollectorRegistry
+from sqlalchemy import create_engine, text
+
+from shared.cache import TTLCache
+from shared.metrics import (
+    CacheCollector,
+    count_sql_statements,
+    observe_stage,
+    sql_statements,
+    stage_latency,
+)
+
+
+def sample(metric, name: str, labels: dict) -> float:
+    for collected in metric.collect():
+        for each in collected.samples:
+            if each.name == name and each.labels == labels:
+                return each.value
+    return 0
+
+
+def test_observe_stage_also_when_it_raises():
+    count = sample(stage_latency, "stock_stage_duration_seconds_count", {"stage": "test"})
+    with observe_stage("test"):
+        pass
+    try:
+        with observe_stage("test"):
+            raise ValueError()
+    except ValueError:
+        pass
+
+    assert (
+        sample(stage_latency, "stock_stage_duration_seconds_count", {"stage": "test"})
+        == count + 2
+    )
+
+
+def test_count_sql_statements_by_operation():
+    engine = create_engine("sqlite://")
+    count_sql_statements(engine)
+    selects = sample(sql_statements, "sql_statements_total", {"operation": "select"})
+    others = sample(sql_statements, "sql_statements_total", {"operation": "other"})
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER)"))
+        conn.execute(text("select * from t"))
+        conn.execute(text("  SELECT 1"))
+
+    assert sample(sql_statements, "sql_statements_total", {"operation": "select"}) == selects + 2
+    assert sample(sql_statements, "sql_statements_total", {"operation": "other"}) == others + 1
+
+
+def test_cache_collector_reads_cache_stats():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("AAPL", 1)
+    cache.get("AAPL")
+    cache.get("MSFT")
+    registry = CollectorRegistry()
+    registry.register(CacheCollector({"test": cache}))
+
+    assert registry.get_sample_value("cache_hits_total", {"cache": "test"}) == 1
+    assert registry.get_sample_value("cache_misses_total", {"cache": "test"}) == 1
+    assert registry.get_sample_value("cache_entries", {"cache": "test"}) == 1
@@ -0,0 +1,104 @@
+import asyncio
+import math
+import time
+
+import pytest
+
+from shared.cache import TTLCache
+from shared.exceptions import PolygonUnavailable
+from shared.polygon_client import PolygonClient, PolygonError, open_close_ttl
+from shared.rate_limit import TokenBucket
+from shared import settings
+from test.fake_polygon import FakePolygon
+
+
+def build_client(**kwargs) -> PolygonClient:
+    return PolygonClient(
+        TTLCache(max_entries=16, ttl=60), backoff=0.01, max_backoff=0.05, **kwargs
+    )
+
+
+def test_polygon_client_retries_429_and_5xx(monkeypatch):
+    fake_polygon = FakePolygon()
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+    fake_polygon.fail_next(429, retry_after="0")
+    fake_polygon.fail_next(503)
+    try:
+        data = build_client(max_retries=3).get("/v1/open-close/AAPL/2024-08-09")
+    finally:
+        fake_polygon.stop()
+
+    assert data["symbol"] == "AAPL"
+    assert len(fake_polygon.requests) == 3
+
+
+def test_polygon_client_gives_up_after_max_retries(monkeypatch):
+    fake_polygon = FakePolygon()
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+    fake_polygon.fail_next(502, times=5)
+    try:
+        with pytest.raises(PolygonUnavailable):
+            build_client(max_retries=2).get("/v1/open-close/AAPL/2024-08-09")
+    finally:
+        fake_polygon.stop()
+
+    assert len(fake_polygon.requests) == 3
+
+
+def test_polygon_client_does_not_retry_404(monkeypatch):
+    fake_polygon = FakePolygon(unknown_symbols=("NOPE",))
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+    try:
+        with pytest.raises(PolygonError) as error:
+            build_client(max_retries=3).get("/v1/open-close/NOPE/2024-08-09")
+    finally:
+        fake_polygon.stop()
+
+    assert error.value.status_code == 404
+    assert len(fake_polygon.requests) == 1
+
+
+def test_polygon_client_caches_past_days(monkeypatch):
+    fake_polygon = FakePolygon()
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+    client = build_client()
+    try:
+        for _ in range(3):
+            client.get("/v1/open-close/AAPL/2024-08-09", ttl=open_close_ttl("2024-08-09"))
+        asyncio.run(
+            client.get_async("/v1/open-close/AAPL/2024-08-09", ttl=open_close_ttl("2024-08-09"))
+        )
+        client.get("/v1/open-close/AAPL/2024-08-08")
+        client.get("/v1/open-close/AAPL/2024-08-08")
+    finally:
+        fake_polygon.stop()
+
+    assert open_close_ttl("2024-08-09") == math.inf
+    assert len(fake_polygon.requests) == 3
+
+
+def test_async_polygon_client_retries_and_rate_limits(monkeypatch):
+    fake_polygon = FakePolygon()
+    monkeypatch.setattr(settings, "POLYGON_BASE_URL", fake_polygon.start())
+    fake_polygon.fail_next(500)
+    rate_limit = TokenBucket(rate=20, capacity=1)
+    client = build_client(rate_limit=rate_limit)
+
+    async def get_stocks():
+        try:
+            return await asyncio.gather(
+                *[client.get_async(f"/v1/open-close/{code}/2024-08-09") for code in "ABC"]
+            )
+        finally:
+            await client.aclose()
+
+    started_at = time.monotonic()
+    try:
+        responses = asyncio.run(get_stocks())
+    finally:
+        fake_polygon.stop()
+
+    assert sorted(response["symbol"] for response in responses) == ["A", "B", "C"]
+    # 3 requests and a retry, a token each, 20 tokens per second
+    assert len(fake_polygon.requests) == 4
+    assert time.monotonic() - started_at >= 0.15
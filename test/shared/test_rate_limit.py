@@ -0,0 +1,27 @@
+import time
+
+from shared.rate_limit import TokenBucket
+
+
+def test_token_bucket_allows_bursts_up_to_capacity():
+    bucket = TokenBucket(rate=1, capacity=2)
+
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() > 0
+
+
+def test_token_bucket_acquire_waits_for_a_token():
+    bucket = TokenBucket(rate=50, capacity=1)
+    bucket.acquire()
+    started_at = time.monotonic()
+
+    assert bucket.acquire(timeout=1)
+    assert time.monotonic() - started_at >= 0.01
+
+
+def test_token_bucket_acquire_times_out():
+    bucket = TokenBucket(rate=0.1, capacity=1)
+    bucket.acquire()
+
+    assert not bucket.acquire(timeout=0.01)
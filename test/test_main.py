@@ -0,0 +1,15 @@
+from fastapi.testclient import TestClient
+
+from main import app
+from shared.browser_pool import browser_pool
+
+
+def test_app_starts_when_browser_pool_fails(monkeypatch):
+    def start():
+        raise RuntimeError("chromium is not installed")
+
+    monkeypatch.setattr(browser_pool, "start", start)
+    with TestClient(app) as client:
+        response = client.get("/cache/stats")
+
+    assert response.status_code == 200